@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the EngineClock time trigger paths, on tables of cron-style TimeSpecs.
+
+Each path runs the clock tick of every minute of a simulated hour:
+- croniter: the timeline, rescheduling each fired TimeSpec with croniter
+- compiled: the timeline, rescheduling each fired TimeSpec with its compiled schedule
+- cron_table: the cron table mode, matching every compiled TimeSpec at once
+
+A tick includes creating the task of every fired action, common to the three paths.
+
+The TimeSpecs are a seeded mix of the schedules rules use: every few minutes, hourly,
+daily at a time, and weekdays at a time.
+
+Usage:
+    python benchmarks/bench_cron.py [--triggers 100,1000,10000] [--minutes 60]
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ottoengine.fibers import clock  # noqa: E402
+
+TZ = "America/Los_Angeles"
+START = datetime.datetime(2018, 5, 7, 14, 0, 30, tzinfo=datetime.timezone.utc)
+
+PATHS = ["croniter", "compiled", "cron_table"]
+
+
+def make_specs(num_triggers: int, seed: int = 1) -> list:
+    """Returns num_triggers TimeSpec dicts"""
+    rand = random.Random(seed)
+    specs = []
+    for _ in range(num_triggers):
+        kind = rand.random()
+        if kind < 0.2:
+            spec = {"minute": "*/{}".format(rand.choice([1, 2, 5, 10, 15, 30]))}
+        elif kind < 0.4:
+            spec = {"minute": rand.randrange(60)}
+        elif kind < 0.8:
+            spec = {"minute": rand.choice([0, 15, 30, 45]), "hour": rand.randrange(24)}
+        else:
+            spec = {"minute": rand.randrange(60), "hour": rand.randrange(24),
+                    "weekdays": rand.choice(["1-5", "0,6", "5,6,7"])}
+        spec["tz"] = TZ
+        specs.append(spec)
+    return specs
+
+
+def run_path(path: str, specs: list, minutes: int) -> tuple:
+    """Returns (mean tick us, max tick us, fired count, setup ms) of the path"""
+    loop = asyncio.new_event_loop()
+    mode = clock.MODE_CRON_TABLE if path == "cron_table" else clock.MODE_TIMELINE
+    engine_clock = clock.EngineClock(TZ, loop=loop, mode=mode)
+    fired = [0]
+
+    async def _action():
+        fired[0] += 1
+
+    setup_start = time.perf_counter()
+    for i, spec_dict in enumerate(specs):
+        spec = clock.TimeSpec.from_dict(spec_dict)
+        if path == "croniter":
+            spec._schedule = None   # Forces the croniter fallback
+        engine_clock.add_timespec_action(i, _action, spec, START)
+    setup_ms = (time.perf_counter() - setup_start) * 1000
+
+    async def _async_tick(utcnow):
+        tick_start = time.perf_counter()
+        await engine_clock._async_tick(utcnow)
+        return time.perf_counter() - tick_start
+
+    ticks = []
+    for minute in range(1, minutes + 1):
+        utcnow = START + datetime.timedelta(minutes=minute)
+        ticks.append(loop.run_until_complete(_async_tick(utcnow)))
+        loop.run_until_complete(asyncio.sleep(0))   # Runs the actions
+    loop.close()
+    return sum(ticks) / len(ticks) * 1e6, max(ticks) * 1e6, fired[0], setup_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--triggers", default="100,1000,10000",
+                        help="comma separated numbers of time triggers")
+    parser.add_argument("--minutes", type=int, default=60,
+                        help="number of simulated minutes")
+    args = parser.parse_args()
+
+    print("{:>9} {:<11} {:>12} {:>12} {:>8} {:>10}".format(
+        "triggers", "path", "tick us", "max tick us", "fired", "setup ms"))
+    for num_triggers in [int(n) for n in args.triggers.split(",")]:
+        specs = make_specs(num_triggers)
+        for path in PATHS:
+            mean_us, max_us, fired, setup_ms = run_path(path, specs, args.minutes)
+            print("{:>9} {:<11} {:>12.1f} {:>12.1f} {:>8} {:>10.1f}".format(
+                num_triggers, path, mean_us, max_us, fired, setup_ms))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the available JSON codecs on Home Assistant websocket payloads.
+
+The payloads in benchmarks/payloads are the Home Assistant responses recorded in the
+protocol notes of ottoengine/hass_websocket_client.py.  The get_states response is
+also scaled up to --entities entities, to approximate a large install.
+
+Usage:
+    python benchmarks/bench_json_codecs.py [--entities 2000] [--seconds 1.0]
+"""
+import argparse
+import copy
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ottoengine import json_codec  # noqa: E402
+
+PAYLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads")
+
+
+def load_payloads(num_entities: int) -> list:
+    """Returns a list of (name, encoded bytes) for each payload"""
+    codec = json_codec.JsonCodec()
+    payloads = []
+    for filename in sorted(os.listdir(PAYLOAD_DIR)):
+        if filename.endswith(".json"):
+            with open(os.path.join(PAYLOAD_DIR, filename), "rb") as f:
+                msg = codec.decode(f.read())
+            payloads.append((filename[:-5], codec.encode(msg)))
+
+            if filename == "get_states.json":
+                payloads.append(
+                    ("get_states_x{}".format(num_entities),
+                     codec.encode(_scale_states(msg, num_entities))))
+    return payloads
+
+
+def _scale_states(msg: dict, num_entities: int) -> dict:
+    recorded = msg["result"]
+    scaled = copy.deepcopy(msg)
+    scaled["result"] = []
+    for i in range(num_entities):
+        state = copy.deepcopy(recorded[i % len(recorded)])
+        state["entity_id"] = "{}_{}".format(state["entity_id"], i)
+        scaled["result"].append(state)
+    return scaled
+
+
+def bench(func, seconds: float) -> float:
+    """Returns the mean time of one call to func, in microseconds"""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    repeat = max(1, int(seconds / max(elapsed, 1e-9)))
+    best = min(timer.repeat(repeat=min(repeat, 5), number=number))
+    return best / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entities", type=int, default=2000,
+                        help="number of entities in the scaled get_states payload")
+    parser.add_argument("--seconds", type=float, default=1.0,
+                        help="approximate time to spend on each measurement")
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.entities)
+    codecs = json_codec.available_codecs()
+    print("Codecs available: {}".format(", ".join(c.name for c in codecs)))
+    print()
+    print("{:<22} {:>10} {:<8} {:>12} {:>12} {:>10}".format(
+        "payload", "bytes", "codec", "decode us", "encode us", "MB/s dec"))
+
+    for name, raw in payloads:
+        for codec in codecs:
+            msg = codec.decode(raw)
+            decode_us = bench(lambda: codec.decode(raw), args.seconds)
+            encode_us = bench(lambda: codec.encode(msg), args.seconds)
+            print("{:<22} {:>10} {:<8} {:>12.1f} {:>12.1f} {:>10.1f}".format(
+                name, len(raw), codec.name, decode_us, encode_us,
+                len(raw) / decode_us))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import asyncio
+import itertools
+import json
+import logging
+
+from ottoengine.model import dataobjects
+
+_LOG = logging.getLogger(__name__)
+# _LOG.setLevel(logging.DEBUG)
+
+IDEMPOTENT_SERVICES = ["turn_on", "turn_off"]   # Also any set_* service
+NON_IDEMPOTENT_DOMAINS = ["script"]             # script.turn_on runs the script again
+
+
+class ServiceCallCoalescer(object):
+    '''
+    Holds service calls for a short window before sending them to Home Assistant.
+
+    Within a window:
+    - identical calls (domain, service and service_data) are sent once
+    - calls that differ only in their entity_id are merged into one call with a list
+      of entity IDs
+
+    Only idempotent calls are coalesced: turn_on, turn_off and set_* services, outside of
+    NON_IDEMPOTENT_DOMAINS.  Others, like toggle or notify.*, do something each time they
+    are called, so they are held for the window too, to keep their order, but always sent.
+
+    A call is never folded into a pending call across another pending call on one of its
+    entities (turn_on, turn_off, turn_on of a light): the window is sent right away, so
+    Home Assistant gets the calls in order.
+
+    Every caller receives the result of the call that was actually sent.
+    '''
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, async_send_func, window_ms: int):
+        '''
+        async_send_func is a coroutine function that sends a ServiceCall and returns
+        True if Home Assistant accepted it.
+        '''
+        self._loop = loop
+        self._async_send_func = async_send_func
+        self._window_secs = window_ms / 1000
+
+        self._pending = {}  # key -> _PendingCall, for the current window
+        self._entity_keys = {}  # entity_id -> key of the latest pending call on the entity
+        self._flush_handle = None
+        self._seq = itertools.count()   # Keys of the calls that are never coalesced
+
+        self.stats = {
+            "window_ms": window_ms,
+            "received": 0,      # Service calls received from rules
+            "sent": 0,          # Service calls sent to Home Assistant
+            "deduplicated": 0,  # Calls dropped because an identical call was pending
+            "merged": 0,        # Calls whose entity_id was merged into a pending call
+            "saved": 0,         # Calls that were never sent: deduplicated + merged
+            "conflicts": 0,     # Windows sent early, for a call conflicting with a pending one
+        }
+
+    # ~~~~~~~~~~~~~~~~~~~
+    #   Public methods
+    # ~~~~~~~~~~~~~~~~~~~
+
+    async def async_call_service(self, service_call: dataobjects.ServiceCall) -> bool:
+        '''Adds the call to the current window, and returns the result of the call sent'''
+        self.stats["received"] += 1
+        entity_ids = _get_entity_ids(service_call)
+        if _is_idempotent(service_call):
+            key = _get_merge_key(service_call, entity_ids is not None)
+        else:
+            key = next(self._seq)
+
+        if entity_ids is not None and any(
+                self._entity_keys.get(e, key) != key for e in entity_ids):
+            self.stats["conflicts"] += 1
+            self._flush_handle.cancel()
+            self._flush()
+
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = _PendingCall(service_call, self._loop.create_future())
+            self._pending[key] = pending
+        elif entity_ids is None or all(e in pending.entity_ids for e in entity_ids):
+            self.stats["deduplicated"] += 1
+            self.stats["saved"] += 1
+        else:
+            self.stats["merged"] += 1
+            self.stats["saved"] += 1
+
+        if entity_ids is not None:
+            for entity_id in entity_ids:
+                if entity_id not in pending.entity_ids:
+                    pending.entity_ids.append(entity_id)
+                self._entity_keys[entity_id] = key
+
+        if self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(self._window_secs, self._flush)
+
+        # Shield the shared future, so one cancelled caller doesn't cancel the others
+        return await asyncio.shield(pending.future)
+
+    # ~~~~~~~~~~~~~~~~~~~~
+    #   Private methods
+    # ~~~~~~~~~~~~~~~~~~~~
+
+    def _flush(self):
+        for pending in self._take_pending():
+            self._loop.create_task(self._async_send(pending))
+
+    def _take_pending(self) -> list:
+        pending_calls = list(self._pending.values())
+        self._pending = {}
+        self._entity_keys = {}
+        self._flush_handle = None
+        return pending_calls
+
+    async def _async_send(self, pending):
+        service_call = pending.build_call()
+        self.stats["sent"] += 1
+        _LOG.debug("Sending coalesced service call: {}".format(service_call.serialize()))
+        try:
+            result = await self._async_send_func(service_call)
+        except Exception as e:
+            pending.future.set_exception(e)
+        else:
+            pending.future.set_result(result)
+
+
+class _PendingCall(object):
+
+    def __init__(self, service_call: dataobjects.ServiceCall, future: asyncio.Future):
+        self.service_call = service_call
+        self.future = future
+        self.entity_ids = []
+
+    def build_call(self) -> dataobjects.ServiceCall:
+        if not self.entity_ids:
+            return self.service_call
+
+        service_data = dict(self.service_call.service_data)
+        if len(self.entity_ids) == 1:
+            service_data["entity_id"] = self.entity_ids[0]
+        else:
+            service_data["entity_id"] = list(self.entity_ids)
+        return dataobjects.ServiceCall(
+            self.service_call.domain, self.service_call.service, service_data)
+
+
+def _is_idempotent(service_call: dataobjects.ServiceCall) -> bool:
+    '''True if sending the call twice does the same as sending it once'''
+    if service_call.domain in NON_IDEMPOTENT_DOMAINS:
+        return False
+    return service_call.service in IDEMPOTENT_SERVICES or service_call.service.startswith("set_")
+
+
+def _get_entity_ids(service_call: dataobjects.ServiceCall) -> list:
+    '''Returns the call's entity IDs as a list, or None if the call has no entity_id'''
+    entity_id = service_call.service_data.get("entity_id")
+    if entity_id is None:
+        return None
+    if isinstance(entity_id, str):
+        return [e.strip() for e in entity_id.split(",") if e.strip()]
+    return list(entity_id)
+
+
+def _get_merge_key(service_call: dataobjects.ServiceCall, has_entity_id: bool) -> tuple:
+    '''Calls with the same key are identical, apart from their entity_id'''
+    service_data = {k: v for k, v in service_call.service_data.items() if k != "entity_id"}
+    return (service_call.domain, service_call.service, has_entity_id,
+            json.dumps(service_data, sort_keys=True, default=str))
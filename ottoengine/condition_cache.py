@@ -0,0 +1,58 @@
+import logging
+
+_LOG = logging.getLogger(__name__)
+# _LOG.setLevel(logging.DEBUG)
+
+
+class ConditionCache(object):
+    '''
+    Caches the results of compiled conditions that only read entity states.
+
+    A result is keyed by the versions of the entities the condition reads (see
+    OttoEngineState.entity_versions), so it is reused until one of those entities'
+    state is set again.  Conditions that read the time (sun, time) are never cached,
+    but the state-only subconditions of an and/or condition containing them are.
+    '''
+
+    def __init__(self, entity_versions: dict):
+        self._entity_versions = entity_versions
+        self._entries = []      # [versions, result] of each closure, dropped by clear()
+
+        self.stats = {
+            "entries": 0,   # Cached conditions of the loaded rules
+            "hits": 0,      # Evaluations answered from the cache
+            "misses": 0,    # Evaluations that ran the condition
+        }
+
+    # ~~~~~~~~~~~~~~~~~~~
+    #   Public methods
+    # ~~~~~~~~~~~~~~~~~~~
+
+    def wrap(self, func, entity_ids: set):
+        '''Returns a closure that caches the results of the compiled condition func'''
+        entity_ids = tuple(sorted(entity_ids))
+        get_version = self._entity_versions.get
+        stats = self.stats
+        entry = [None, None]    # [versions, result]
+        self._entries.append(entry)
+        self.stats["entries"] = len(self._entries)
+
+        def cached_condition(entity_states) -> bool:
+            versions = [get_version(entity_id, 0) for entity_id in entity_ids]
+            if versions == entry[0]:
+                stats["hits"] += 1
+                return entry[1]
+            stats["misses"] += 1
+            result = func(entity_states)
+            entry[0] = versions
+            entry[1] = result
+            return result
+        return cached_condition
+
+    def clear(self):
+        '''Drops the cached results of the unloaded rules, even if their closures live on'''
+        for entry in self._entries:
+            entry[0] = None
+            entry[1] = None
+        self._entries = []
+        self.stats["entries"] = 0
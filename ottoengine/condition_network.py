@@ -0,0 +1,148 @@
+import json
+import logging
+
+from ottoengine.model import condition_objects
+
+_LOG = logging.getLogger(__name__)
+# _LOG.setLevel(logging.DEBUG)
+
+
+class ConditionNetwork(object):
+    '''
+    Network of the loaded rules' conditions, shared between rules, whose truth values
+    are updated as entity states change.
+
+    Identical conditions (by their serialized config) become a single node, so a
+    sub-condition used by many rules is evaluated once per state change of the
+    entities it reads, instead of once per rule.  Checking a rule's condition is then
+    reading its node's value.
+
+    Nodes that read the time (sun, time) have no stored value and are evaluated when
+    read.  An and/or node only stores a value if it is known without them: an and
+    node is False once a child before the first such node is False.
+    '''
+
+    def __init__(self, entity_states: dict):
+        self._entity_states = entity_states
+        self._nodes = {}            # key -> _Node
+        self._entity_nodes = {}     # entity_id -> [leaf _Nodes reading the entity]
+
+        self.stats = {
+            "nodes": 0,
+            "shared": 0,    # Conditions that reused an existing node
+            "updates": 0,   # Node values recomputed after a state change
+            "changes": 0,   # Node values that changed
+        }
+
+    # ~~~~~~~~~~~~~~~~~~~
+    #   Public methods
+    # ~~~~~~~~~~~~~~~~~~~
+
+    def add_condition(self, cond: condition_objects.RuleCondition):
+        '''
+        Adds the condition tree to the network, and returns a closure like the
+        compiled conditions' one, which reads the value of the condition's node.
+        '''
+        node = self._add_node(cond)
+        read = _read
+
+        def network_condition(entity_states) -> bool:
+            value = node.value
+            if value is None:
+                return read(node, entity_states)
+            return value
+        return network_condition
+
+    def clear(self):
+        self._nodes = {}
+        self._entity_nodes = {}
+        self.stats["nodes"] = 0
+        self.stats["shared"] = 0
+
+    def state_changed(self, entity_id: str):
+        '''Updates the nodes reading the entity, and the and/or nodes above them'''
+        nodes = self._entity_nodes.get(entity_id)
+        if nodes is None:
+            return
+        pending = list(nodes)
+        while pending:
+            node = pending.pop()
+            self.stats["updates"] += 1
+            value = self._compute(node)
+            if value is not node.value:
+                node.value = value
+                self.stats["changes"] += 1
+                pending.extend(node.parents)
+
+    # ~~~~~~~~~~~~~~~~~~~~
+    #   Private methods
+    # ~~~~~~~~~~~~~~~~~~~~
+
+    def _add_node(self, cond) -> '_Node':
+        key = json.dumps(cond.serialize(), sort_keys=True, default=str)
+        node = self._nodes.get(key)
+        if node is not None:
+            self.stats["shared"] += 1
+            return node
+
+        if isinstance(cond, (condition_objects.AndCondition, condition_objects.OrCondition)):
+            node = _Node(isinstance(cond, condition_objects.AndCondition), None)
+            for sub_cond in cond.conditions:
+                child = self._add_node(sub_cond)
+                child.parents.append(node)
+                node.children.append(child)
+            node.volatile = any(child.volatile for child in node.children)
+        else:
+            node = _Node(None, cond._compile(None, False))
+            node.volatile = not cond.is_state_only()
+            for entity_id in cond.get_entity_ids():
+                self._entity_nodes.setdefault(entity_id, []).append(node)
+
+        node.value = self._compute(node)
+        self._nodes[key] = node
+        self.stats["nodes"] += 1
+        return node
+
+    def _compute(self, node):
+        '''Returns the node's value, or None if it must be evaluated when read'''
+        if node.func is not None:
+            if node.volatile:
+                return None
+            try:
+                return bool(node.func(self._entity_states))
+            except Exception:
+                return None     # Evaluated when read, so the exception is raised there
+
+        # In child order, like evaluate(): a child without a value might be the one
+        # that decides, or raise.
+        decisive = not node.is_and
+        for child in node.children:
+            if child.value is None:
+                return None
+            if child.value is decisive:
+                return decisive
+        return not decisive
+
+
+class _Node(object):
+    __slots__ = ["is_and", "func", "children", "parents", "volatile", "value"]
+
+    def __init__(self, is_and, func):
+        self.is_and = is_and    # True: and node, False: or node, None: leaf node
+        self.func = func        # Compiled closure of a leaf node
+        self.children = []
+        self.parents = []
+        self.volatile = False   # True if the node reads the time
+        self.value = None
+
+
+def _read(node, entity_states) -> bool:
+    if node.value is not None:
+        return node.value
+    if node.func is not None:
+        return bool(node.func(entity_states))
+    decisive = not node.is_and
+    for child in node.children:
+        if _read(child, entity_states) is decisive:
+            return decisive
+    return not decisive
@@ -3,9 +3,18 @@ import logging
 import os
 import shutil
 
+_LOG = logging.getLogger(__name__)
+# _LOG.setLevel(logging.DEBUG)
+
 CONFIG_FILE = "config.ini"
 CONFIG_EXAMPLE = "/app/config.ini.example"
 
+SUBSCRIBE_ALL = "all"            # Subscribe to every state_changed event
+SUBSCRIBE_ENTITIES = "entities"  # Subscribe only to the entities used by the rules
+
+DISPATCH_INLINE = "inline"  # Check rule conditions as each event is processed
+DISPATCH_TASK = "task"      # Check rule conditions in each triggered rule's task
+
 
 def _parse_boolean(val: str):
     if val:
@@ -23,6 +32,31 @@ def _parse_int(val: str):
     return None
 
 
+def _parse_float(val: str):
+    if val:
+        try:
+            return float(val)
+        except ValueError:
+            pass
+    return None
+
+
+def _parse_list(val: str) -> list:
+    if val:
+        return [item.strip() for item in val.split(",") if item.strip()]
+    return []
+
+
+def _parse_dict(val: str) -> dict:
+    '''Parses key:value, key:value'''
+    d = {}
+    for item in _parse_list(val):
+        key, sep, value = item.partition(":")
+        if sep:
+            d[key.strip()] = value.strip()
+    return d
+
+
 class EngineConfig:
 
     def __init__(self, config_dir="/config"):
@@ -38,6 +72,24 @@ class EngineConfig:
         self.tz = "America/Los_Angeles"
         self.json_rules_dir = "./json_rules"
         self.log_level = logging.INFO
+        self.ignore_state_domains = []  # Domains whose state is not kept unless a rule uses it
+        self.json_codec = "auto"        # auto, orjson, ujson, or json
+        self.ws_request_timeout = 30    # Seconds to wait for the response to a websocket command
+        self.ws_max_inflight = 64       # Websocket commands that can await a response at once
+        self.ws_compression = True      # Negotiate permessage-deflate with Home Assistant
+        self.service_coalesce_ms = 0    # Window to dedupe and merge service calls, 0 disables
+        self.ingest_queue_size = 1000   # Events that can wait for the event dispatcher
+        self.ingest_queue_policy = "block"  # When full: block, drop_oldest, or coalesce
+        self.coalesce_entities = []     # Domains or entity patterns collapsed while queued
+        self.subscribe_mode = SUBSCRIBE_ALL
+        self.dispatch_mode = DISPATCH_INLINE
+        self.condition_cache = True     # Reuse condition results until their entities change
+        self.condition_network = False  # Share conditions between rules, updated on changes
+        self.adaptive_conditions = False    # Reorder and/or subconditions by cost and outcome
+        self.scheduler_workers = 32     # Rule runs executing actions at once, 0 for no limit
+        self.group_lanes = {}           # Rule group -> scheduler lane: critical, normal, bulk
+        self.clock_mode = "timeline"    # timeline, or cron_table to match TimeSpecs every minute
+        self.clock_spread_secs = 0      # Window to spread time triggers firing together, 0 disables
 
     def load(self):
         self._load_config_file()
@@ -91,3 +143,31 @@ class EngineConfig:
             self.log_level = logging.INFO
 
         self.test_websocket_port = _parse_int(self._get("ENGINE", "TEST_WEBSOCKET_PORT"))
+        self.ignore_state_domains = _parse_list(self._get("ENGINE", "IGNORE_STATE_DOMAINS"))
+        self.json_codec = self._get("ENGINE", "JSON_CODEC") or "auto"
+        self.ws_request_timeout = _parse_int(self._get("ENGINE", "WS_REQUEST_TIMEOUT")) or 30
+        self.ws_max_inflight = _parse_int(self._get("ENGINE", "WS_MAX_INFLIGHT")) or 64
+        compression = self._get("ENGINE", "WS_COMPRESSION")
+        self.ws_compression = _parse_boolean(compression) if compression else True
+        self.service_coalesce_ms = _parse_int(self._get("ENGINE", "SERVICE_COALESCE_MS")) or 0
+        self.ingest_queue_size = _parse_int(self._get("ENGINE", "INGEST_QUEUE_SIZE")) or 1000
+        self.ingest_queue_policy = self._get("ENGINE", "INGEST_QUEUE_POLICY") or "block"
+        self.coalesce_entities = _parse_list(self._get("ENGINE", "COALESCE_ENTITIES"))
+        self.subscribe_mode = self._get("ENGINE", "SUBSCRIBE_MODE") or SUBSCRIBE_ALL
+        self.dispatch_mode = self._get("ENGINE", "DISPATCH_MODE") or DISPATCH_INLINE
+        condition_cache = self._get("ENGINE", "CONDITION_CACHE")
+        self.condition_cache = _parse_boolean(condition_cache) if condition_cache else True
+        condition_network = self._get("ENGINE", "CONDITION_NETWORK")
+        self.condition_network = _parse_boolean(condition_network) if condition_network else False
+        adaptive = self._get("ENGINE", "ADAPTIVE_CONDITIONS")
+        self.adaptive_conditions = _parse_boolean(adaptive) if adaptive else False
+        workers = _parse_int(self._get("ENGINE", "SCHEDULER_WORKERS"))
+        self.scheduler_workers = workers if workers is not None else 32
+        self.group_lanes = _parse_dict(self._get("ENGINE", "GROUP_LANES"))
+        self.clock_mode = self._get("ENGINE", "CLOCK_MODE") or "timeline"
+        spread = self._get("ENGINE", "CLOCK_SPREAD_SECS")
+        self.clock_spread_secs = _parse_float(spread)
+        if self.clock_spread_secs is None or not 0 <= self.clock_spread_secs < float("inf"):
+            if spread:
+                _LOG.warning("Invalid CLOCK_SPREAD_SECS {}, using 0".format(spread))
+            self.clock_spread_secs = 0
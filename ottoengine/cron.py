@@ -0,0 +1,267 @@
+import datetime
+import logging
+
+_LOG = logging.getLogger(__name__)
+# _LOG.setLevel(logging.DEBUG)
+
+# (name, lowest value, highest value) of the cron fields, in cron order
+FIELDS = [
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day_of_month", 1, 31),
+    ("month", 1, 12),
+    ("weekdays", 0, 7),     # 0-6 is Sun to Sat, 7 is also Sun
+]
+
+# Furthest a schedule is searched for its next time, before it's deemed to never match
+MAX_SEARCH_DAYS = 366 * 8
+
+_ONE_MINUTE = datetime.timedelta(minutes=1)
+_ONE_DAY = datetime.timedelta(days=1)
+_ALL_DAYS = (1 << 32) - 2       # Bits 1-31
+_ALL_WEEKDAYS = (1 << 7) - 1    # Bits 0-6
+
+
+class CronSchedule(object):
+    '''
+    A cron schedule compiled into one bitmask per field, where bit n is set if the field
+    matches the value n.  Schedules are immutable, so one can be shared by any number of
+    TimeSpecs.
+
+    Like cron (and croniter), if both the day of month and the weekdays are restricted,
+    a day matches if either of them matches.
+    '''
+    __slots__ = ["minutes", "hours", "days", "months", "weekdays", "day_or"]
+
+    def __init__(self, minutes: int, hours: int, days: int, months: int, weekdays: int,
+                 day_or: bool):
+        object.__setattr__(self, "minutes", minutes)
+        object.__setattr__(self, "hours", hours)
+        object.__setattr__(self, "days", days)
+        object.__setattr__(self, "months", months)
+        object.__setattr__(self, "weekdays", weekdays)
+        object.__setattr__(self, "day_or", day_or)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CronSchedule is immutable")
+
+    def __eq__(self, other):
+        return isinstance(other, CronSchedule) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    # ~~~~~~~~~~~~~~~~~~~
+    #   Public methods
+    # ~~~~~~~~~~~~~~~~~~~
+
+    def matches_day(self, day: datetime.date) -> bool:
+        if not self.months >> day.month & 1:
+            return False
+        dom = self.days >> day.day & 1
+        dow = self.weekdays >> _cron_weekday(day) & 1
+        if self.day_or:
+            return bool(dom or dow)
+        return bool(dom and dow)
+
+    def next_after(self, dt: datetime.datetime) -> datetime.datetime:
+        '''
+        Returns the first naive datetime, on a whole minute, strictly after the naive
+        datetime dt that matches the schedule.  Raises ValueError if there is none.
+        '''
+        t = dt.replace(second=0, microsecond=0) + _ONE_MINUTE
+        hour, minute = t.hour, t.minute
+        day = t.date()
+        for _ in range(MAX_SEARCH_DAYS):
+            if self.matches_day(day):
+                found = self._first_time_from(hour, minute)
+                if found is not None:
+                    return datetime.datetime(day.year, day.month, day.day, *found)
+            day += _ONE_DAY
+            hour, minute = 0, 0
+        raise ValueError("Cron schedule never matches: {}".format(self))
+
+    # ~~~~~~~~~~~~~~~~~~~~
+    #   Private methods
+    # ~~~~~~~~~~~~~~~~~~~~
+
+    def _first_time_from(self, hour: int, minute: int):
+        '''Returns (hour, minute) of the first match in the day at or after hour:minute'''
+        h = _next_bit(self.hours, hour)
+        if h is None:
+            return None
+        if h == hour:
+            m = _next_bit(self.minutes, minute)
+            if m is not None:
+                return h, m
+            h = _next_bit(self.hours, hour + 1)
+            if h is None:
+                return None
+        return h, _next_bit(self.minutes, 0)
+
+    def _key(self) -> tuple:
+        return (self.minutes, self.hours, self.days, self.months, self.weekdays, self.day_or)
+
+    def __repr__(self):
+        return "CronSchedule({})".format(", ".join(
+            "{}={}".format(name, _format_mask(mask))
+            for name, mask in zip(["minutes", "hours", "days", "months", "weekdays"],
+                                  self._key())))
+
+
+class CronTable(object):
+    '''
+    A table of compiled schedules, matched all at once against a minute.
+
+    Every table row gets a slot, its bit in the table's masks.  For each value of each field,
+    the table keeps a mask of the slots whose schedule matches the value, so the rows due in
+    a minute are the AND of a handful of masks, whatever the number of rows.
+    '''
+
+    def __init__(self):
+        self._slots = {}            # key -> slot
+        self._rows = []             # slot -> (key, schedule, value), None if free
+        self._free = []             # Free slots, reused before growing the table
+        self._minutes = [0] * 60
+        self._hours = [0] * 24
+        self._days = [0] * 32
+        self._months = [0] * 13
+        self._weekdays = [0] * 7
+        self._day_or = 0            # Slots whose schedule matches the day of month OR weekday
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    # ~~~~~~~~~~~~~~~~~~~
+    #   Public methods
+    # ~~~~~~~~~~~~~~~~~~~
+
+    def add(self, key, schedule: CronSchedule, value):
+        '''Adds a row, replacing any row with the same key'''
+        self.remove(key)
+        if self._free:
+            slot = self._free.pop()
+            self._rows[slot] = (key, schedule, value)
+        else:
+            slot = len(self._rows)
+            self._rows.append((key, schedule, value))
+        self._slots[key] = slot
+        self._update(slot, schedule, True)
+
+    def remove(self, key):
+        '''Removes the row of the key, and returns its value or None'''
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return None
+        _, schedule, value = self._rows[slot]
+        self._update(slot, schedule, False)
+        self._rows[slot] = None
+        self._free.append(slot)
+        return value
+
+    def match(self, localtime: datetime.datetime) -> list:
+        '''Returns the values of the rows whose schedule matches the minute of localtime'''
+        dom = self._days[localtime.day]
+        dow = self._weekdays[(localtime.weekday() + 1) % 7]
+        days = (dom & dow) | (self._day_or & (dom | dow))
+        bits = (self._minutes[localtime.minute] & self._hours[localtime.hour]
+                & self._months[localtime.month] & days)
+        if not bits:
+            return []
+
+        # Find the set bits in the binary string, which is linear in the size of the table
+        rows = self._rows
+        binary = bin(bits)[:1:-1]   # Lowest bit first
+        values = []
+        slot = binary.find("1")
+        while slot >= 0:
+            values.append(rows[slot][2])
+            slot = binary.find("1", slot + 1)
+        return values
+
+    # ~~~~~~~~~~~~~~~~~~~~
+    #   Private methods
+    # ~~~~~~~~~~~~~~~~~~~~
+
+    def _update(self, slot: int, schedule: CronSchedule, add: bool):
+        bit = 1 << slot
+        for masks, field_mask in [
+                (self._minutes, schedule.minutes), (self._hours, schedule.hours),
+                (self._days, schedule.days), (self._months, schedule.months),
+                (self._weekdays, schedule.weekdays)]:
+            for n in range(len(masks)):
+                if field_mask >> n & 1:
+                    masks[n] = masks[n] | bit if add else masks[n] & ~bit
+        if schedule.day_or:
+            self._day_or = self._day_or | bit if add else self._day_or & ~bit
+
+
+def compile_schedule(minute=None, hour=None, day_of_month=None, month=None,
+                     weekdays=None) -> CronSchedule:
+    '''
+    Compiles the cron fields of a TimeSpec, each None (any), an int, or a cron field string
+    of comma separated values, ranges (a-b) and steps (*/n, a-b/n, a/n).
+    Raises ValueError for anything else, like month or weekday names.
+    '''
+    values = [minute, hour, day_of_month, month, weekdays]
+    masks = [_compile_field(value, low, high) for value, (_, low, high) in zip(values, FIELDS)]
+    if masks[4] >> 7 & 1:
+        masks[4] = (masks[4] | 1) & ~(1 << 7)     # 7 is Sunday, like 0
+    day_or = masks[2] != _ALL_DAYS and masks[4] != _ALL_WEEKDAYS
+    return CronSchedule(*masks, day_or=day_or)
+
+
+def _compile_field(value, low: int, high: int) -> int:
+    if value is None:
+        return _range_mask(low, high, 1)
+    if isinstance(value, bool):
+        raise ValueError("Invalid cron field: {}".format(value))
+    if isinstance(value, int):
+        return _range_mask(value, value, 1, low, high)
+
+    mask = 0
+    for part in str(value).replace(" ", "").split(","):
+        step = None
+        if "/" in part:
+            part, step = part.split("/", 1)
+            step = int(step)
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(v) for v in part.split("-", 1))
+        else:
+            start = int(part)
+            end = start if step is None else high   # a/n is a-high/n
+        mask |= _range_mask(start, end, 1 if step is None else step, low, high)
+    return mask
+
+
+def _range_mask(start: int, end: int, step: int, low: int = None, high: int = None) -> int:
+    if low is not None and not (low <= start <= end <= high):
+        raise ValueError("Cron range {}-{} is outside {}-{}".format(start, end, low, high))
+    if step < 1:
+        raise ValueError("Invalid cron step: {}".format(step))
+    mask = 0
+    for n in range(start, end + 1, step):
+        mask |= 1 << n
+    return mask
+
+
+def _next_bit(mask: int, n: int):
+    '''Returns the lowest set bit of mask at or above n, or None'''
+    rest = mask >> n
+    if not rest:
+        return None
+    return n + (rest & -rest).bit_length() - 1
+
+
+def _cron_weekday(day: datetime.date) -> int:
+    '''0-6 is Sun to Sat'''
+    return (day.weekday() + 1) % 7
+
+
+def _format_mask(mask: int) -> str:
+    return ",".join(str(n) for n in range(mask.bit_length()) if mask >> n & 1)
@@ -2,11 +2,15 @@ import asyncio
 import logging
 import signal
 import sys
+import time
 import traceback
 
 from ottoengine import state, const, persistence, config, helpers, enginelog, hass_websocket_client
+from ottoengine import coalescer, condition_cache, condition_network, ingest_queue, json_codec
+from ottoengine import rate_meter, relevance, rule_runs, rule_scheduler, subscriptions
+from ottoengine import timer_wheel, trigger_index
 from ottoengine.model import dataobjects, trigger_objects, rule_objects, action_objects
-from ottoengine.fibers import clock, hass_websocket_reader
+from ottoengine.fibers import clock, event_dispatcher, hass_websocket_reader
 from ottoengine.testing import test_websocket
 
 
@@ -31,12 +35,57 @@ class OttoEngine(object):
         self._enginelog = enginelog
 
         self._websocket = None
+        self._subscriptions = None     # Only used when subscribing to the rules' entities
         self._fiber_websocket_reader = None
+        self._fiber_event_dispatcher = None
+        self._reconnect_attempt = 0     # Failed reconnects since the last successful one
+        self._reconnect_stats = {
+            "count": 0,
+            "last_duration_ms": None,
+            "synthetic_events": 0,      # State changes found by diffing after reconnecting
+        }
 
         self._states = state.OttoEngineState()
-
-        self._event_listeners = {}     # Provide a way to lookup listeners by event_type
+        self._states.set_engine_state("clock", self._clock.stats)
+        self._outbound_calls = rate_meter.RateMeter()   # Service calls sent to Home Assistant
+        self._states.set_engine_state("outbound_calls", self._outbound_calls.stats)
+        self._relevance = relevance.RelevanceIndex(self._config.ignore_state_domains)
+
+        self._ingest_queue = ingest_queue.IngestQueue(
+            self._loop, self._config.ingest_queue_size, self._config.ingest_queue_policy,
+            self._config.coalesce_entities)
+        self._states.set_engine_state("ingest_queue", self._ingest_queue.stats)
+
+        self._coalescer = None
+        if self._config.service_coalesce_ms:
+            self._coalescer = coalescer.ServiceCallCoalescer(
+                self._loop, self._async_send_service_call, self._config.service_coalesce_ms)
+            self._states.set_engine_state("service_calls", self._coalescer.stats)
+
+        self._rule_runs = rule_runs.RuleRunRegistry(self._loop)
+        self._states.set_engine_state("rule_runs", self._rule_runs.stats)
+        self._timer_wheel = timer_wheel.TimerWheel(self._loop)    # Timers of the delay actions
+        self._states.set_engine_state("timers", self._timer_wheel.stats)
+        self._scheduler = rule_scheduler.RuleScheduler(
+            self._loop, self._config.scheduler_workers, self._config.group_lanes,
+            self._timer_wheel.async_sleep)
+        self._states.set_engine_state("scheduler", self._scheduler.stats)
+
+        self._trigger_index = trigger_index.TriggerIndex()  # Listeners by entity and event type
         self._time_listeners = []     # Just keeps track of the IDs so we can remove during reload
+        self._states.set_engine_state("triggers", self._trigger_index.stats)
+
+        # The condition network, if enabled, replaces the condition cache
+        self._condition_network = None
+        self._condition_cache = None
+        if self._config.condition_network:
+            self._condition_network = condition_network.ConditionNetwork(
+                self._states.entity_states)
+            self._states.add_entity_listener(self._condition_network.state_changed)
+            self._states.set_engine_state("condition_network", self._condition_network.stats)
+        elif self._config.condition_cache:
+            self._condition_cache = condition_cache.ConditionCache(self._states.entity_versions)
+            self._states.set_engine_state("condition_cache", self._condition_cache.stats)
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~
     #   Engine's Public API
@@ -50,6 +99,18 @@ class OttoEngine(object):
     def englog(self):
         return self._enginelog
 
+    @property
+    def scheduler(self):
+        return self._scheduler
+
+    @property
+    def timer_wheel(self):
+        return self._timer_wheel
+
+    @property
+    def relevance(self) -> relevance.RelevanceIndex:
+        return self._relevance
+
     def start_engine(self):
         '''Starts the Otto Engine until it is shutdown'''
 
@@ -72,45 +133,93 @@ class OttoEngine(object):
     def process_event(self, event):
         ''' Process an event received by the websocket fiber '''
 
-        listeners = []
         if isinstance(event, dataobjects.StateChangedEvent):
             # Update the state
             self._states.set_entity_state(event.entity_id, event.new_state_obj)
 
-            _LOG.debug("[Event] entity_id: {}, new_state: {}, attributes: {}".format(
-                event.entity_id, event.new_state_obj.state, event.new_state_obj.attributes))
+            if _LOG.isEnabledFor(logging.DEBUG):
+                _LOG.debug("[Event] entity_id: {}, new_state: {}, attributes: {}".format(
+                    event.entity_id, event.new_state_obj.state, event.new_state_obj.attributes))
 
-            entity_listeners = self._event_listeners.get(event.entity_id)
-            if entity_listeners is not None:
-                for listener in entity_listeners:
-                    _LOG.info("Invoking trigger: rule {}, entity: {}".format(
-                            listener.rule.id, event.entity_id))
-                    listeners.append(listener)
-
-        elif isinstance(event, dataobjects.HassEvent):
+        elif _LOG.isEnabledFor(logging.DEBUG):
             _LOG.debug(
                 "[Event] event_type: {}, event_data: {}".format(event.event_type, event.data_obj))
 
-            event_listeners = self._event_listeners.get(event.event_type)
-            if event_listeners is not None:
-                for listener in event_listeners:
-                    _LOG.info("Invoking trigger: rule {}, event_type: {}".format(
-                            listener.rule.id, event.event_type))
-                    listeners.append(listener)
-
-        # The trigger_function is a reference to an async_handle_trigger() function
-        # created from rule_objects.get_XXX_listeners()
-        for listener in listeners:
-            self._loop.create_task(
-                async_invoke_rule(self, listener.rule, trigger=listener.trigger, event=event))
+        # Only the listeners whose trigger passes get a task
+        for listener in self._trigger_index.match(event):
+            _LOG.info("Invoking trigger: rule {}, {}".format(
+                listener.rule.id, getattr(event, "entity_id", event.event_type)))
+
+            if self._config.dispatch_mode == config.DISPATCH_INLINE:
+                # Check the rule condition against the state this event left, and only
+                # start a task for the rules that will run their actions.  A failing rule
+                # must not keep the other rules triggered by the event from running.
+                try:
+                    if check_rule(
+                            self, listener.rule, listener.trigger, event, trigger_passed=True):
+                        self.start_rule_run(listener.rule)
+                except Exception:
+                    _LOG.exception("Exception checking rule {}".format(listener.rule.id))
+            else:
+                self._loop.create_task(async_invoke_rule(
+                    self, listener.rule, trigger=listener.trigger, event=event,
+                    trigger_passed=True))
+
+    def start_rule_run(self, rule: rule_objects.AutomationRule) -> asyncio.Task:
+        '''
+        Starts running the rule's actions, if the rule's mode allows it.
+        Returns the run's task, or None if the run was dropped or queued.
+        '''
+        return self._rule_runs.start(rule, lambda: async_run_scheduled(self, rule))
+
+    async def async_run_rule(self, rule: rule_objects.AutomationRule) -> bool:
+        '''
+        Runs the rule's actions in the current task, if the rule's mode allows it.
+        Returns False if the run was dropped.
+        '''
+        return await self._rule_runs.async_run(rule, lambda: async_run_scheduled(self, rule))
+
+    async def async_ingest_event(self, event):
+        '''
+        Queues an event received by the websocket fiber for the event dispatcher.
+        The event is processed right away if the dispatcher is not running.
+        '''
+        if self._fiber_event_dispatcher is None:
+            self.process_event(event)
+        else:
+            await self._ingest_queue.async_put(event)
+
+    async def async_ingest_state_only(self, entity_id, new_state_dict):
+        '''
+        Queues the state change of an entity no rule triggers on, behind the queued events.
+        The state is updated right away if the dispatcher is not running.
+        '''
+        if self._fiber_event_dispatcher is None:
+            self.process_state_only(entity_id, new_state_dict)
+        else:
+            await self._ingest_queue.async_put(ingest_queue.StateUpdate(entity_id, new_state_dict))
+
+    def process_state_only(self, entity_id, new_state_dict):
+        '''
+        Cheap path for a state_changed event that no rule triggers on.
+        Only the entity's state is updated: no event objects, listener lookups or logging.
+        An entity the engine already keeps stays current, even if no rule wants it anymore.
+        '''
+        if new_state_dict is None:
+            return
+        if (self._relevance.wants_state(entity_id)
+                or self._states.get_entity_state(entity_id) is not None):
+            self._states.set_entity_state(entity_id, dataobjects.LazyEntityState(new_state_dict))
 
-    async def call_service(self, service_call: dataobjects.ServiceCall):
-        await self._websocket.async_call_service(service_call)
-        self.englog.add(enginelog.SERVICE_CALLED, service_call.serialize())
+    async def call_service(self, service_call: dataobjects.ServiceCall) -> bool:
+        '''Calls a service, and returns True once Home Assistant has accepted the call'''
+        if self._coalescer is not None:
+            return await self._coalescer.async_call_service(service_call)
+        return await self._async_send_service_call(service_call)
 
     def websocket_fiber_ending(self):
-        _LOG.warn("Websocket Fiber has ended...restarting Engine setup")
-        self._loop.create_task(self._async_setup_engine())
+        _LOG.warn("Websocket Fiber has ended...reconnecting")
+        self._loop.create_task(self._async_reconnect())
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
     #                       Threadsafe methods
@@ -151,6 +260,21 @@ class OttoEngine(object):
         return asyncio.run_coroutine_threadsafe(
             _async_delete_rule(rule_id), self._loop).result(ASYNC_TIMEOUT_SECS)
 
+    def get_condition_stats_threadsafe(self) -> list:
+        async def _async_get_condition_stats():
+            return [
+                {
+                    "rule": rule.id,
+                    "conditions": [
+                        cond.get_order_stats() for cond in rule_objects.get_conditions(rule)
+                        if cond.get_order_stats() is not None
+                    ]
+                }
+                for rule in self.states.get_rules()
+            ]
+        return asyncio.run_coroutine_threadsafe(
+            _async_get_condition_stats(), self._loop).result(ASYNC_TIMEOUT_SECS)
+
     def reload_rules_threadsafe(self) -> bool:
         return asyncio.run_coroutine_threadsafe(
             self._async_reload_rules(), self._loop).result(ASYNC_TIMEOUT_SECS)
@@ -216,12 +340,22 @@ class OttoEngine(object):
     def _stop_engine(self):
         '''Gracefully stop the engine'''
         self._fiber_websocket_reader.cancel()
+        if self._fiber_event_dispatcher is not None:
+            self._fiber_event_dispatcher.cancel()
         self._loop.stop()
 
     def _run_fiber(self, fiber) -> None:
         task = self._loop.create_task(fiber.async_run())
         fiber.asyncio_task = task
 
+    async def _async_send_service_call(self, service_call: dataobjects.ServiceCall) -> bool:
+        self._outbound_calls.mark()
+        response_future = await self._websocket.async_call_service(service_call)
+        self.englog.add_serialized(
+            enginelog.SERVICE_CALLED, None, None, service_call, cache=False)
+        response = await _async_wait_response(response_future, "call_service")
+        return response is not None
+
     async def _async_setup_engine(self):
 
         # Start testing Websocket server
@@ -232,24 +366,22 @@ class OttoEngine(object):
         # Initialize the websocket
         self._websocket = hass_websocket_client.AsyncHassWebsocket(
             self._config.hass_host, self._config.hass_port,
-            self._config.hass_token, self._config.hass_ssl
+            self._config.hass_token, self._config.hass_ssl,
+            codec=json_codec.get_codec(self._config.json_codec),
+            request_timeout=self._config.ws_request_timeout,
+            max_inflight=self._config.ws_max_inflight,
+            compress=self._config.ws_compression
         )
-        self._fiber_websocket_reader = hass_websocket_reader.HassWebSocketReader(
-            self, self._websocket)
-
-        # Run the Websocket Reader Fiber
-        self._run_fiber(self._fiber_websocket_reader)
-        await asyncio.sleep(1)
+        self._states.set_engine_state("websocket", self._websocket.stats)
+        self._states.set_engine_state("reconnects", self._reconnect_stats)
 
-        while not self._fiber_websocket_reader.connected:
-            _LOG.info("Waiting for Websocket Fiber to connect")
-            await asyncio.sleep(3)
+        # Run the Event Dispatcher Fiber (it outlives websocket reconnects)
+        self._fiber_event_dispatcher = event_dispatcher.EventDispatcher(self, self._ingest_queue)
+        self._run_fiber(self._fiber_event_dispatcher)
 
-        await self._websocket.async_subscribe_events(const.STATE_CHANGED)
-        # await self._websocket.async_subscribe_events("call_service");
-        await self._websocket.async_subscribe_events("timer_ended")
-        await self._websocket.async_get_all_state()
-        await self._websocket.async_get_all_services()
+        # Run the Websocket Reader Fiber, and fetch the states and services
+        await self._async_start_websocket_reader()
+        await self._async_sync_with_hass()
 
         # Start the EngineClock
         self._run_fiber(self._clock)
@@ -257,6 +389,126 @@ class OttoEngine(object):
         # Load the Automation Rules
         await self._async_reload_rules()
 
+    async def _async_reconnect(self):
+        '''
+        Reconnects the websocket after it drops.
+
+        The rules, listeners, clock and entity states are kept.  The fresh states are
+        diffed against the engine's, and only the entities that changed while the
+        websocket was down produce state changed events.
+        '''
+        delay = hass_websocket_reader.get_backoff_delay(self._reconnect_attempt)
+        self._reconnect_attempt += 1
+        _LOG.info("Reconnecting the websocket in {:.1f}s".format(delay))
+        await asyncio.sleep(delay)
+
+        start = time.monotonic()
+        await self._async_start_websocket_reader()
+        synced = await self._async_sync_with_hass(reconcile=True)
+
+        if synced:
+            self._reconnect_attempt = 0
+            if self._subscriptions is not None:
+                await self._subscriptions.async_sync(
+                    self._relevance.entity_ids, self._relevance.event_types)
+
+            self._reconnect_stats["count"] += 1
+            self._reconnect_stats["last_duration_ms"] = (time.monotonic() - start) * 1000
+            _LOG.info("Websocket reconnected in {:.0f}ms".format(
+                self._reconnect_stats["last_duration_ms"]))
+        else:
+            _LOG.error("Could not fetch the states after reconnecting, they may be stale")
+
+    async def _async_start_websocket_reader(self):
+        self._fiber_websocket_reader = hass_websocket_reader.HassWebSocketReader(
+            self, self._websocket)
+        self._run_fiber(self._fiber_websocket_reader)
+        await self._fiber_websocket_reader.async_wait_connected()
+
+    async def _async_sync_with_hass(self, reconcile: bool = False) -> bool:
+        '''
+        Subscribes to events, and fetches the states and services.
+        Returns False if the states could not be fetched.
+        '''
+        # Send the setup commands back-to-back, then wait for their responses
+        futures = []
+        if self._config.subscribe_mode == config.SUBSCRIBE_ENTITIES:
+            # Subscriptions are made for the rules' entities once the rules are loaded.
+            # Subscription IDs belong to a connection, so each connection needs a new manager.
+            self._subscriptions = subscriptions.SubscriptionManager(self._websocket)
+            self._states.set_engine_state("subscriptions", self._subscriptions.stats)
+        else:
+            futures = [
+                await self._websocket.async_subscribe_events(const.STATE_CHANGED),
+                # await self._websocket.async_subscribe_events("call_service"),
+                await self._websocket.async_subscribe_events("timer_ended"),
+            ]
+        states_future = await self._websocket.async_get_all_state()
+        services_future = await self._websocket.async_get_all_services()
+
+        for future in futures:
+            await _async_wait_response(future, "subscribe_events")
+
+        response = await _async_wait_response(states_future, "get_states")
+        if response is None:
+            return False
+        if reconcile:
+            await self._async_reconcile_states(response["result"])
+        else:
+            self._process_states_result(response["result"])
+
+        response = await _async_wait_response(services_future, "get_services")
+        if response is not None:
+            self._process_services_result(response["result"])
+        return True
+
+    async def _async_reconcile_states(self, states_list: list):
+        '''
+        Updates the engine's states from a fresh get_states result.
+        An entity whose state changed gets a synthetic state changed event, from the state
+        the engine had to the fresh one.  Attribute-only changes, and new entities, only
+        update the state.
+        '''
+        changed = 0
+        for state_dict in states_list:
+            state = dataobjects.LazyEntityState(state_dict)
+            existing_state = self.states.get_entity_state(state.entity_id)
+
+            if (existing_state is None or existing_state.is_equal(state)
+                    or not self._relevance.is_trigger_entity(state.entity_id)):
+                # Queued too, so the state can't land before the synthetic events
+                await self.async_ingest_state_only(state.entity_id, state_dict)
+                continue
+
+            changed += 1
+            await self.async_ingest_event(dataobjects.StateChangedEvent(
+                state.entity_id, existing_state, state,
+                state_dict.get("last_updated") or helpers.nowutc()))
+
+        self._reconnect_stats["synthetic_events"] += changed
+        _LOG.info("Reconciled states after reconnecting: {} changed trigger entities".format(
+            changed))
+
+    def _process_states_result(self, states_list: list):
+        for state_dict in states_list:
+            if not self._relevance.wants_state(state_dict.get(const.ENTITY_ID)):
+                continue
+            state = dataobjects.LazyEntityState(state_dict)
+
+            # Update state if it doesn't match the engine's state
+            existing_state = self.states.get_entity_state(state.entity_id)
+
+            if not existing_state or not existing_state.is_equal(state):
+                self.states.set_entity_state(state.entity_id, state)
+
+    def _process_services_result(self, services_dict: dict):
+        for domain_key in services_dict:
+            service_dicts = services_dict.get(domain_key)
+            service_domain = dataobjects.ServiceRegistration.from_websocket_dict(
+                domain_key, service_dicts)
+            _LOG.debug("Registering service: {}".format(service_domain))
+            self.states.set_service_info(service_domain)
+
     async def _async_load_rules(self):
         _LOG.info("Loading rules from persistence")
 
@@ -266,8 +518,16 @@ class OttoEngine(object):
             await self._async_load_rule(rule)
 
     async def _async_load_rule(self, rule):
+            # Recompile the rule's conditions with the engine's condition network or cache
+            for cond in rule_objects.get_conditions(rule):
+                if self._condition_network is not None:
+                    cond.compiled = self._condition_network.add_condition(cond)
+                else:
+                    cond.compile(self._condition_cache, self._config.adaptive_conditions)
+
             # Register the rule's listeners
             self._load_listeners(rule)
+            self._relevance.add_rule(rule)
 
             # Add rule to State
             self.states.add_rule(rule)
@@ -278,17 +538,9 @@ class OttoEngine(object):
 
                 # State and Event triggers
                 if isinstance(listener.trigger, trigger_objects.ListenerTrigger):
-                    if isinstance(listener.trigger, trigger_objects.EventTrigger):
-                        listener_id = listener.trigger.event_type
-                    elif isinstance(listener.trigger,
-                                    (trigger_objects.StateTrigger,
-                                     trigger_objects.NumericStateTrigger)):
-                        listener_id = listener.trigger.entity_id
-                    _LOG.info("Adding listener for {} (rule: {})".format(listener_id, rule.id))
-                    if listener_id in self._event_listeners:
-                        self._event_listeners[listener_id].append(listener)
-                    else:
-                        self._event_listeners[listener_id] = [listener]
+                    _LOG.info("Adding listener for {} (rule: {})".format(
+                        listener.trigger.serialize(), rule.id))
+                    self._trigger_index.add(listener)
 
                 # Time triggers
                 if isinstance(listener.trigger, trigger_objects.TimeTrigger):
@@ -302,7 +554,8 @@ class OttoEngine(object):
                         listener.trigger.id,
                         async_time_triggered,
                         listener.trigger.timespec,
-                        helpers.nowutc()
+                        helpers.nowutc(),
+                        spread_key=rule.id      # Trigger IDs change on every load
                     )
                     # Add reference so we can find the listener id to remove it
                     self._time_listeners.append(listener.trigger.id)
@@ -312,7 +565,12 @@ class OttoEngine(object):
         self._state_listeners = {}
 
         _LOG.info("Clearing all registered event listeners")
-        self._event_listeners = {}
+        self._trigger_index.clear()
+        self._relevance.clear()
+        if self._condition_network is not None:
+            self._condition_network.clear()
+        if self._condition_cache is not None:
+            self._condition_cache.clear()
 
         _LOG.info("Clearing all registered time listeners")
         for listener_id in self._time_listeners:
@@ -326,6 +584,9 @@ class OttoEngine(object):
         try:
             await self._async_clear_rules()
             await self._async_load_rules()
+            if self._subscriptions is not None:
+                # One round trip per changed entity, so it can't hold up the reload's reply
+                self._loop.create_task(self._async_sync_subscriptions())
         except Exception as e:
             message = "Exception reloading rules: {}: {}".format(
                 sys.exc_info()[0], sys.exc_info()[1])
@@ -335,6 +596,15 @@ class OttoEngine(object):
 
         return {"success": True}
 
+    async def _async_sync_subscriptions(self):
+        try:
+            await self._subscriptions.async_sync(
+                self._relevance.entity_ids, self._relevance.event_types)
+        except Exception as e:
+            _LOG.error("Exception syncing subscriptions: {}: {}".format(
+                sys.exc_info()[0], sys.exc_info()[1]))
+            traceback.print_exc()
+
     async def _async_get_state(self, group, key):
         '''Correoutine to access state objects.  This must run in the event loop'''
         _LOG.debug("_async_get_state() called with - group: {}, key: {}".format(group, key))
@@ -350,24 +620,55 @@ class OttoEngine(object):
         self._states.get_state(group, key, value)
 
 
+async def _async_wait_response(response_future: asyncio.Future, command: str) -> dict:
+    '''
+    Waits for the response to a websocket command.
+    Returns the response message, or None if the command failed or timed out.
+    '''
+    try:
+        response = await response_future
+    except asyncio.TimeoutError:
+        _LOG.error("Timed out waiting for the response to {}".format(command))
+        return None
+    except hass_websocket_client.WebSocketError as e:
+        _LOG.error("No response to {}: {}".format(command, str(e)))
+        return None
+
+    if not response.get("success"):
+        _LOG.error("{} failed: {}".format(command, response.get("error")))
+        return None
+    return response
+
+
 async def async_invoke_rule(engine_obj: OttoEngine, rule: rule_objects.AutomationRule,
-                            trigger=None, event: dataobjects.HassEvent = None):
+                            trigger=None, event: dataobjects.HassEvent = None,
+                            trigger_passed: bool = False):
+    '''
+    Runs a rule, if its trigger and rule condition pass.
+    trigger_passed is True when the trigger was already evaluated against the event.
+    '''
+    if check_rule(engine_obj, rule, trigger, event, trigger_passed):
+        await engine_obj.async_run_rule(rule)
+
+
+def check_rule(engine_obj: OttoEngine, rule: rule_objects.AutomationRule,
+               trigger=None, event: dataobjects.HassEvent = None,
+               trigger_passed: bool = False) -> bool:
+    '''Returns True if the rule is enabled, and its trigger and rule condition pass'''
     _LOG.debug("invoke_rule called for rule {}".format(rule.id))
 
     if not rule.enabled:
         _LOG.debug("Rule {} is not enabled".format(rule.id))
-        return
+        return False
 
     # Evaluate Trigger
     if trigger is not None:
         if isinstance(trigger, trigger_objects.ListenerTrigger) and (event is not None):
-            if trigger.eval_trigger(event):
+            if trigger_passed or trigger.eval_trigger(event):
                 _LOG.debug("Rule {}'s trigger passed".format(rule.id))
-                engine_obj.englog.add(enginelog.TRIGGER_FIRED, {
-                    "trigger": trigger.serialize()
-                })
+                engine_obj.englog.add_serialized(enginelog.TRIGGER_FIRED, {}, "trigger", trigger)
             else:
-                return  # This could happen a lot, so let's not log it
+                return False  # This could happen a lot, so let's not log it
         else:
             _LOG.debug(
                 "Trigger is not a ListenerTrigger, or event is None on rule: ".format(rule.id))
@@ -375,20 +676,35 @@ async def async_invoke_rule(engine_obj: OttoEngine, rule: rule_objects.Automatio
     # Evaluate Rule Condition
     _LOG.debug("Checking for rule {}'s rule condition".format(rule.id))
     if rule.rule_condition is not None:
-        if rule.rule_condition.evaluate(engine_obj):
+        if _evaluate_condition(engine_obj, rule.rule_condition):
             _LOG.debug("Rule {}'s rule condition passed".format(rule.id))
-            engine_obj.englog.add(enginelog.CONDITION_PASSED, {
+            engine_obj.englog.add_serialized(enginelog.CONDITION_PASSED, {
                 "rule": rule.id,
-                "condition_type": "rule condition",
-                "condition": rule.rule_condition.serialize()
-            })
+                "condition_type": "rule condition"
+            }, "condition", rule.rule_condition)
         else:
-            _LOG.debug("Rule {}'s rule condition is false: {}".format(
-                rule.id, rule.rule_condition.serialize()))
-            return
+            if _LOG.isEnabledFor(logging.DEBUG):
+                _LOG.debug("Rule {}'s rule condition is false: {}".format(
+                    rule.id, rule.rule_condition.serialize()))
+            return False
     else:
         _LOG.debug("Rule {} does not have a rule condition".format(rule.id))
 
+    return True
+
+
+async def async_run_scheduled(engine_obj: OttoEngine, rule: rule_objects.AutomationRule):
+    '''Runs the rule's actions once the scheduler gives the run a worker in its lane'''
+    scheduler = engine_obj.scheduler
+    await scheduler.async_acquire(scheduler.get_lane(rule))
+    try:
+        await async_run_actions(engine_obj, rule)
+    finally:
+        scheduler.release()
+
+
+async def async_run_actions(engine_obj: OttoEngine, rule: rule_objects.AutomationRule):
+    '''Runs the rule's action sequences, once its trigger and rule condition passed'''
     # Run Actions
     _LOG.debug("Proceeding to run rule {}'s action sequences".format(rule.id))
     for seqId, action_seq in enumerate(rule.actions):
@@ -397,21 +713,21 @@ async def async_invoke_rule(engine_obj: OttoEngine, rule: rule_objects.Automatio
         if action_seq.action_condition is not None:
             _LOG.debug(
                 "Checking rule {}'s action seq# {}'s action condition".format(rule.id, seqId))
-            if action_seq.action_condition.evaluate(engine_obj):
+            if _evaluate_condition(engine_obj, action_seq.action_condition):
                 _LOG.debug(
                     "Rule {}'s action seq# {} action condition passed".format(rule.id, seqId))
-                engine_obj.englog.add(enginelog.CONDITION_PASSED, {
+                engine_obj.englog.add_serialized(enginelog.CONDITION_PASSED, {
                     "rule": rule.id,
                     "condition_type": "action condition",
-                    "action_seq": seqId,
-                    "condition": action_seq.action_condition.serialize()
-                })
+                    "action_seq": seqId
+                }, "condition", action_seq.action_condition)
 
             else:
-                _LOG.debug(
-                    "Rule {}'s action seq# {}'s action condition is false "
-                    + "(rule will not run): {}".format(
-                        rule.id, seqId, action_seq.action_condition.serialize()))
+                if _LOG.isEnabledFor(logging.DEBUG):
+                    _LOG.debug(
+                        "Rule {}'s action seq# {}'s action condition is false "
+                        + "(rule will not run): {}".format(
+                            rule.id, seqId, action_seq.action_condition.serialize()))
                 continue
 
         # Run the action sequence
@@ -433,3 +749,10 @@ async def async_invoke_rule(engine_obj: OttoEngine, rule: rule_objects.Automatio
 
     _LOG.debug("Rule {} processing completed".format(rule.id))
     engine_obj.englog.add(enginelog.RULE_COMPLETED, {"rule": rule.id})
+
+
+def _evaluate_condition(engine_obj: OttoEngine, cond) -> bool:
+    '''Evaluates the condition's compiled closure, or its interpreter if it wasn't compiled'''
+    if cond.compiled is not None:
+        return cond.compiled(engine_obj.states.entity_states)
+    return cond.evaluate(engine_obj)
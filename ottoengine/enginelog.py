@@ -1,3 +1,8 @@
+import collections
+import datetime
+import time
+import weakref
+
 from ottoengine import helpers
 
 EVENT = "event"
@@ -11,18 +16,32 @@ DEBUG = "debug"
 
 
 class EngineLog:
+    '''
+    Keeps the latest max_logs entries.
+
+    Entries are stored with a monotonic timestamp and, for add_serialized(), a
+    reference to the object to serialize.  Both are only converted when the log is
+    read by get_logs().
+    '''
+
     def __init__(self, max_logs=100):
-        self._log = []
+        self._log = collections.deque(maxlen=max_logs)  # (monotonic ts, type, entry, lazy)
         self._max_logs = max_logs
+        # Serialized rule objects (triggers, conditions), which don't change once loaded
+        self._serialized = weakref.WeakKeyDictionary()
 
     def add(self, logtype: str, logentry: dict):
         if self._max_logs > 0:
-            self._log.append({
-                "ts": str(helpers.nowutc()),
-                "type": logtype,
-                "entry": logentry,
-            })
-            self._trim_log()
+            self._log.append((time.monotonic(), logtype, logentry, None))
+
+    def add_serialized(self, logtype: str, logentry: dict, key: str, obj, cache: bool = True):
+        '''
+        Adds an entry with logentry[key] = obj.serialize(), serialized when the log is read.
+        If key is None, the entry is obj.serialize() itself.  If cache, obj must not change
+        after being logged, and its serialized form is reused.
+        '''
+        if self._max_logs > 0:
+            self._log.append((time.monotonic(), logtype, logentry, (obj, key, cache)))
 
     def add_event(self, event_name: str, event_data: dict=None):
         self.add(EVENT, {
@@ -36,12 +55,32 @@ class EngineLog:
         })
 
     def get_logs(self):
-        return self._log.copy()
+        now_mono = time.monotonic()
+        now = helpers.nowutc()
+        logs = []
+        for ts, logtype, logentry, lazy in self._log:
+            if lazy is not None:
+                logentry = self._build_entry(logentry, *lazy)
+            logs.append({
+                "ts": str(now - datetime.timedelta(seconds=now_mono - ts)),
+                "type": logtype,
+                "entry": logentry,
+            })
+        return logs
 
     def set_max_logs(self, max_logs):
         self._max_logs = max_logs
-        self._trim_log()
+        self._log = collections.deque(self._log, maxlen=max_logs)
+
+    def _build_entry(self, logentry: dict, obj, key: str, cache: bool) -> dict:
+        serialized = self._serialized.get(obj) if cache else None
+        if serialized is None:
+            serialized = obj.serialize()
+            if cache:
+                self._serialized[obj] = serialized
 
-    def _trim_log(self):
-        while len(self._log) > self._max_logs:
-            del self._log[0]
+        if key is None:
+            return serialized
+        entry = dict(logentry)
+        entry[key] = serialized
+        return entry
@@ -1,28 +1,47 @@
 import asyncio
 import croniter
 import datetime
+import heapq
 import inspect
+import itertools
 import pytz
 import logging
+import zlib
 # import pytz
 
-from ottoengine import fibers, helpers
+from ottoengine import cron, fibers, helpers, rate_meter
 
 _LOG = logging.getLogger(__name__)
 # _LOG.setLevel(logging.DEBUG)
 
-TICK_INTERVAL_SECONDS = 10  # Number of seconds between ticks
+# Longest the clock sleeps without checking the wall clock, so the loop's monotonic clock
+# drifting from the wall clock (NTP, suspend) delays an alarm by no more than this
+MAX_SLEEP_SECONDS = 3600
+
+# Upper bounds, in milliseconds, of the lateness histogram buckets of fired alarms
+LATENESS_BUCKETS_MS = [1, 10, 100, 1000, 10000, 60000]
 
 # Number of seconds past a scheduled event that it can still be executed
 # If the event isn't executed by this time after it's scheduled time
 # don't execute it, but just reschedule it for it's next time
 TICK_GRACE_SECONDS = 60
 
+# The timeline heap is rebuilt when more than this fraction of its entries are removed alarms
+COMPACT_RATIO = 0.5
+
+# Clock modes
+MODE_TIMELINE = "timeline"      # Every TimeSpec is an alarm on the timeline, rescheduled on firing
+MODE_CRON_TABLE = "cron_table"  # Compiled TimeSpecs are matched as a table on every minute
+MODES = [MODE_TIMELINE, MODE_CRON_TABLE]
+
+_ONE_MINUTE = datetime.timedelta(minutes=1)
+
 
 class TimeSpec(object):
 
     def __init__(
-        self, tz_name, minute=None, hour=None, day_of_month=None, month=None, weekdays=None
+        self, tz_name, minute=None, hour=None, day_of_month=None, month=None, weekdays=None,
+        spread=None
     ):
 
         # This object follows cron syntax:  https://en.wikipedia.org/wiki/Cron
@@ -32,6 +51,16 @@ class TimeSpec(object):
         self._month = month
         self._weekdays = weekdays      # 0-6 is Sun to Sat; or 1-7 is Mon to Sun
         self._tz_name = tz_name
+        self._spread = spread          # Seconds to spread the actions over, None for the clock's
+
+        # The schedule is compiled once.  Specs the compiler doesn't handle (like month or
+        # weekday names) fall back to croniter, with the cron string built once.
+        self._cron_spec = self._create_cron_spec()
+        try:
+            self._schedule = cron.compile_schedule(minute, hour, day_of_month, month, weekdays)
+        except ValueError:
+            _LOG.debug("Using croniter for TimeSpec: {}".format(self._cron_spec))
+            self._schedule = None
 
     def _create_cron_spec(self):
         minute = self._minute
@@ -57,12 +86,36 @@ class TimeSpec(object):
     #   Public Methods
     # ~~~~~~~~~~~~~~~~~~~
 
+    @property
+    def tz_name(self):
+        return self._tz_name
+
+    @property
+    def spread(self):
+        return self._spread
+
+    @property
+    def schedule(self) -> cron.CronSchedule:
+        '''The compiled schedule, or None if the spec is handled by croniter'''
+        return self._schedule
+
     def next_time_from(self, dt) -> datetime.datetime:
-        cron = croniter.croniter(
-            self._create_cron_spec(),
-            dt.astimezone(pytz.timezone(self._tz_name))
-        )
-        return cron.get_next(datetime.datetime)
+        tz = helpers.get_timezone(self._tz_name)
+        if self._schedule is None:
+            return croniter.croniter(self._cron_spec, dt.astimezone(tz)).get_next(datetime.datetime)
+
+        # Search in local wall time, skipping times the DST change makes earlier than dt
+        localnow = dt.astimezone(tz)
+        offset = localnow.utcoffset()
+        localtime = localnow.replace(tzinfo=None)
+        while True:
+            localtime = self._schedule.next_after(localtime)
+            # Most times have the offset of dt, which is much cheaper than localizing
+            nexttime = (localtime - offset).replace(tzinfo=pytz.utc).astimezone(tz)
+            if nexttime.replace(tzinfo=None) != localtime:
+                nexttime = _localize(tz, localtime)
+            if nexttime > dt:
+                return nexttime
 
     def serialize(self) -> dict:
         o = {}
@@ -85,6 +138,9 @@ class TimeSpec(object):
         if self._tz_name is not None:
             o["tz"] = self._tz_name
 
+        if self._spread is not None:
+            o["spread"] = self._spread
+
         return o
 
     # ~~~~~~~~~~~~~~~~~~~
@@ -104,10 +160,24 @@ class TimeSpec(object):
             day_of_month=o.get("day_of_month"),
             month=o.get("month"),
             weekdays=o.get("weekdays"),
-            tz_name=o.get("tz", pytz.UTC)
+            tz_name=o.get("tz", pytz.UTC),
+            spread=o.get("spread")
         )
 
 
+def _localize(tz: datetime.tzinfo, localtime: datetime.datetime) -> datetime.datetime:
+    '''
+    Localizes a wall time like cron.  A time repeated by the DST change is its first occurrence,
+    a time skipped by it is moved forward by the change.
+    '''
+    try:
+        return tz.localize(localtime, is_dst=None)
+    except pytz.AmbiguousTimeError:
+        return tz.localize(localtime, is_dst=True)
+    except pytz.NonExistentTimeError:
+        return tz.normalize(tz.localize(localtime, is_dst=False))
+
+
 class ClockAlarm(object):
     '''
     This is what sits on the ClockTriggers queue.
@@ -116,17 +186,20 @@ class ClockAlarm(object):
 
     def __init__(self, alarm_time):
         self.alarm_time = alarm_time    # This is a datetime object
-        self.actions = []               # List of AlarmActions
+        self.removed = False            # Set when the alarm is lazily deleted from the timeline
+        self._actions = {}              # key -> AlarmAction, in the order they were added
+
+    @property
+    def actions(self) -> list:
+        return list(self._actions.values())
 
     def add_action(self, action):
-        self.actions.append(action)
+        self._actions[_action_key(action)] = action
 
-    def remove_action(self, trigger_guid):
-        for pos, action in self.actions:
-            # TimeSpec Action
-            if isinstance(action, AlarmTimeSpecAction):
-                if action.id == trigger_guid:
-                    del self.actions[pos]
+    def remove_action(self, trigger_guid) -> bool:
+        '''Returns True if the alarm has no actions left'''
+        self._actions.pop(trigger_guid, None)
+        return len(self._actions) == 0
 
 
 class AlarmAction(object):
@@ -135,30 +208,85 @@ class AlarmAction(object):
 
 
 class AlarmTimeSpecAction(AlarmAction):
-    def __init__(self, id: str, action_function, timespec: TimeSpec):
+    def __init__(self, id: str, action_function, timespec: TimeSpec, spread_key=None):
         super().__init__(action_function)
         self.id = id
         self.timespec = timespec
+        self.spread_key = id if spread_key is None else spread_key  # Seeds the spread jitter
 
 
 class EngineClock (fibers.Fiber):
+    '''
+    In the cron_table mode, the TimeSpecs with a compiled schedule are not on the timeline.
+    They are rows of a cron.CronTable per timezone, matched at every minute while the table
+    isn't empty, so they are never rescheduled.  Unlike the timeline, a table doesn't fire
+    the wall times skipped by a DST change.
+
+    TimeSpecs firing together can be spread over a window of seconds, the TimeSpec's spread
+    or the clock's spread_secs.  Each action starts at a fixed offset in the window, the
+    crc32 of its spread key (the rule ID), so a rule starts at the same offset every time.
+    '''
 
-    def __init__(self, tz_name: str, loop=None):
+    def __init__(self, tz_name: str, loop=None, mode: str = MODE_TIMELINE,
+                 spread_secs: float = 0):
         super().__init__()
+        if mode not in MODES:
+            _LOG.warning("Unknown clock mode {}, using {}".format(mode, MODE_TIMELINE))
+            mode = MODE_TIMELINE
+
         self._tz_name = tz_name
         self._loop = loop
-        self._timeline = []     # list of ClockAlarms; one for each time at which to do something
+        self._mode = mode
+        self._spread_secs = spread_secs
+        self._spread_handles = {}       # action key -> {token: call_later handle of a spread start}
+        self._starts = rate_meter.RateMeter(self._loop_time)
+        # Heap of (alarm_time, seq, ClockAlarm); one alarm for each time at which to do something.
+        # Removed alarms stay in the heap, flagged, until they are popped or compacted away.
+        self._heap = []
+        self._seq = itertools.count()   # Orders alarms of the same time, never compares alarms
+        self._alarms = {}               # alarm_time -> live ClockAlarm
+        self._index = {}                # action key -> ClockAlarm holding the action
+        self._removed = 0               # Removed alarms still in the heap
+
+        # Cron table mode
+        self._tables = {}               # tz_name -> cron.CronTable
+        self._table_index = {}          # action key -> tz_name of the table holding it
+        self._table_next = None         # Next minute the tables are matched, None if empty
+        self._table_last = {}           # tz_name -> last local minute matched
+
+        # The clock sleeps until the earliest alarm; only armed once the clock is running
+        self._armed = False
+        self._wake_handle = None        # loop.call_at handle of the next wakeup
+        self._wake_time = None          # Alarm time the wakeup is armed for
+        self._waiter = None             # Future the run loop waits on between ticks
 
         if self._loop is None:
             self._loop = asyncio.get_event_loop()
 
+        self.stats = {
+            "mode": mode,
+            "alarms": 0,
+            "table_rows": 0,        # TimeSpecs in the cron tables
+            "table_matched": 0,     # Rows matched by the cron tables
+            "next_alarm": None,
+            "wakeups": 0,
+            "fired": 0,             # Alarms fired
+            "max_lateness_ms": 0.0,
+            "lateness_ms": _new_histogram(),    # Fired alarms, by how late they fired
+            "spread_secs": spread_secs,
+            "spread_actions": 0,    # Actions started later, by their spread offset
+            "spread_pending": 0,    # Spread actions waiting for their offset
+            "peak_burst": 0,        # Most actions due at one time, the peak without spreading
+            "starts": self._starts.stats,   # Actions started per second, after spreading
+        }
+
     # ~~~~~~~~~~~~~~~~~~~
     #   Public methods
     # ~~~~~~~~~~~~~~~~~~~
 
     def add_timespec_action(
         self, id, action_function,
-        timespec, nowtime
+        timespec, nowtime, spread_key=None
     ):
         """
         Parameters:
@@ -167,6 +295,7 @@ class EngineClock (fibers.Fiber):
             :param TimeSpec timespec: The TimeSpace object
             :param datetime.datetime nowtime: The current time used when determining the next time
                 to run the action_function
+            :param spread_key: Seeds the action's offset when spread, the ID if None
         """
         # Action function should be a async function reference, but since
         # it will be rescheduled after running, the function will be called
@@ -176,27 +305,33 @@ class EngineClock (fibers.Fiber):
         assert inspect.iscoroutinefunction(action_function), (
             "TimeSpec action_function must be an async function reference."
             " It also cannot be a couroutine object yet")
-        action = AlarmTimeSpecAction(id, action_function, timespec)
-        self._add_action_to_timeline(timespec.next_time_from(nowtime), action)
+        action = AlarmTimeSpecAction(id, action_function, timespec, spread_key)
+        if self._mode == MODE_CRON_TABLE and timespec.schedule is not None:
+            self._add_action_to_table(action, nowtime)
+        else:
+            self._add_action_to_timeline(timespec.next_time_from(nowtime), action)
 
     def remove_timespec_action(self, id):
         """Removes a TimeSpaceAction from the Clock's timeline
             Parameters:
                 :param str id: The ID of the TimeSpecAction
         """
-        for alarm in self.timeline:
-            for pos, action in enumerate(alarm.actions):
-                if action.id == id:
-                    alarm.actions.remove(action)
-            if len(alarm.actions) == 0:
-                self._timeline.remove(alarm)
+        for handle in self._spread_handles.pop(id, {}).values():
+            handle.cancel()
+            self.stats["spread_pending"] -= 1
+        if id in self._table_index:
+            self._remove_action_from_table(id)
+            return
+        alarm = self._index.pop(id, None)
+        if alarm is not None and alarm.remove_action(id):
+            self._remove_alarm(alarm)
 
     @property
     def timeline(self):
-        """
+        """Live alarms in time order.  This sorts the heap, so it's meant for inspection only
         :rtype: list[ClockAlarm]
         """
-        return self._timeline
+        return [alarm for _, _, alarm in sorted(self._heap) if not alarm.removed]
 
     # ~~~~~~~~~~~~~~~~~~~~
     #   Private methods
@@ -205,10 +340,18 @@ class EngineClock (fibers.Fiber):
     async def _async_run(self):
         """Override of Fiber base class.  Called by async Fiber.async_run()
         """
-        # Start the _tick() loop
-        while self._running:
-            await self._async_tick(helpers.nowutc())    # Execute tick
-            await asyncio.sleep(TICK_INTERVAL_SECONDS)  # Sleep until next tick
+        self._armed = True
+        try:
+            while self._running:
+                await self._async_tick(helpers.nowutc())    # Execute tick
+                self._waiter = self._loop.create_future()
+                self._arm()
+                await self._waiter                          # Sleep until the next alarm
+                self.stats["wakeups"] += 1
+        finally:
+            self._armed = False
+            self._waiter = None
+            self._disarm()
 
     async def _async_tick(self, utcnow):
         """ Process a tick of the clock
@@ -216,14 +359,21 @@ class EngineClock (fibers.Fiber):
             facilitate unit testing
         """
         # If no timeline, do nothing
-        if len(self._timeline) == 0:
+        if len(self._heap) == 0 and self._table_next is None:
             return
 
         # If now() is >= 1st element of timeline
-        while len(self._timeline) and utcnow >= self._timeline[0].alarm_time:
+        while len(self._heap) and utcnow >= self._heap[0][0]:
 
             # pop it off the timeline
-            alarm = self._timeline.pop(0)
+            alarm = heapq.heappop(self._heap)[2]
+            if alarm.removed:
+                self._removed -= 1
+                continue
+            del self._alarms[alarm.alarm_time]
+            for action in alarm.actions:
+                self._index.pop(_action_key(action), None)
+            self._record_lateness(utcnow, alarm.alarm_time)
 
             # If alarm is too old: > TICK_GRACE_SECONDS before now()
             if utcnow > alarm.alarm_time + datetime.timedelta(seconds=TICK_GRACE_SECONDS):
@@ -233,75 +383,238 @@ class EngineClock (fibers.Fiber):
                 _LOG.warn(self._format_timeline())
 
             # Process its actions
+            self._start_actions(alarm.actions)
             for action in alarm.actions:
-                _LOG.debug("Running alarm action")
-                # This is where we create the coroutine object from the action
-                # function reference - note the () on action_function
-                self._loop.create_task(action.action_function())
-
                 # Schedule the action's next time
                 if isinstance(action, AlarmTimeSpecAction):
                     self.add_timespec_action(
-                        action.id, action.action_function, action.timespec, utcnow)
-
-        if len(self._timeline):
+                        action.id, action.action_function, action.timespec, utcnow,
+                        action.spread_key)
+
+        # Match the cron tables on every minute up to now
+        while self._table_next is not None and utcnow >= self._table_next:
+            last_minute = self._table_next
+            if utcnow > self._table_next + datetime.timedelta(seconds=TICK_GRACE_SECONDS):
+                # Like an overdue alarm, each row due in the missed minutes fires once
+                last_minute = _floor_minute(utcnow)
+                _LOG.warning("Clock _tick found cron table minutes too old: {} to {}".format(
+                    self._table_next, last_minute))
+            self._match_tables(self._table_next, last_minute, utcnow)
+            if self._table_next is not None:
+                self._table_next = last_minute + _ONE_MINUTE
+
+        self.stats["alarms"] = len(self._alarms)
+        if len(self._alarms):
             _LOG.debug(
                 "Clock _tick(): next alarm is {} seconds away".format(
-                    ((self._timeline[0].alarm_time - utcnow).seconds)))
+                    ((self._next_alarm_time() - utcnow).seconds)))
 
     def _add_action_to_timeline(self, alarm_time: datetime.datetime, action: AlarmAction):
-        # Handle empty timeline case
-        if len(self._timeline) == 0:
-            _LOG.debug("Clock has empty timeline.  Adding first alarm at: {}".format(alarm_time))
-            alarm = ClockAlarm(alarm_time)
-            alarm.add_action(action)
-            self._timeline.append(alarm)
-            _LOG.debug(self._format_timeline())
-            return
+        # An action is on the timeline only once, so re-adding an ID moves it
+        key = _action_key(action)
+        if key in self._index:
+            self.remove_timespec_action(key)
 
-        for pos, alarm in enumerate(self._timeline):
+        if key in self._table_index:
+            self._remove_action_from_table(key)
 
+        alarm = self._alarms.get(alarm_time)
+        if alarm is None:
+            _LOG.debug("Adding new alarm to the timeline. Alarm: {}".format(alarm_time))
+            alarm = ClockAlarm(alarm_time)
+            self._alarms[alarm_time] = alarm
+            heapq.heappush(self._heap, (alarm_time, next(self._seq), alarm))
+        else:
             _LOG.debug(
-                "new.alarm_time: {} | alarm.alarm_time: {}".format(alarm_time, alarm.alarm_time))
-
-            # if new.alarm_time == [pos].alarm_time --> add action to existing alarm
-            if alarm_time == alarm.alarm_time:
-                _LOG.debug(
-                    ("Found match of existing alarm, adding to its list of actions. "
-                        + "Length: {}").format(len(alarm.actions)+1))
-                alarm.add_action(action)
-                break
-
-            # if new.alarm_time < [pos].alarm_time --> insert new alarm at [pos]
-            elif alarm_time < alarm.alarm_time:
-                _LOG.debug(
-                    "Adding new alarm at postion {} in the timeline. Alarm: {}".format(
-                        pos, alarm_time))
-                alarm = ClockAlarm(alarm_time)
-                alarm.add_action(action)
-                self._timeline.insert(pos, alarm)
-                break
-
-            # if we are at the end of the timeline --> append a new alarm at the end
-            elif len(self._timeline) == pos+1:
-                _LOG.debug(
-                    "Adding new alarm at the end of the timeline. Alarm: {}".format(alarm_time))
-                alarm = ClockAlarm(alarm_time)
-                alarm.add_action(action)
-                self._timeline.append(alarm)
-                break
-
-            # else --> pos++ and loop again
-
-        _LOG.debug(self._format_timeline())
+                ("Found match of existing alarm, adding to its list of actions. "
+                    + "Length: {}").format(len(alarm.actions)+1))
+        alarm.add_action(action)
+        self._index[key] = alarm
+
+        self.stats["alarms"] = len(self._alarms)
+        self._rearm_for(alarm_time)
+
+    def _add_action_to_table(self, action: AlarmTimeSpecAction, nowtime: datetime.datetime):
+        # An action is in the clock only once, so re-adding an ID moves it
+        key = _action_key(action)
+        self.remove_timespec_action(key)
+
+        tz_name = action.timespec.tz_name
+        table = self._tables.get(tz_name)
+        if table is None:
+            table = self._tables[tz_name] = cron.CronTable()
+        table.add(key, action.timespec.schedule, action)
+        self._table_index[key] = tz_name
+        self.stats["table_rows"] = len(self._table_index)
+
+        if self._table_next is None:
+            self._table_next = _floor_minute(nowtime) + _ONE_MINUTE
+            self._rearm_for(self._table_next)
+
+    def _remove_action_from_table(self, key):
+        tz_name = self._table_index.pop(key)
+        table = self._tables[tz_name]
+        table.remove(key)
+        if not len(table):
+            del self._tables[tz_name]
+            self._table_last.pop(tz_name, None)
+        if not self._table_index:
+            self._table_next = None
+        self.stats["table_rows"] = len(self._table_index)
+
+    def _match_tables(self, first_minute: datetime.datetime, last_minute: datetime.datetime,
+                      utcnow: datetime.datetime):
+        '''Starts the actions of the rows due in any minute from first_minute to last_minute'''
+        matched = 0
+        for tz_name, table in list(self._tables.items()):
+            tz = helpers.get_timezone(tz_name)
+            actions = {}    # action key -> action, so a row due in several minutes fires once
+            minute_time = first_minute
+            while minute_time <= last_minute:
+                localtime = minute_time.astimezone(tz).replace(tzinfo=None)
+                minute_time += _ONE_MINUTE
+                if localtime <= self._table_last.get(tz_name, localtime - _ONE_MINUTE):
+                    continue    # A wall time repeated by a DST change fires once
+                self._table_last[tz_name] = localtime
+                for action in table.match(localtime):
+                    actions.setdefault(_action_key(action), action)
+
+            matched += len(actions)
+            self._start_actions(list(actions.values()))
+
+        if matched:
+            self.stats["table_matched"] += matched
+            self._record_lateness(utcnow, first_minute)
+
+    def _start_actions(self, actions: list):
+        if len(actions) > self.stats["peak_burst"]:
+            self.stats["peak_burst"] = len(actions)
+
+        for action in actions:
+            delay_secs = self._get_spread_offset(action)
+            if delay_secs <= 0:
+                self._start_action(action)
+                continue
+
+            key = _action_key(action)
+            token = next(self._seq)
+            self._spread_handles.setdefault(key, {})[token] = self._loop.call_later(
+                delay_secs, self._start_spread_action, action, key, token)
+            self.stats["spread_actions"] += 1
+            self.stats["spread_pending"] += 1
+
+    def _start_action(self, action: AlarmAction):
+        _LOG.debug("Running alarm action")
+        self._starts.mark()
+        # This is where we create the coroutine object from the action
+        # function reference - note the () on action_function
+        self._loop.create_task(action.action_function())
+
+    def _start_spread_action(self, action: AlarmAction, key, token):
+        handles = self._spread_handles[key]
+        del handles[token]
+        if not handles:
+            del self._spread_handles[key]
+        self.stats["spread_pending"] -= 1
+        self._start_action(action)
+
+    def _get_spread_offset(self, action: AlarmAction) -> float:
+        '''Returns the seconds to delay the action by, from 0 up to the spread window'''
+        if not isinstance(action, AlarmTimeSpecAction):
+            return 0
+        window = action.timespec.spread
+        if window is None:
+            window = self._spread_secs
+        window_ms = int(window * 1000) if window else 0
+        if window_ms <= 0:
+            return 0
+        return zlib.crc32(str(action.spread_key).encode("utf-8")) % window_ms / 1000
+
+    def _loop_time(self) -> float:
+        return self._loop.time()
+
+    def _rearm_for(self, wake_time: datetime.datetime):
+        if self._armed and (self._wake_time is None or wake_time < self._wake_time):
+            self._arm()     # The new alarm is earlier than the wakeup
+
+    def _remove_alarm(self, alarm: ClockAlarm):
+        alarm.removed = True
+        del self._alarms[alarm.alarm_time]
+        self._removed += 1
+        self.stats["alarms"] = len(self._alarms)
+        if self._removed > len(self._heap) * COMPACT_RATIO:
+            self._heap = [entry for entry in self._heap if not entry[2].removed]
+            heapq.heapify(self._heap)
+            self._removed = 0
+
+    def _next_alarm_time(self) -> datetime.datetime:
+        while self._heap[0][2].removed:
+            heapq.heappop(self._heap)
+            self._removed -= 1
+        return self._heap[0][0]
+
+    def _arm(self):
+        '''Schedules the wakeup of the run loop at the earliest alarm'''
+        self._disarm()
+        if not self._alarms and self._table_next is None:
+            self.stats["next_alarm"] = None
+            return
+
+        self._wake_time = min(
+            t for t in [self._next_alarm_time() if self._alarms else None, self._table_next]
+            if t is not None)
+        self.stats["next_alarm"] = str(self._wake_time)
+        delay_secs = (self._wake_time - helpers.nowutc()).total_seconds()
+        delay_secs = min(max(delay_secs, 0), MAX_SLEEP_SECONDS)
+        self._wake_handle = self._loop.call_at(self._loop.time() + delay_secs, self._wake)
+
+    def _disarm(self):
+        if self._wake_handle is not None:
+            self._wake_handle.cancel()
+        self._wake_handle = None
+        self._wake_time = None
+
+    def _wake(self):
+        self._wake_handle = None
+        self._wake_time = None
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _record_lateness(self, utcnow: datetime.datetime, alarm_time: datetime.datetime):
+        lateness_ms = max((utcnow - alarm_time).total_seconds() * 1000, 0.0)
+        self.stats["fired"] += 1
+        if lateness_ms > self.stats["max_lateness_ms"]:
+            self.stats["max_lateness_ms"] = lateness_ms
+        histogram = self.stats["lateness_ms"]
+        for bound in LATENESS_BUCKETS_MS:
+            if lateness_ms <= bound:
+                histogram["<={}".format(bound)] += 1
+                return
+        histogram[">{}".format(LATENESS_BUCKETS_MS[-1])] += 1
 
     def _format_timeline(self) -> str:
         p = "Printing clock alarm timeline..."
-        for alarm in self._timeline:
-            p += "\nAlarm: {}".format(alarm.alarm_time.astimezone(pytz.timezone(self._tz_name)))
+        localtz = helpers.get_timezone(self._tz_name)
+        for alarm in self.timeline:
+            p += "\nAlarm: {}".format(alarm.alarm_time.astimezone(localtz))
             for i, action in enumerate(alarm.actions):
                 if isinstance(action, AlarmTimeSpecAction):
                     p += "\n   Action {}: {}".format(i, action.id)
                 else:
                     p += "\n   Action: {}".format(action)
         return p
+
+
+def _action_key(action: AlarmAction):
+    '''TimeSpec actions are keyed by their ID, other actions by themselves'''
+    return getattr(action, "id", action)
+
+
+def _new_histogram() -> dict:
+    histogram = {"<={}".format(bound): 0 for bound in LATENESS_BUCKETS_MS}
+    histogram[">{}".format(LATENESS_BUCKETS_MS[-1])] = 0
+    return histogram
+
+
+def _floor_minute(dt: datetime.datetime) -> datetime.datetime:
+    return dt.replace(second=0, microsecond=0)
@@ -0,0 +1,33 @@
+import asyncio
+import logging
+import traceback
+
+from ottoengine import ingest_queue
+from ottoengine.fibers import Fiber
+
+_LOG = logging.getLogger(__name__)
+# _LOG.setLevel(logging.DEBUG)
+
+
+class EventDispatcher(Fiber):
+    '''Takes events off the ingest queue, and hands them to the engine one at a time'''
+
+    def __init__(self, engine, queue: ingest_queue.IngestQueue):
+        super().__init__()
+        self._engine = engine
+        self._queue = queue
+
+    async def _async_run(self):
+        while self._running:
+            event = await self._queue.async_get()
+            try:
+                if isinstance(event, ingest_queue.StateUpdate):
+                    self._engine.process_state_only(event.entity_id, event.new_state_dict)
+                else:
+                    self._engine.process_event(event)
+            except Exception as e:
+                _LOG.error("Exception processing event {}: {}".format(event.event_type, str(e)))
+                traceback.print_exc()
+
+            # Let the other fibers run between events, so a burst can't starve the clock
+            await asyncio.sleep(0)
@@ -1,15 +1,18 @@
 import asyncio
-import json
 import logging
+import random
 import traceback
 
-from ottoengine import const
+from ottoengine import const, helpers
 from ottoengine.model import dataobjects
 from ottoengine.fibers import Fiber
 
 _LOG = logging.getLogger(__name__)
 # _LOG.setLevel(logging.DEBUG)
 
+RECONNECT_MIN_SECS = 0.5    # Delay before the first reconnect attempt
+RECONNECT_MAX_SECS = 60     # The delay doubles on every failed attempt, up to this
+
 
 class HassWebSocketReader(Fiber):
 
@@ -17,11 +20,17 @@ class HassWebSocketReader(Fiber):
         super().__init__()
         self._engine = engine
         self._socket = websocket
+        self._codec = websocket.codec
+        self._connected_event = asyncio.Event()
 
     @property
     def connected(self) -> bool:
         return self._socket.connected
 
+    async def async_wait_connected(self):
+        '''Waits until the websocket is connected'''
+        await self._connected_event.wait()
+
     async def _async_run(self):
         # Connect the websocket
         await self._connect()
@@ -40,12 +49,16 @@ class HassWebSocketReader(Fiber):
 
     async def _connect(self):
         # Wait until connected (does not need to be authenticated to read)
+        attempt = 0
         connected = await self._socket.async_connect()
         while not connected:
-            _LOG.debug("Websocket is not connected")
-            await asyncio.sleep(3)
+            delay = get_backoff_delay(attempt)
+            attempt += 1
+            _LOG.info("Websocket is not connected, retrying in {:.1f}s".format(delay))
+            await asyncio.sleep(delay)
             connected = await self._socket.async_connect()
         _LOG.info("Websocket is connected")
+        self._connected_event.set()
 
     async def _read(self):
         while self._running and self._socket.connected:
@@ -57,10 +70,9 @@ class HassWebSocketReader(Fiber):
                 _LOG.error(message)
                 raise Exception(message)
 
-            _LOG.debug("Websocket read: {}".format(raw_msg))
             try:
-                msg = json.loads(raw_msg)
-            except json.JSONDecodeError as e:
+                msg = self._codec.decode(raw_msg)
+            except ValueError as e:
                 _LOG.error("Websocket message failed to parse as JSON: {}".format(raw_msg))
                 continue
 
@@ -73,6 +85,7 @@ class HassWebSocketReader(Fiber):
 
             if "pong" in response_type:
                 _LOG.debug("Websocket PONG received")
+                self._socket.resolve_response(msg)
                 continue
 
             elif "auth_ok" in response_type:
@@ -81,63 +94,66 @@ class HassWebSocketReader(Fiber):
 
             # Response to a message sent by Otto Engine
             elif "result" in response_type:
-                await _process_result_response(self._engine, msg)
+                _process_result_response(self._socket, msg)
 
             # Event notification from Home Assistant
             elif "event" in response_type:
                 await _process_event_response(self._engine, msg)
 
 
-async def _process_result_response(engine_obj, msg: dict):
-    if not msg["success"]:
-        _LOG.warning("Websocket error response: {}".format(msg))
-        return
-
-    msg_result = msg["result"]
-
-    # States response
-    if isinstance(msg_result, list):
-
-        for state_dict in msg_result:
-            state = dataobjects.EntityState(
-                state_dict[const.ENTITY_ID],
-                state_dict[const.STATE],
-                state_dict[const.ATTRIBUTES],
-                state_dict[const.LAST_CHANGED],
-                state_dict.get("attributes").get("friendly_name"),
-                state_dict.get("attributes").get("hidden")
-            )
-
-            # Update state if it doesn't match the engine's state
-            existing_state = engine_obj.states.get_entity_state(state.entity_id)
-
-            if not existing_state or not existing_state.is_equal(state):
-                engine_obj.states.set_entity_state(state.entity_id, state)
-                _LOG.debug(
-                    "Updating the engine's state for: {}".format(state.entity_id))
-            else:
-                pass
+def get_backoff_delay(attempt: int) -> float:
+    '''Exponential backoff with full jitter, so many clients don't reconnect in lockstep'''
+    # The exponent is capped (0.5s * 2**8 is past the max), so a long outage can't overflow
+    return random.uniform(RECONNECT_MIN_SECS,
+                          min(RECONNECT_MAX_SECS, RECONNECT_MIN_SECS * 2 ** min(attempt, 8)))
+
 
-    # Services response
-    elif isinstance(msg_result, dict):
+def _process_result_response(websocket, msg: dict):
+    if not msg.get("success"):
+        _LOG.warning("Websocket error response: {}".format(msg))
 
-        for domain_key in msg_result:
-            service_dicts = msg_result.get(domain_key)
-            service_domain = dataobjects.ServiceRegistration.from_websocket_dict(
-                domain_key, service_dicts)
-            _LOG.debug("Registering service: {}".format(service_domain))
-            engine_obj.states.set_service_info(service_domain)
+    # Hand the result to whoever sent the request
+    websocket.resolve_response(msg)
 
 
 async def _process_event_response(engine_obj, msg: dict):
     event_obj = msg.get("event")
+    if "variables" in event_obj:
+        # A state trigger fired for an entity subscribed with subscribe_trigger
+        event_obj = _trigger_to_state_changed(event_obj)
+    event_type = event_obj.get("event_type")
 
     # State Changed Event
-    if event_obj.get("event_type") in "state_changed":
+    if event_type == const.STATE_CHANGED:
+        data = event_obj["data"]
+        if not engine_obj.relevance.is_trigger_entity(data[const.ENTITY_ID]):
+            # No rule triggers on this entity, so only keep its state current
+            await engine_obj.async_ingest_state_only(data[const.ENTITY_ID], data["new_state"])
+            return
         event = dataobjects.StateChangedEvent.from_websocket_dict(event_obj)
 
     # Else it's something else
     else:
+        if not engine_obj.relevance.is_trigger_event(event_type):
+            return
         event = dataobjects.HassEvent.from_websocket_dict(event_obj)
 
-    engine_obj.process_event(event)
+    await engine_obj.async_ingest_event(event)
+
+
+def _trigger_to_state_changed(event_obj: dict) -> dict:
+    '''Rewrites the variables of a state trigger event as a state_changed event'''
+    trigger = event_obj["variables"]["trigger"]
+    to_state = trigger.get("to_state")
+    from_state = trigger.get("from_state")
+    changed = to_state or from_state or {}
+    return {
+        "event_type": const.STATE_CHANGED,
+        "data": {
+            const.ENTITY_ID: trigger[const.ENTITY_ID],
+            "old_state": from_state,
+            "new_state": to_state,
+        },
+        "origin": "LOCAL",
+        "time_fired": changed.get("last_updated") or helpers.nowutc().isoformat()
+    }
@@ -9,6 +9,10 @@
 # {"id": 2, "type": "unsubscribe_events", "subscription": 1}
 # > {"id": 2, "type": "result", "success": true, "result": null}
 
+# {"id": 4, "type": "subscribe_trigger", "trigger": {"platform": "state", "entity_id": "input_boolean.action_light"}}
+# > {"id": 4, "type": "result", "success": true, "result": null}
+# > {"id": 4, "type": "event", "event": {"variables": {"trigger": {"id": "0", "idx": "0", "platform": "state", "entity_id": "input_boolean.action_light", "from_state": {"entity_id": "input_boolean.action_light", "state": "on", "attributes": {}, "last_changed": "2017-05-06T01:08:38.324629+00:00", "last_updated": "2017-05-06T01:08:38.324629+00:00"}, "to_state": {"entity_id": "input_boolean.action_light", "state": "off", "attributes": {}, "last_changed": "2017-05-06T01:08:39.451397+00:00", "last_updated": "2017-05-06T01:08:39.451397+00:00"}, "for": null, "attribute": null, "description": "state of input_boolean.action_light"}}, "context": {"id": "01E8Z4G5TK3SM7W5KBRGXS4EE1", "parent_id": null, "user_id": null}}}
+
 
 # {"id": 3, "type": "call_service", "domain": "input_boolean", "service": "toggle", "service_data": {"entity_id": "input_boolean.action_siren"}}
 # > {"id": 3, "type": "result", "success": true, "result": null}
@@ -22,13 +26,19 @@
 # {"id": 12, "type": "ping"}
 # > {"id": 12, "type": "pong"}
 
-import asyncws
+import asyncio
 import ssl
-import json
 import logging
+import time
+
+from ottoengine import json_codec, websocket_protocol
 
 EVENT_STATE_CHANGED = 'state_changed'
 
+DEFAULT_REQUEST_TIMEOUT_SECS = 30   # Seconds to wait for the response to a command
+DEFAULT_MAX_INFLIGHT = 64           # Commands that can be awaiting a response at once
+
+
 _LOG = logging.getLogger(__name__)
 # _LOG.setLevel(logging.DEBUG)
 
@@ -40,17 +50,46 @@ class WebSocketError(Exception):
         super().__init__(message)
 
 
+class PendingRequest(object):
+    '''A command sent to Home Assistant that is waiting for its response'''
+
+    def __init__(self, msg_id: int, future: asyncio.Future, timeout_handle):
+        self.msg_id = msg_id
+        self.future = future
+        self.timeout_handle = timeout_handle
+        self.sent_at = time.monotonic()
+
+
 class AsyncHassWebsocket(object):
 
-    def __init__(self, host, port, token=None, use_ssl=False):
+    def __init__(self, host, port, token=None, use_ssl=False, codec=None,
+                 request_timeout=DEFAULT_REQUEST_TIMEOUT_SECS, max_inflight=DEFAULT_MAX_INFLIGHT,
+                 compress=True):
         self._url = 'ws://{}:{}/api/websocket'.format(host, port)
         self._token = token
         self._use_ssl = use_ssl
+        self._compress = compress   # Offer permessage-deflate when connecting
+        self._codec = codec if codec is not None else json_codec.get_codec()
         self._socket = None
         self._socket_connected = False
         self._socket_authenticated = False
         self._id = 0
 
+        # Request/response correlation
+        self._request_timeout = request_timeout
+        self._pending = {}      # msg_id -> PendingRequest
+        self._inflight = asyncio.Semaphore(max_inflight)
+        self._stats = {
+            "requests": 0,
+            "responses": 0,
+            "failures": 0,      # Responses with success: false
+            "timeouts": 0,
+            "inflight": 0,
+            "rtt_last_ms": None,
+            "rtt_max_ms": None,
+            "rtt_total_ms": 0.0,
+        }
+
     @property
     def connected(self):
         return self._socket_connected
@@ -59,6 +98,18 @@ class AsyncHassWebsocket(object):
     def authenticated(self):
         return self._socket_authenticated
 
+    @property
+    def codec(self) -> json_codec.JsonCodec:
+        return self._codec
+
+    @property
+    def stats(self) -> dict:
+        '''
+        Request counters and round-trip times of the commands sent on this websocket,
+        and the bytes sent and received, on the wire and uncompressed
+        '''
+        return self._stats
+
     def set_authenticated(self, authenticated):
         self._socket_authenticated = authenticated
 
@@ -80,7 +131,8 @@ class AsyncHassWebsocket(object):
             ssl_context.check_hostname = False
 
         try:
-            self._socket = await asyncws.connect(self._url, ssl=ssl_context)
+            self._socket = await websocket_protocol.async_connect(
+                self._url, ssl=ssl_context, compress=self._compress, stats=self._stats)
         except Exception as e:
             _LOG.error("Could not connect to websocket: {}".format(str(e)))
             return False
@@ -98,7 +150,10 @@ class AsyncHassWebsocket(object):
         if force:
             self._socket.writer.close()
         else:
-            self._socket.close()
+            await self._socket.close()
+        self._socket_connected = False
+        self._socket_authenticated = False
+        self._fail_pending(WebSocketError("Websocket closed"))
 
     async def async_authenticate(self):
         '''
@@ -106,52 +161,101 @@ class AsyncHassWebsocket(object):
         This method does not read the success/failure response.  That must
         be done by the websocket reader.
         '''
-        await self._socket.send(json.dumps({"type": "auth", "access_token": self._token}))
+        await self._async_send({"type": "auth", "access_token": self._token})
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    #   Commands
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    # Each command returns an asyncio.Future once the command has been sent.
+    # The future is resolved with the response message (a dict) when the websocket
+    # reader receives it, or fails with asyncio.TimeoutError if no response arrives in time.
+    # Awaiting the command only waits for the send; awaiting the future waits for the result.
+
+    async def async_send_command(self, message: dict, timeout=None) -> asyncio.Future:
+        '''
+        Sends a command and returns the future of its response.
+
+        If the in-flight window is full, this waits for a response before sending.
+        '''
+        if timeout is None:
+            timeout = self._request_timeout
+
+        await self._inflight.acquire()
+        loop = asyncio.get_event_loop()
+
+        msg_id = self._nextid()
+        message["id"] = msg_id
+        future = loop.create_future()
+        self._pending[msg_id] = PendingRequest(
+            msg_id, future, loop.call_later(timeout, self._expire_request, msg_id))
+        self._stats["requests"] += 1
+        self._stats["inflight"] = len(self._pending)
+
+        try:
+            await self._async_send(message)
+        except Exception as e:
+            self._finish_request(msg_id)
+            raise WebSocketError("Error sending command {}: {}".format(msg_id, str(e)))
+        return future
 
-    async def async_ping(self):
+    async def async_ping(self) -> asyncio.Future:
         '''Sends a ping message to the server'''
         if self._socket_authenticated:
-            await self._socket.send(json.dumps({"id": self._nextid(), "type": "ping"}))
+            return await self.async_send_command({"type": "ping"})
 
-    async def async_subscribe_events(self, event_type):
+    async def async_subscribe_events(self, event_type) -> asyncio.Future:
         '''Subscribe to all events of type: event_type'''
         # event_type is optional.  If omitted, all events will be subscribed to
         _LOG.debug("Websocket subscribing to events of type: {}".format(event_type))
-        await self._socket.send(
-            json.dumps(
-                {
-                    'id': self._nextid(),
-                    'type': 'subscribe_events',
-                    'event_type': event_type
-                }
-            )
+        return await self.async_send_command(
+            {
+                'type': 'subscribe_events',
+                'event_type': event_type
+            }
         )
 
-    async def async_get_all_state(self):
+    async def async_subscribe_trigger(self, trigger: dict) -> asyncio.Future:
+        '''
+        Subscribe to a Home Assistant trigger, i.e. {"platform": "state", "entity_id": ...}
+        The subscription ID is the id of the result message.
+        '''
+        _LOG.debug("Websocket subscribing to trigger: {}".format(trigger))
+        return await self.async_send_command(
+            {
+                'type': 'subscribe_trigger',
+                'trigger': trigger
+            }
+        )
+
+    async def async_unsubscribe_events(self, subscription_id: int) -> asyncio.Future:
+        '''Remove a subscription made by subscribe_events or subscribe_trigger'''
+        _LOG.debug("Websocket unsubscribing from subscription: {}".format(subscription_id))
+        return await self.async_send_command(
+            {
+                'type': 'unsubscribe_events',
+                'subscription': subscription_id
+            }
+        )
+
+    async def async_get_all_state(self) -> asyncio.Future:
         '''Retrieve all the state objects from Home Assistant.'''
         _LOG.debug("Websocket requesting all state from Home Assistant")
-        await self._socket.send(
-            json.dumps(
-                {
-                    'id': self._nextid(),
-                    'type': 'get_states'
-                }
-            )
+        return await self.async_send_command(
+            {
+                'type': 'get_states'
+            }
         )
 
-    async def async_get_all_services(self):
+    async def async_get_all_services(self) -> asyncio.Future:
         '''Retrieve all the services registered from Home Assistant.'''
         _LOG.debug("Websocket requesting all registered services from Home Assistant")
-        await self._socket.send(
-            json.dumps(
-                {
-                    'id': self._nextid(),
-                    'type': 'get_services'
-                }
-            )
+        return await self.async_send_command(
+            {
+                'type': 'get_services'
+            }
         )
 
-    async def async_call_service(self, service_call_info):
+    async def async_call_service(self, service_call_info) -> asyncio.Future:
         # {
         #     "id": 3,
         #     "type": "call_service",
@@ -164,24 +268,73 @@ class AsyncHassWebsocket(object):
         _LOG.debug("Websocket calling service: {}.{} with {}".format(
             service_call_info.domain, service_call_info.service, service_call_info.service_data)
         )
-        await self._socket.send(
-            json.dumps(
-                {
-                    'id': self._nextid(),
-                    'type': 'call_service',
-                    'domain': service_call_info.domain,
-                    'service': service_call_info.service,
-                    'service_data': service_call_info.service_data
-                }
-            )
+        return await self.async_send_command(
+            {
+                'type': 'call_service',
+                'domain': service_call_info.domain,
+                'service': service_call_info.service,
+                'service_data': service_call_info.service_data
+            }
         )
 
+    def resolve_response(self, msg: dict):
+        '''Called by the websocket reader with each result (or pong) message received'''
+        pending = self._finish_request(msg.get("id"))
+        if pending is None:
+            _LOG.debug("Websocket response for an unknown request: {}".format(msg.get("id")))
+            return
+
+        rtt_ms = (time.monotonic() - pending.sent_at) * 1000
+        self._stats["responses"] += 1
+        self._stats["rtt_last_ms"] = rtt_ms
+        self._stats["rtt_total_ms"] += rtt_ms
+        if self._stats["rtt_max_ms"] is None or rtt_ms > self._stats["rtt_max_ms"]:
+            self._stats["rtt_max_ms"] = rtt_ms
+        if msg.get("success") is False:
+            self._stats["failures"] += 1
+
+        if not pending.future.done():
+            pending.future.set_result(msg)
+
     async def async_receive(self) -> str:
         '''Receive a message from the websocket'''
         message = await self._socket.recv()
-        _LOG.debug("Websocket read: {}".format(message))
+        if _LOG.isEnabledFor(logging.DEBUG):
+            _LOG.debug("Websocket read: {}".format(message))
         return message
 
+    # ~~~~~~~~~~~~~~~~~~~~
+    #   Private methods
+    # ~~~~~~~~~~~~~~~~~~~~
+
+    async def _async_send(self, message: dict):
+        '''Encode a message with the codec and send it as a text frame'''
+        # Home Assistant only accepts text frames, and the codec already encoded to UTF-8
+        await self._socket.send_text(self._codec.encode(message))
+
+    def _finish_request(self, msg_id) -> PendingRequest:
+        '''Removes a request from the pending table, and frees its in-flight slot'''
+        pending = self._pending.pop(msg_id, None)
+        if pending is not None:
+            pending.timeout_handle.cancel()
+            self._inflight.release()
+            self._stats["inflight"] = len(self._pending)
+        return pending
+
+    def _expire_request(self, msg_id):
+        pending = self._finish_request(msg_id)
+        if pending is not None:
+            _LOG.warning("Websocket request {} timed out".format(msg_id))
+            self._stats["timeouts"] += 1
+            if not pending.future.done():
+                pending.future.set_exception(asyncio.TimeoutError())
+
+    def _fail_pending(self, exception):
+        for msg_id in list(self._pending):
+            pending = self._finish_request(msg_id)
+            if not pending.future.done():
+                pending.future.set_exception(exception)
+
     def _nextid(self):
         '''Return the next request ID to use'''
         self._id += 1
@@ -1,4 +1,6 @@
 import datetime
+import dateutil.parser
+import functools
 import pytz
 
 
@@ -6,6 +8,29 @@ def nowutc() -> datetime.datetime:
     return datetime.datetime.now(pytz.utc)
 
 
+@functools.lru_cache(maxsize=None)
+def get_timezone(tz_name) -> datetime.tzinfo:
+    '''Returns the pytz timezone of the name, shared by every caller in the process'''
+    return pytz.timezone(tz_name)
+
+
+def parse_iso_datetime(value) -> datetime.datetime:
+    """
+        Parses an ISO-8601 timestamp as sent by Home Assistant
+        (i.e. 2017-05-06T01:08:39.451411+00:00).
+
+        The fixed format is decoded by datetime.fromisoformat(), which is much
+        cheaper than dateutil. Anything it does not understand falls back to dateutil.
+
+        :param str value:
+        :rtype: datetime.datetime
+    """
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return dateutil.parser.parse(value)
+
+
 def timedelta_to_dict(delta) -> dict:
     """
         :param datetime.timedelta delta:
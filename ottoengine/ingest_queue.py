@@ -0,0 +1,186 @@
+import asyncio
+import collections
+import fnmatch
+import logging
+
+from ottoengine import const
+from ottoengine.model import dataobjects
+
+_LOG = logging.getLogger(__name__)
+# _LOG.setLevel(logging.DEBUG)
+
+# Overload policies, applied when an event arrives and the queue is full
+POLICY_BLOCK = "block"              # The reader waits until the dispatcher makes room
+POLICY_DROP_OLDEST = "drop_oldest"  # The oldest queued event is dropped
+POLICY_COALESCE = "coalesce"        # A queued state change of the same entity is updated
+POLICIES = [POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_COALESCE]
+
+
+class IngestQueue(object):
+    '''
+    Bounded queue of events, between the websocket reader and the event dispatcher.
+
+    Coalescing a state change into a queued state change of the same entity makes one
+    synthetic event, with the queued event's old state and the new event's new state,
+    so the dispatcher still sees the entity's transition from the first queued state.
+
+    - With the coalesce policy, this happens when the queue is full.  Events that cannot
+      be coalesced wait for room, like the block policy.
+    - Entities matching coalesce_patterns are always collapsed while they are queued.
+      A pattern is an fnmatch pattern of entity IDs (sensor.*_power), or a domain (sensor).
+    '''
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int = 1000,
+                 policy: str = POLICY_BLOCK, coalesce_patterns: list = None):
+        if policy not in POLICIES:
+            _LOG.warning("Unknown ingest queue policy {}, using {}".format(policy, POLICY_BLOCK))
+            policy = POLICY_BLOCK
+
+        self._loop = loop
+        self._maxsize = maxsize
+        self._policy = policy
+        self._coalesce_patterns = [
+            p if "." in p else "{}.*".format(p) for p in (coalesce_patterns or [])]
+        self._coalesce_matches = {}     # entity_id -> bool, cache of the pattern matches
+
+        self._slots = collections.deque()
+        self._entity_slots = {}     # entity_id -> _Slot holding its queued state change
+        self._getter = None         # Future the dispatcher waits on while the queue is empty
+        self._putters = collections.deque()  # Futures of readers waiting for room
+
+        self.stats = {
+            "policy": policy,
+            "maxsize": maxsize,
+            "depth": 0,
+            "max_depth": 0,
+            "received": 0,
+            "dropped": 0,       # Events dropped by the drop_oldest policy
+            "coalesced": 0,     # Events merged into a queued event by the coalesce policy
+            "blocked": 0,       # Times the reader had to wait for room
+            "collapsible": 0,   # State changes received of entities matching a pattern
+            "collapsed": 0,     # Those collapsed into a queued state change
+            "collapse_ratio": 0.0,
+        }
+
+    def __len__(self):
+        return len(self._slots)
+
+    # ~~~~~~~~~~~~~~~~~~~
+    #   Public methods
+    # ~~~~~~~~~~~~~~~~~~~
+
+    async def async_put(self, event: dataobjects.HassEvent):
+        self.stats["received"] += 1
+
+        if self._coalesce_patterns and self._is_collapsible(event):
+            self.stats["collapsible"] += 1
+            collapsed = self._coalesce(event)
+            if collapsed:
+                self.stats["collapsed"] += 1
+            self.stats["collapse_ratio"] = self.stats["collapsed"] / self.stats["collapsible"]
+            if collapsed:
+                return
+
+        if len(self._slots) >= self._maxsize:
+            if self._policy == POLICY_COALESCE and self._coalesce(event):
+                self.stats["coalesced"] += 1
+                return
+            elif self._policy == POLICY_DROP_OLDEST:
+                self._drop_oldest()
+            else:
+                self.stats["blocked"] += 1
+                while len(self._slots) >= self._maxsize:
+                    putter = self._loop.create_future()
+                    self._putters.append(putter)
+                    await putter
+
+        slot = _Slot(event)
+        self._slots.append(slot)
+        if isinstance(event, dataobjects.StateChangedEvent):
+            self._entity_slots[event.entity_id] = slot
+        self._update_depth()
+
+        if self._getter is not None and not self._getter.done():
+            self._getter.set_result(None)
+
+    async def async_get(self) -> dataobjects.HassEvent:
+        while not self._slots:
+            self._getter = self._loop.create_future()
+            await self._getter
+        self._getter = None
+
+        slot = self._slots.popleft()
+        self._forget(slot)
+        self._update_depth()
+        self._wake_putter()
+        return slot.event
+
+    # ~~~~~~~~~~~~~~~~~~~~
+    #   Private methods
+    # ~~~~~~~~~~~~~~~~~~~~
+
+    def _coalesce(self, event) -> bool:
+        if not isinstance(event, dataobjects.StateChangedEvent):
+            return False
+        slot = self._entity_slots.get(event.entity_id)
+        if slot is None:
+            return False
+
+        slot.event = dataobjects.StateChangedEvent(
+            event.entity_id, slot.event.old_state_obj, event.new_state_obj, event._time_fired)
+        return True
+
+    def _is_collapsible(self, event) -> bool:
+        if not isinstance(event, dataobjects.StateChangedEvent):
+            return False
+        match = self._coalesce_matches.get(event.entity_id)
+        if match is None:
+            match = any(fnmatch.fnmatchcase(event.entity_id, p) for p in self._coalesce_patterns)
+            self._coalesce_matches[event.entity_id] = match
+        return match
+
+    def _drop_oldest(self):
+        slot = self._slots.popleft()
+        self._forget(slot)
+        self.stats["dropped"] += 1
+        _LOG.debug("Ingest queue is full, dropped event: {}".format(slot.event.event_type))
+
+    def _forget(self, slot):
+        entity_id = getattr(slot.event, "entity_id", None)
+        if entity_id is not None and self._entity_slots.get(entity_id) is slot:
+            del self._entity_slots[entity_id]
+
+    def _wake_putter(self):
+        while self._putters:
+            putter = self._putters.popleft()
+            if not putter.done():
+                putter.set_result(None)
+                return
+
+    def _update_depth(self):
+        depth = len(self._slots)
+        self.stats["depth"] = depth
+        if depth > self.stats["max_depth"]:
+            self.stats["max_depth"] = depth
+
+
+class StateUpdate(object):
+    '''
+    State change of an entity no rule triggers on, queued so the dispatcher applies it in
+    order with the events around it.  Only the entity's state is updated, so it is never
+    coalesced: its state must not land before the events queued ahead of it.
+    '''
+    __slots__ = ["entity_id", "new_state_dict"]
+    event_type = const.STATE_CHANGED
+
+    def __init__(self, entity_id: str, new_state_dict: dict):
+        self.entity_id = entity_id
+        self.new_state_dict = new_state_dict
+
+
+class _Slot(object):
+    '''Queue entry, so a coalesced event can be replaced without moving it in the queue'''
+    __slots__ = ["event"]
+
+    def __init__(self, event):
+        self.event = event
@@ -0,0 +1,90 @@
+import json
+import logging
+
+_LOG = logging.getLogger(__name__)
+# _LOG.setLevel(logging.DEBUG)
+
+AUTO = "auto"
+
+
+class JsonCodec(object):
+    '''
+    Encodes and decodes the JSON messages exchanged with Home Assistant.
+
+    Every codec encodes to UTF-8 bytes, and decodes either bytes or str.
+    Decoding errors are raised as a ValueError (json.JSONDecodeError is a subclass).
+
+    This base class uses the standard library json module.
+    '''
+    name = "json"
+
+    def encode(self, obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class UjsonCodec(JsonCodec):
+    name = "ujson"
+
+    def __init__(self):
+        import ujson
+        self._ujson = ujson
+
+    # Override
+    def encode(self, obj) -> bytes:
+        return self._ujson.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    # Override
+    def decode(self, data):
+        return self._ujson.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    # Override
+    def encode(self, obj) -> bytes:
+        return self._orjson.dumps(obj)
+
+    # Override
+    def decode(self, data):
+        return self._orjson.loads(data)
+
+
+# Fastest first
+CODECS = [OrjsonCodec, UjsonCodec, JsonCodec]
+
+
+def available_codecs() -> list:
+    '''Returns an instance of every codec whose library can be imported, fastest first'''
+    codecs = []
+    for codec_class in CODECS:
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            _LOG.debug("JSON codec {} is not available".format(codec_class.name))
+    return codecs
+
+
+def get_codec(name: str = AUTO) -> JsonCodec:
+    '''
+    Returns the codec with the given name, or the fastest available codec if the
+    name is "auto" or None.  Falls back to the standard library if the requested
+    codec cannot be imported.
+    '''
+    codecs = available_codecs()
+    if name and name != AUTO:
+        for codec in codecs:
+            if codec.name == name:
+                return codec
+        _LOG.warning("JSON codec {} is not available, using json".format(name))
+        return JsonCodec()
+
+    _LOG.info("Using JSON codec: {}".format(codecs[0].name))
+    return codecs[0]
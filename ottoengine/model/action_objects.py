@@ -1,4 +1,3 @@
-import asyncio
 import logging
 
 from ottoengine import const, helpers
@@ -19,6 +18,11 @@ class RuleActionItem(object):
         # This MAY be overridden by the subclass to accomodate special handling
         return self.get_dict_config()
 
+    def get_entity_ids(self) -> set:
+        '''Returns the set of entity IDs whose state this action reads'''
+        # This MAY be overridden by the subclasses that read entity state
+        return set()
+
     async def async_execute(self, engine) -> bool:
         '''Runs the action.
             Returns True if action was successful.
@@ -48,10 +52,9 @@ class ServiceAction(RuleActionItem):
         _LOG.info("Service called - domain: {}, service: {}, data: {}".format(
             self._domain, self._service, self._data_dict)
         )
-        await engine.call_service(
+        return await engine.call_service(
             dataobjects.ServiceCall(self._domain, self._service, self._data_dict)
         )
-        return True
 
     @staticmethod
     def from_dict(dict_obj):
@@ -86,6 +89,10 @@ class ConditionAction(RuleActionItem):
     def __init__(self, condition_obj):
         self._condition_obj = condition_obj
 
+    @property
+    def condition(self):
+        return self._condition_obj
+
     # No from_dict function since this is just a condition object
     # We use the _condition_from_dict() function in persistence.py instead
 
@@ -93,7 +100,10 @@ class ConditionAction(RuleActionItem):
     async def async_execute(self, engine):
         '''Tests the condition.  Returns the result of the test'''
         result = False
-        if self._condition_obj.evaluate(engine):
+        if self._condition_obj.compiled is not None:
+            if self._condition_obj.compiled(engine.states.entity_states):
+                result = True
+        elif self._condition_obj.evaluate(engine):
             result = True
 
         _LOG.info("Condition action is {}: {}".format(result, self._condition_obj.serialize()))
@@ -103,6 +113,10 @@ class ConditionAction(RuleActionItem):
     def get_dict_config(self) -> dict:
         return self._condition_obj.get_condition_config()
 
+    # Override
+    def get_entity_ids(self) -> set:
+        return self._condition_obj.get_entity_ids()
+
 
 class DelayAction(RuleActionItem):
     # delay: 00:01:30
@@ -114,7 +128,8 @@ class DelayAction(RuleActionItem):
     async def async_execute(self, engine):
         delay_secs = self._delay_delta.total_seconds()
         _LOG.info("Delay action for {} seconds".format(delay_secs))
-        await asyncio.sleep(delay_secs)
+        # The rule run gives its scheduler worker back while it sleeps
+        await engine.scheduler.async_sleep(delay_secs)
         return True
 
     @staticmethod
@@ -2,7 +2,7 @@ import datetime
 import dateutil.parser
 import logging
 import numbers
-import pytz
+import time
 
 from ottoengine import helpers
 
@@ -12,11 +12,18 @@ ATTR_ENTITY_ID = "entity_id"
 _LOG = logging.getLogger(__name__)
 # _LOG.setLevel(logging.DEBUG)
 
+_SUN_ATTRS = {'sunrise': 'next_rising', 'sunset': 'next_setting'}
+
+# Adaptive ordering of and/or subconditions
+SAMPLE_EVERY = 16       # Evaluations between two timed evaluations of every subcondition
+REORDER_EVERY = 32      # Timed evaluations between two reorders
+
 
 class RuleCondition(object):
 
     def __init__(self, condition):
         self._condition = condition
+        self.compiled = None    # Closure built by compile(), evaluates the condition
 
     def get_dict_config(self) -> dict:
         # This will be overridden by the subclasses
@@ -30,6 +37,55 @@ class RuleCondition(object):
         # This will be overridden by the subclasses
         raise NotImplementedError("evaluate() was not properly overridden")
 
+    def get_entity_ids(self) -> set:
+        '''Returns the set of entity IDs whose state this condition reads'''
+        # This MAY be overridden by the subclasses that read entity state
+        return set()
+
+    def is_state_only(self) -> bool:
+        '''Returns True if the condition's result only depends on entity states'''
+        # This MAY be overridden by the subclasses
+        return False
+
+    def get_order_stats(self) -> dict:
+        '''Returns the adaptive ordering statistics of an and/or condition, or None'''
+        # This MAY be overridden by the subclasses
+        return None
+
+    def never_raises(self) -> bool:
+        '''Returns True if the compiled condition cannot raise, whatever the entity states'''
+        # This MAY be overridden by the subclasses
+        return False
+
+    def compile(self, cache=None, adaptive=False):
+        '''
+        Builds, stores in self.compiled and returns a closure equivalent to evaluate().
+
+        The closure takes the engine's entity states dict (entity_id -> EntityState),
+        and returns True if the condition passes.  Debug logging is only compiled in
+        if debug logging was enabled when the condition was compiled.
+
+        With a ConditionCache, the results of the state-only parts of the condition
+        are cached until the state of an entity they read changes.
+
+        If adaptive, and/or conditions periodically time their subconditions, and
+        reorder them so the ones most likely to short-circuit cheaply are checked first.
+        '''
+        func = _compile_cached(self, cache, adaptive)
+        if _LOG.isEnabledFor(logging.DEBUG):
+            func = _compile_debug_log(func, self.serialize())
+        self.compiled = func
+        return func
+
+    def _compile(self, cache, adaptive):
+        # This will be overridden by the subclasses that can be compiled
+        condition = self._condition
+
+        def not_compiled(entity_states) -> bool:
+            raise NotImplementedError(
+                "{} condition does not support evaluation".format(condition))
+        return not_compiled
+
 
 class AndCondition(RuleCondition):
     # condition: and
@@ -40,10 +96,30 @@ class AndCondition(RuleCondition):
     def __init__(self):
         super().__init__("and")
         self._conditions = []     # list of RuleConditions
+        self._order = None        # _AdaptiveOrder of the adaptive compiled closure
+
+    @property
+    def conditions(self) -> list:
+        return self._conditions
 
     def add_condition(self, condition):
         self._conditions.append(condition)
 
+    # Override
+    def get_entity_ids(self) -> set:
+        entity_ids = set()
+        for cond in self._conditions:
+            entity_ids.update(cond.get_entity_ids())
+        return entity_ids
+
+    # Override
+    def is_state_only(self) -> bool:
+        return all(cond.is_state_only() for cond in self._conditions)
+
+    # Override
+    def never_raises(self) -> bool:
+        return all(cond.never_raises() for cond in self._conditions)
+
     # Override
     def get_dict_config(self) -> dict:
         d = {
@@ -54,6 +130,38 @@ class AndCondition(RuleCondition):
             d["conditions"].append(cond.get_dict_config())
         return d
 
+    # Override
+    def _compile(self, cache, adaptive):
+        children = _compile_flat(self, AndCondition, cache, adaptive)
+        if not adaptive:
+            funcs = tuple(func for sub_cond, func in children)
+
+            def and_condition(entity_states) -> bool:
+                for func in funcs:
+                    if not func(entity_states):
+                        return False
+                return True
+            return and_condition
+
+        order = _AdaptiveOrder(children, False)
+        self._order = order
+
+        def adaptive_and_condition(entity_states) -> bool:
+            order.evaluations += 1
+            if order.evaluations % SAMPLE_EVERY == 1:
+                return order.evaluate_sampled(entity_states)
+            for func in order.funcs:
+                if not func(entity_states):
+                    return False
+            return True
+        return adaptive_and_condition
+
+    # Override
+    def get_order_stats(self) -> dict:
+        if self._order is None:
+            return None
+        return self._order.get_stats(self._condition)
+
     # Override
     def evaluate(self, engine) -> bool:
         _LOG.debug("Evaluating AND condtion")
@@ -73,10 +181,30 @@ class OrCondition(RuleCondition):
     def __init__(self):
         super().__init__("or")
         self._conditions = []     # list of RuleConditions
+        self._order = None        # _AdaptiveOrder of the adaptive compiled closure
+
+    @property
+    def conditions(self) -> list:
+        return self._conditions
 
     def add_condition(self, condition):
         self._conditions.append(condition)
 
+    # Override
+    def get_entity_ids(self) -> set:
+        entity_ids = set()
+        for cond in self._conditions:
+            entity_ids.update(cond.get_entity_ids())
+        return entity_ids
+
+    # Override
+    def is_state_only(self) -> bool:
+        return all(cond.is_state_only() for cond in self._conditions)
+
+    # Override
+    def never_raises(self) -> bool:
+        return all(cond.never_raises() for cond in self._conditions)
+
     # Override
     def get_dict_config(self) -> dict:
         d = {
@@ -87,6 +215,38 @@ class OrCondition(RuleCondition):
             d["conditions"].append(cond.get_dict_config())
         return d
 
+    # Override
+    def _compile(self, cache, adaptive):
+        children = _compile_flat(self, OrCondition, cache, adaptive)
+        if not adaptive:
+            funcs = tuple(func for sub_cond, func in children)
+
+            def or_condition(entity_states) -> bool:
+                for func in funcs:
+                    if func(entity_states):
+                        return True
+                return False
+            return or_condition
+
+        order = _AdaptiveOrder(children, True)
+        self._order = order
+
+        def adaptive_or_condition(entity_states) -> bool:
+            order.evaluations += 1
+            if order.evaluations % SAMPLE_EVERY == 1:
+                return order.evaluate_sampled(entity_states)
+            for func in order.funcs:
+                if func(entity_states):
+                    return True
+            return False
+        return adaptive_or_condition
+
+    # Override
+    def get_order_stats(self) -> dict:
+        if self._order is None:
+            return None
+        return self._order.get_stats(self._condition)
+
     # Override
     def evaluate(self, engine) -> bool:
         for cond in self._conditions:
@@ -139,6 +299,14 @@ class NumericStateCondition(RuleCondition):
             j.get("below_value")
         )
 
+    # Override
+    def is_state_only(self) -> bool:
+        return True
+
+    # Override
+    def get_entity_ids(self) -> set:
+        return {self._entity_id}
+
     # Override
     def get_dict_config(self) -> dict:
         d = {
@@ -151,6 +319,24 @@ class NumericStateCondition(RuleCondition):
             d["below_value"] = self._below_value
         return d
 
+    # Override
+    def _compile(self, cache, adaptive):
+        entity_id = self._entity_id
+        above_value = self._above_value
+        below_value = self._below_value
+
+        # Like evaluate(), a missing entity or a non-numeric state raises an exception
+        if below_value is None:
+            def numeric_state_condition(entity_states) -> bool:
+                return float(entity_states.get(entity_id).state) > above_value
+        elif above_value is None:
+            def numeric_state_condition(entity_states) -> bool:
+                return float(entity_states.get(entity_id).state) < below_value
+        else:
+            def numeric_state_condition(entity_states) -> bool:
+                return above_value < float(entity_states.get(entity_id).state) < below_value
+        return numeric_state_condition
+
     # Override
     def evaluate(self, engine) -> bool:
         _LOG.debug(
@@ -190,6 +376,18 @@ class StateCondition(RuleCondition):
         }
         return StateCondition(**kwargs)
 
+    # Override
+    def is_state_only(self) -> bool:
+        return True
+
+    # Override
+    def never_raises(self) -> bool:
+        return True
+
+    # Override
+    def get_entity_ids(self) -> set:
+        return {self._entity_id}
+
     # Override
     def get_dict_config(self) -> dict:
         return {
@@ -198,6 +396,16 @@ class StateCondition(RuleCondition):
             "state": self._state
         }
 
+    # Override
+    def _compile(self, cache, adaptive):
+        entity_id = self._entity_id
+        state = self._state
+
+        def state_condition(entity_states) -> bool:
+            state_obj = entity_states.get(entity_id)
+            return state_obj is not None and state_obj.state == state
+        return state_condition
+
     # Override
     def evaluate(self, engine) -> bool:
         current_state = engine.states.get_entity_state(self._entity_id)
@@ -234,6 +442,31 @@ class SunCondition(RuleCondition):
             raise helpers.ValidationError(
                 "SunCondition: before and after cannot both be specified")
 
+    # Override
+    def _compile(self, cache, adaptive):
+        entity_id = self._entity_id
+        before_attr = _SUN_ATTRS.get(self._before)
+        after_attr = _SUN_ATTRS.get(self._after)
+        before_offset = self._before_offset or datetime.timedelta(0)
+        after_offset = self._after_offset or datetime.timedelta(0)
+        parse = dateutil.parser.parse
+        nowutc = helpers.nowutc
+
+        def sun_condition(entity_states) -> bool:
+            now = nowutc()
+            attributes = entity_states.get(entity_id).attributes
+            # Parse both, like evaluate(), so a missing attribute raises the same way
+            sun_times = {
+                'next_rising': parse(attributes.get('next_rising')),
+                'next_setting': parse(attributes.get('next_setting'))
+            }
+            if before_attr is not None and now > sun_times[before_attr] + before_offset:
+                return False
+            if after_attr is not None and now < sun_times[after_attr] + after_offset:
+                return False
+            return True
+        return sun_condition
+
     # Override
     def evaluate(self, engine) -> bool:
         now = helpers.nowutc()  # datetime.datetime
@@ -281,6 +514,10 @@ class SunCondition(RuleCondition):
             kwargs["before_offset"] = j["before_offset"]
         return SunCondition(**kwargs)
 
+    # Override
+    def get_entity_ids(self) -> set:
+        return {self._entity_id}
+
     # Override
     def get_dict_config(self) -> dict:
         d = {
@@ -367,6 +604,40 @@ class TimeCondition(RuleCondition):
             d["weekday"] = self._weekday_list
         return d
 
+    # Override
+    def _compile(self, cache, adaptive):
+        evaluate_at = self.compile_at()
+        nowutc = helpers.nowutc
+
+        def time_condition(entity_states) -> bool:
+            return evaluate_at(nowutc())
+        return time_condition
+
+    def compile_at(self):
+        '''Returns a closure equivalent to evaluate_at()'''
+        after_time = self._after_time_naive or datetime.time(0)
+        before_time = self._before_time_naive or datetime.time(23, 59, 59, 999999)
+        weekdays = None if self._weekday_list is None else frozenset(self._weekday_list)
+        localtz = helpers.get_timezone(self._tz_name)
+        localize = localtz.localize
+        combine = datetime.datetime.combine
+        day_of_week_xxx = helpers.day_of_week_xxx
+
+        def time_condition_at(eval_dt) -> bool:
+            eval_dt_local = eval_dt.astimezone(localtz)
+            eval_date_local = eval_dt_local.date()
+            after_dt = localize(combine(eval_date_local, after_time))
+            before_dt = localize(combine(eval_date_local, before_time))
+
+            if after_dt < before_dt:
+                if not (after_dt <= eval_dt < before_dt):
+                    return False
+            elif before_dt <= eval_dt < after_dt:
+                return False
+
+            return weekdays is None or day_of_week_xxx(eval_dt_local) in weekdays
+        return time_condition_at
+
     # Override
     def evaluate(self, engine) -> bool:
         return self.evaluate_at(helpers.nowutc())
@@ -406,7 +677,7 @@ class TimeCondition(RuleCondition):
             self._before_time_naive = datetime.time(23, 59, 59, 999999)
 
         # Convert eval_dt to condition tz, then get its date()
-        localtz = pytz.timezone(self._tz_name)       # datetime.tzinfo
+        localtz = helpers.get_timezone(self._tz_name)       # datetime.tzinfo
         eval_dt_local = eval_dt.astimezone(localtz)  # datetime.datetime
         eval_date_local = eval_dt_local.date()       # datetime.date
 
@@ -462,6 +733,18 @@ class ZoneCondition(RuleCondition):
         }
         return ZoneCondition(**kwargs)
 
+    # Override
+    def is_state_only(self) -> bool:
+        return True
+
+    # Override
+    def never_raises(self) -> bool:
+        return True
+
+    # Override
+    def get_entity_ids(self) -> set:
+        return {self._entity_id}
+
     # Override
     def get_dict_config(self) -> dict:
         d = {
@@ -472,7 +755,147 @@ class ZoneCondition(RuleCondition):
         return d
 
     # Override
-    def evaluate(self, states) -> bool:
-        if self._zone == states.get_entity_state(self._entity_id):
+    def _compile(self, cache, adaptive):
+        entity_id = self._entity_id
+        zone = self._zone
+
+        def zone_condition(entity_states) -> bool:
+            return zone == entity_states.get(entity_id)
+        return zone_condition
+
+    # Override
+    def evaluate(self, engine) -> bool:
+        if self._zone == engine.states.get_entity_state(self._entity_id):
             return True
         return False
+
+
+def _compile_cached(cond, cache, adaptive):
+    '''Compiles cond, cached if it is the largest state-only part of the tree'''
+    if cache is None or not cond.is_state_only():
+        return cond._compile(cache, adaptive)
+    func = cond._compile(None, adaptive)
+    # A single state lookup is as cheap as the cache lookup
+    if isinstance(cond, (StateCondition, ZoneCondition)):
+        return func
+    return cache.wrap(func, cond.get_entity_ids())
+
+
+def _compile_flat(cond, cond_class, cache, adaptive) -> list:
+    '''
+    Compiles cond's subconditions, inlining those of nested conditions of the same class.
+    Returns a list of (subcondition, closure).
+    '''
+    children = []
+    for sub_cond in cond._conditions:
+        if type(sub_cond) is cond_class and (cache is None or not sub_cond.is_state_only()):
+            children.extend(_compile_flat(sub_cond, cond_class, cache, adaptive))
+        else:
+            children.append((sub_cond, _compile_cached(sub_cond, cache, adaptive)))
+    return children
+
+
+def _compile_debug_log(func, serialized: dict):
+    def debug_log(entity_states) -> bool:
+        result = func(entity_states)
+        _LOG.debug("Condition is {}: {}".format(result, serialized))
+        return result
+    return debug_log
+
+
+class _AdaptiveOrder(object):
+    '''
+    Order in which a compiled and/or closure checks its subconditions.
+
+    Every SAMPLE_EVERY evaluations, all subconditions are timed and their results
+    recorded, including those after the one that decided the result.  Every
+    REORDER_EVERY of those, the subconditions are sorted by their mean cost divided by
+    their rate of returning the deciding result (False for and, True for or).  Ties
+    keep the declaration order, so the same statistics always give the same order.
+
+    A subcondition that can raise (like numeric_state on an unavailable sensor) may be
+    guarded by the ones declared before it, so it always comes after all of them.  The
+    subconditions that never raise go wherever their rank puts them: checking one earlier
+    can only turn an exception into the same deciding result.
+    '''
+
+    def __init__(self, children: list, decisive: bool):
+        self._children = [sub_cond for sub_cond, func in children]
+        self._funcs = [func for sub_cond, func in children]
+        self._decisive = decisive
+        self._movable = [sub_cond.never_raises() for sub_cond, func in children]
+        self.order = list(range(len(children)))     # Indexes of the children, in order
+        self.funcs = tuple(self._funcs)             # Closures, in order
+
+        self.evaluations = 0
+        self.samples = 0
+        self.reorders = 0
+        self._sampled = [0] * len(children)
+        self._decided = [0] * len(children)     # Samples that returned the decisive result
+        self._cost = [0.0] * len(children)      # Seconds spent in the sampled evaluations
+
+    def evaluate_sampled(self, entity_states) -> bool:
+        decisive = self._decisive
+        result = not decisive
+        decided = False
+        perf_counter = time.perf_counter
+        for i in self.order:
+            start = perf_counter()
+            try:
+                value = self._funcs[i](entity_states)
+            except Exception:
+                if not decided:
+                    raise
+                continue    # Wouldn't have been evaluated
+            self._cost[i] += perf_counter() - start
+            self._sampled[i] += 1
+            if bool(value) is decisive:
+                self._decided[i] += 1
+                if not decided:
+                    decided = True
+                    result = decisive
+
+        self.samples += 1
+        if self.samples % REORDER_EVERY == 0:
+            self._reorder()
+        return result
+
+    def get_stats(self, condition: str) -> dict:
+        children = []
+        for i, sub_cond in enumerate(self._children):
+            sampled = self._sampled[i]
+            passed = self._decided[i] if self._decisive else sampled - self._decided[i]
+            children.append({
+                "index": i,
+                "condition": sub_cond.serialize(),
+                "samples": sampled,
+                "pass_rate": passed / sampled if sampled else None,
+                "mean_cost_us": self._cost[i] / sampled * 1e6 if sampled else None,
+                "order_stats": sub_cond.get_order_stats(),
+            })
+        return {
+            "condition": condition,
+            "order": list(self.order),
+            "evaluations": self.evaluations,
+            "samples": self.samples,
+            "reorders": self.reorders,
+            "children": children,
+        }
+
+    def _reorder(self):
+        def rank(i):
+            if self._decided[i] == 0:
+                return (float("inf"), i)
+            return (self._cost[i] / self._decided[i], i)   # mean cost / decisive rate
+        # The best ranked subcondition that can go next: one that never raises, or the
+        # first one declared of those left, as everything declared before it is placed
+        order = []
+        left = list(range(len(self._funcs)))
+        while left:
+            i = min((i for i in left if self._movable[i] or i == left[0]), key=rank)
+            order.append(i)
+            left.remove(i)
+        if order != self.order:
+            self.reorders += 1
+            self.order = order
+            self.funcs = tuple(self._funcs[i] for i in order)
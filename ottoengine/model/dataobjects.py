@@ -1,6 +1,8 @@
-import dateutil.parser
+import datetime
 import logging
 
+from ottoengine import const, helpers
+
 _LOG = logging.getLogger(__name__)
 # _LOG.setLevel(logging.DEBUG)
 
@@ -19,14 +21,19 @@ class HassEvent(object):
     def __init__(self, event_type, data_obj, time_fired):
         self.event_type = event_type
         self.data_obj = data_obj
-        self.time_fired = time_fired
+        self._time_fired = time_fired   # datetime, or the raw ISO-8601 string until first read
+
+    @property
+    def time_fired(self) -> datetime.datetime:
+        if isinstance(self._time_fired, str):
+            self._time_fired = helpers.parse_iso_datetime(self._time_fired)
+        return self._time_fired
 
     @staticmethod
     def from_websocket_dict(response_dict):
         event_type = response_dict.get("event_type")
         data = response_dict["data"]
-        time_fired = dateutil.parser.parse(response_dict["time_fired"])
-        return HassEvent(event_type, data, time_fired)
+        return HassEvent(event_type, data, response_dict["time_fired"])
 
 
 class StateChangedEvent(HassEvent):
@@ -61,22 +68,15 @@ class StateChangedEvent(HassEvent):
 
     @staticmethod
     def from_websocket_dict(response_dict):
+        # Nothing is parsed here.  The state objects wrap the raw dicts from the
+        # websocket, and the timestamps are only decoded if something reads them.
         data = response_dict["data"]
-
-        time_fired = dateutil.parser.parse(response_dict["time_fired"])
-        entity_id = data["entity_id"]
-
-        old_state_value = data["old_state"]["state"]
-        old_attributes = data["old_state"]["attributes"]
-        old_last_changed = dateutil.parser.parse(data["old_state"]["last_changed"])
-        old_state_obj = EntityState(entity_id, old_state_value, old_attributes, old_last_changed)
-
-        new_state_value = data["new_state"]["state"]
-        new_attributes = data["new_state"]["attributes"]
-        new_last_changed = dateutil.parser.parse(data["new_state"]["last_changed"])
-        new_state_obj = EntityState(entity_id, new_state_value, new_attributes, new_last_changed)
-
-        return StateChangedEvent(entity_id, old_state_obj, new_state_obj, time_fired)
+        return StateChangedEvent(
+            data["entity_id"],
+            LazyEntityState(data["old_state"]),
+            LazyEntityState(data["new_state"]),
+            response_dict["time_fired"]
+        )
 
 
 class EntityState(object):
@@ -123,6 +123,50 @@ class EntityState(object):
         return True
 
 
+class LazyEntityState(EntityState):
+    '''
+    An EntityState backed by the raw state dict received on the websocket.
+
+    The entity_id and state are read up front since nearly every consumer needs them.
+    The attributes and last_changed timestamp are only decoded when first read.
+    '''
+
+    def __init__(self, state_dict):
+        self._raw = state_dict
+        self._last_changed = None
+        self.entity_id = state_dict[const.ENTITY_ID]
+        self.state = state_dict[const.STATE]
+
+    @property
+    def attributes(self) -> dict:
+        return self._raw[const.ATTRIBUTES]
+
+    @property
+    def last_changed(self) -> datetime.datetime:
+        if self._last_changed is None:
+            self._last_changed = helpers.parse_iso_datetime(self._raw[const.LAST_CHANGED])
+        return self._last_changed
+
+    @property
+    def friendly_name(self):
+        return self.attributes.get("friendly_name")
+
+    @property
+    def hidden(self) -> bool:
+        hidden = self.attributes.get("hidden")
+        return False if hidden is None else hidden
+
+    def is_equal(self, state):
+        # Two raw states can be compared on their timestamp strings without decoding them
+        if isinstance(state, LazyEntityState):
+            return (
+                self.entity_id == state.entity_id
+                and self.state == state.state
+                and self._raw[const.LAST_CHANGED] == state._raw[const.LAST_CHANGED]
+            )
+        return super().is_equal(state)
+
+
 class ServiceRegistration(object):
     # "persistent_notification": {
     #     "create": {
@@ -1,24 +1,44 @@
 # import asyncio
 import logging
 
-from ottoengine.model import trigger_objects
+from ottoengine import helpers
+from ottoengine.model import action_objects, trigger_objects
 
 _LOG = logging.getLogger(__name__)
 # _LOG.setLevel(logging.DEBUG)
 
+# Execution modes, when a rule is triggered while it is running
+MODE_SINGLE = "single"      # The new run is dropped
+MODE_RESTART = "restart"    # The current run is cancelled
+MODE_QUEUED = "queued"      # The new run waits for the current one
+MODE_PARALLEL = "parallel"  # The runs are concurrent
+MODES = [MODE_SINGLE, MODE_RESTART, MODE_QUEUED, MODE_PARALLEL]
+DEFAULT_MAX_RUNS = 10       # Runs queued, or running in parallel, per rule
+
 
 class AutomationRule(object):
 
-    def __init__(self, id, description='', enabled=True, group=None, notes=''):
+    def __init__(self, id, description='', enabled=True, group=None, notes='',
+                 mode=MODE_PARALLEL, max_runs=DEFAULT_MAX_RUNS, priority=None):
         self.id = id
         self.description = description
         self.enabled = enabled
         self.group = group
+        self.mode = mode            # One of MODES
+        self.max_runs = max_runs    # Queued or parallel runs allowed
+        self.priority = priority    # Scheduler lane, or None for the group's lane
         self.triggers = []          # list of RuleTrigger
         self.rule_condition = None  # a RuleCondition
         self.actions = []           # list of RuleAction
         self.notes = notes          # Notes should never be null; empty string at least
 
+        if self.mode not in MODES:
+            raise helpers.ValidationError(
+                "Rule mode must be one of {}: {}".format(", ".join(MODES), self.mode))
+        if not isinstance(self.max_runs, int) or self.max_runs < 1:
+            raise helpers.ValidationError(
+                "Rule max_runs must be a positive integer: {}".format(self.max_runs))
+
     def serialize(self) -> dict:
         j = {}
         j["id"] = self.id
@@ -26,6 +46,10 @@ class AutomationRule(object):
         j["enabled"] = self.enabled
         j["group"] = self.group
         j["notes"] = self.notes
+        j["mode"] = self.mode
+        j["max_runs"] = self.max_runs
+        if self.priority is not None:
+            j["priority"] = self.priority
         j["triggers"] = []
         for t in self.triggers:
             j["triggers"].append(t.serialize())
@@ -90,3 +114,17 @@ def get_listeners(rule: AutomationRule) -> list:
     for trigger in rule.triggers:
             listeners.append(HassListener(rule, trigger))
     return listeners
+
+
+def get_conditions(rule: AutomationRule) -> list:
+    '''Returns the rule's top-level RuleConditions: rule, action and condition-action ones.'''
+    conditions = []
+    if rule.rule_condition is not None:
+        conditions.append(rule.rule_condition)
+    for action in rule.actions:
+        if action.action_condition is not None:
+            conditions.append(action.action_condition)
+        for action_item in action.action_sequence:
+            if isinstance(action_item, action_objects.ConditionAction):
+                conditions.append(action_item.condition)
+    return conditions
@@ -57,6 +57,14 @@ class StateTrigger(ListenerTrigger):
     def entity_id(self):
         return self._entity_id
 
+    @property
+    def to_state(self):
+        return self._to_state
+
+    @property
+    def from_state(self):
+        return self._from_state
+
     @staticmethod
     def from_dict(json):
         j = json
@@ -235,7 +243,7 @@ class TimeTrigger():
 
     def __init__(
         self, minute=None, hour=None, day_of_month=None,
-        month=None, weekdays=None, tz=None
+        month=None, weekdays=None, tz=None, spread=None
     ):
         self._id = uuid.uuid4()
         self._timespec = clock.TimeSpec(
@@ -244,7 +252,8 @@ class TimeTrigger():
             day_of_month=day_of_month,
             month=month,
             weekdays=weekdays,
-            tz_name=tz
+            tz_name=tz,
+            spread=spread
         )
 
     @property
@@ -263,7 +272,8 @@ class TimeTrigger():
             json.get("day_of_month"),
             json.get("month"),
             json.get("weekdays"),
-            json.get("tz")
+            json.get("tz"),
+            json.get("spread")
         )
 
     # Override
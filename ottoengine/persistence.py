@@ -140,7 +140,10 @@ class PersistenceManager:
                 description=rule_dict.get("description", ''),
                 enabled=rule_dict.get("enabled", True),
                 group=rule_dict.get("group", ''),
-                notes=rule_dict.get("notes", '')
+                notes=rule_dict.get("notes", ''),
+                mode=rule_dict.get("mode", rule_objects.MODE_PARALLEL),
+                max_runs=rule_dict.get("max_runs", rule_objects.DEFAULT_MAX_RUNS),
+                priority=rule_dict.get("priority")
             )
         except Exception as e:
             success = False
@@ -160,7 +163,8 @@ class PersistenceManager:
 
         # Create Rule Condition
         try:
-            rule.rule_condition = self._condition_from_dict(rule_dict.get("rule_condition"))
+            rule.rule_condition = self._compile_condition(
+                self._condition_from_dict(rule_dict.get("rule_condition")))
         except Exception as e:
             success = False
             message = "Error creating rule condition: {}".format(sys.exc_info()[1])
@@ -174,7 +178,8 @@ class PersistenceManager:
                 if "description" in j:
                     raction.description = j.get("description")
                 if "action_condition" in j:
-                    raction.action_condition = self._condition_from_dict(j["action_condition"])
+                    raction.action_condition = self._compile_condition(
+                        self._condition_from_dict(j["action_condition"]))
                 for j2 in j["action_sequence"]:
                     raction.action_sequence.append(self._action_from_dict(j2))
                 rule.actions.append(raction)
@@ -241,13 +246,21 @@ class PersistenceManager:
             cond = condition_objects.ZoneCondition.from_dict(j)
         return cond
 
+    def _compile_condition(
+            self, cond: condition_objects.RuleCondition) -> condition_objects.RuleCondition:
+        '''Compiles the condition tree into a single closure, stored in cond.compiled'''
+        if cond is not None:
+            cond.compile()
+        return cond
+
     def _action_from_dict(self, action_json: dict) -> action_objects.RuleActionItem:
         j = action_json
         action = None
         if "service" in j:
             action = action_objects.ServiceAction.from_dict(j)
         if "condition" in j:
-            action = action_objects.ConditionAction(self._condition_from_dict(j))
+            action = action_objects.ConditionAction(
+                self._compile_condition(self._condition_from_dict(j)))
         if "delay" in j:
             action = action_objects.DelayAction.from_dict(j)
         if "wait" in j:
@@ -0,0 +1,40 @@
+import logging
+import time
+
+_LOG = logging.getLogger(__name__)
+# _LOG.setLevel(logging.DEBUG)
+
+
+class RateMeter(object):
+    '''
+    Counts events in one second buckets, and keeps the busiest second seen.
+
+    Only the current bucket is kept, so marking an event is O(1) whatever the rate.
+    '''
+
+    def __init__(self, time_func=time.monotonic):
+        self._time_func = time_func
+        self._second = None     # Whole second of the current bucket
+        self._count = 0         # Events in the current bucket
+
+        self.stats = {
+            "total": 0,
+            "last_per_sec": 0,  # Events in the last second that had any
+            "peak_per_sec": 0,  # Events in the busiest second
+        }
+
+    # ~~~~~~~~~~~~~~~~~~~
+    #   Public methods
+    # ~~~~~~~~~~~~~~~~~~~
+
+    def mark(self, count: int = 1):
+        second = int(self._time_func())
+        if second != self._second:
+            self._second = second
+            self._count = 0
+        self._count += count
+
+        self.stats["total"] += count
+        self.stats["last_per_sec"] = self._count
+        if self._count > self.stats["peak_per_sec"]:
+            self.stats["peak_per_sec"] = self._count
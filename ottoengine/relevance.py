@@ -0,0 +1,74 @@
+import logging
+
+from ottoengine.model import rule_objects, trigger_objects
+
+_LOG = logging.getLogger(__name__)
+# _LOG.setLevel(logging.DEBUG)
+
+
+class RelevanceIndex(object):
+    '''
+    Index of what the loaded rules can react to.
+
+    The websocket reader consults this index before building event objects, so events
+    that no rule can react to take a cheap path that only keeps the entity state current.
+
+    - trigger entity IDs and event types need the full event processing
+    - condition entity IDs only need their state kept current
+    - any other entity's state is kept, unless its domain is in ignored_state_domains
+    '''
+
+    def __init__(self, ignored_state_domains=None):
+        self._trigger_entity_ids = set()
+        self._trigger_event_types = set()
+        self._condition_entity_ids = set()
+        self._ignored_state_domains = set(ignored_state_domains or [])
+
+    # ~~~~~~~~~~~~~~~~~~~
+    #   Public methods
+    # ~~~~~~~~~~~~~~~~~~~
+
+    def add_rule(self, rule: rule_objects.AutomationRule):
+        for trigger in rule.triggers:
+            if isinstance(trigger, trigger_objects.EventTrigger):
+                self._trigger_event_types.add(trigger.event_type)
+            elif isinstance(trigger, (trigger_objects.StateTrigger,
+                                      trigger_objects.NumericStateTrigger)):
+                self._trigger_entity_ids.add(trigger.entity_id)
+
+        if rule.rule_condition is not None:
+            self._condition_entity_ids.update(rule.rule_condition.get_entity_ids())
+
+        for action in rule.actions:
+            if action.action_condition is not None:
+                self._condition_entity_ids.update(action.action_condition.get_entity_ids())
+            for action_item in action.action_sequence:
+                self._condition_entity_ids.update(action_item.get_entity_ids())
+
+    def clear(self):
+        self._trigger_entity_ids = set()
+        self._trigger_event_types = set()
+        self._condition_entity_ids = set()
+
+    def is_trigger_entity(self, entity_id: str) -> bool:
+        '''True if a rule triggers on state changes of this entity'''
+        return entity_id in self._trigger_entity_ids
+
+    def is_trigger_event(self, event_type: str) -> bool:
+        '''True if a rule triggers on events of this type'''
+        return event_type in self._trigger_event_types
+
+    def wants_state(self, entity_id: str) -> bool:
+        '''True if the engine should keep this entity's state'''
+        if entity_id in self._trigger_entity_ids or entity_id in self._condition_entity_ids:
+            return True
+        return entity_id.split(".", 1)[0] not in self._ignored_state_domains
+
+    @property
+    def entity_ids(self) -> set:
+        '''All entity IDs referenced by a trigger or a condition'''
+        return self._trigger_entity_ids | self._condition_entity_ids
+
+    @property
+    def event_types(self) -> set:
+        return set(self._trigger_event_types)
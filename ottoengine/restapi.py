@@ -54,6 +54,13 @@ def rules():
     return dict_to_json_response(resp)
 
 
+@app.route('/rest/conditions', methods=['GET'])
+def conditions():
+    '''The order and statistics of the adaptive and/or conditions of each rule'''
+    resp = {"data": engine_obj.get_condition_stats_threadsafe()}
+    return dict_to_json_response(resp)
+
+
 @app.route('/rest/entities', methods=['GET'])
 def entities():
     entities = engine_obj.get_entities_threadsafe()
@@ -0,0 +1,183 @@
+import asyncio
+import collections
+import logging
+
+from ottoengine.model import rule_objects
+
+_LOG = logging.getLogger(__name__)
+# _LOG.setLevel(logging.DEBUG)
+
+# Admissions of a new run
+_START = "start"
+_QUEUE = "queue"
+_DROP = "drop"
+
+
+class RuleRunRegistry(object):
+    '''
+    Starts the runs of the rules' actions according to each rule's mode:
+
+    - single: a run is dropped while the rule is running
+    - restart: a run cancels the rule's current run
+    - queued: a run waits for the previous one to finish, up to max_runs waiting
+    - parallel: runs are concurrent, up to max_runs; more are dropped
+
+    A rule is only kept while it has runs, so deleted or reloaded rules don't linger.
+    '''
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._rule_runs = {}    # rule_id -> _RuleRuns, of the rules running or queued
+        self._warned = set()    # IDs of the rules whose first dropped run was logged
+
+        self.stats = {
+            "running": 0,
+            "max_running": 0,
+            "started": 0,
+            "finished": 0,
+            "dropped": 0,       # Runs dropped because of the rule's mode or max_runs
+            "restarted": 0,     # Runs cancelled by a new run of a restart mode rule
+            "queued": 0,        # Runs that waited for the previous run of their rule
+        }
+
+    # ~~~~~~~~~~~~~~~~~~~
+    #   Public methods
+    # ~~~~~~~~~~~~~~~~~~~
+
+    def start(self, rule: rule_objects.AutomationRule, coro_func) -> asyncio.Task:
+        '''
+        Starts coro_func() in a new task as a run of the rule, if its mode allows it.
+        Returns the run's task, or None if the run was dropped or queued.
+        '''
+        runs = self._get_runs(rule)
+        admission = self._admit(rule, runs)
+        if admission is _QUEUE:
+            runs.queue.append(coro_func)
+            return None
+        elif admission is _DROP:
+            return None
+        return self._start_task(runs, coro_func)
+
+    async def async_run(self, rule: rule_objects.AutomationRule, coro_func) -> bool:
+        '''
+        Runs coro_func() in the current task as a run of the rule, if its mode allows it,
+        once the runs queued before it are done.  Returns False if the run was dropped.
+        '''
+        runs = self._get_runs(rule)
+        task = asyncio.current_task(loop=self._loop)
+        admission = self._admit(rule, runs)
+        if admission is _QUEUE:
+            waiter = self._loop.create_future()
+            runs.queue.append((task, waiter))
+            await waiter    # The task was added to the rule's runs before waking it up
+        elif admission is _DROP:
+            return False
+        else:
+            self._add_run(runs, task)
+
+        try:
+            await coro_func()
+        finally:
+            self._run_done(runs, task)
+        return True
+
+    def get_rule_stats(self, rule_id: str) -> dict:
+        runs = self._rule_runs.get(rule_id)
+        if runs is None:
+            return {"running": 0, "queued": 0}
+        return {"running": len(runs.tasks), "queued": len(runs.queue)}
+
+    # ~~~~~~~~~~~~~~~~~~~~
+    #   Private methods
+    # ~~~~~~~~~~~~~~~~~~~~
+
+    def _get_runs(self, rule) -> '_RuleRuns':
+        runs = self._rule_runs.get(rule.id)
+        if runs is None:
+            runs = _RuleRuns(rule.id)
+            self._rule_runs[rule.id] = runs
+        return runs
+
+    def _admit(self, rule, runs):
+        '''Returns _START, _QUEUE or _DROP, for a new run of the rule'''
+        if not runs.tasks and not runs.queue:
+            return _START
+        mode = rule.mode
+
+        if mode == rule_objects.MODE_SINGLE:
+            return self._drop(rule)
+
+        elif mode == rule_objects.MODE_RESTART:
+            self.stats["restarted"] += 1
+            _LOG.debug("Restarting rule {}".format(rule.id))
+            if runs.current is not None:
+                runs.current.cancel()
+            return _START
+
+        elif mode == rule_objects.MODE_QUEUED:
+            if len(runs.queue) >= rule.max_runs:
+                return self._drop(rule)
+            self.stats["queued"] += 1
+            return _QUEUE
+
+        elif len(runs.tasks) >= rule.max_runs:
+            return self._drop(rule)
+        return _START
+
+    def _start_task(self, runs, coro_func) -> asyncio.Task:
+        task = self._loop.create_task(coro_func())
+        self._add_run(runs, task)
+        task.add_done_callback(lambda t: self._run_done(runs, t))
+        return task
+
+    def _add_run(self, runs, task):
+        runs.tasks.add(task)
+        runs.current = task
+        self.stats["started"] += 1
+        self.stats["running"] += 1
+        if self.stats["running"] > self.stats["max_running"]:
+            self.stats["max_running"] = self.stats["running"]
+
+    def _run_done(self, runs, task):
+        runs.tasks.discard(task)
+        if runs.current is task:
+            runs.current = None
+        self.stats["finished"] += 1
+        self.stats["running"] -= 1
+
+        # Start the next queued run
+        while runs.queue and not runs.tasks:
+            queued = runs.queue.popleft()
+            if isinstance(queued, tuple):
+                queued_task, waiter = queued
+                if waiter.done():
+                    continue    # Cancelled while it was queued
+                self._add_run(runs, queued_task)
+                waiter.set_result(None)
+            else:
+                self._start_task(runs, queued)
+
+        if not runs.tasks and not runs.queue and self._rule_runs.get(runs.rule_id) is runs:
+            del self._rule_runs[runs.rule_id]
+
+    def _drop(self, rule):
+        self.stats["dropped"] += 1
+        message = "Rule {} is already running ({} mode, max_runs {}), run dropped".format(
+            rule.id, rule.mode, rule.max_runs)
+        if rule.id in self._warned:
+            _LOG.debug(message)
+        else:
+            # Only the first drop of each rule, so a busy rule can't flood the log
+            self._warned.add(rule.id)
+            _LOG.warning(message)
+        return _DROP
+
+
+class _RuleRuns(object):
+    __slots__ = ["rule_id", "tasks", "current", "queue"]
+
+    def __init__(self, rule_id: str):
+        self.rule_id = rule_id
+        self.tasks = set()      # Running tasks of the rule
+        self.current = None     # Latest task started, cancelled by a restart
+        self.queue = collections.deque()    # coro_funcs, or (task, waiter)s, of queued runs
@@ -0,0 +1,147 @@
+import asyncio
+import collections
+import logging
+import time
+
+from ottoengine.model import rule_objects
+
+_LOG = logging.getLogger(__name__)
+# _LOG.setLevel(logging.DEBUG)
+
+# Priority lanes, highest first, and their share of the workers freed while rules wait
+LANE_CRITICAL = "critical"
+LANE_NORMAL = "normal"
+LANE_BULK = "bulk"
+LANE_WEIGHTS = collections.OrderedDict([(LANE_CRITICAL, 4), (LANE_NORMAL, 2), (LANE_BULK, 1)])
+LANES = list(LANE_WEIGHTS.keys())
+
+
+class RuleScheduler(object):
+    '''
+    Limits the rule runs executing their actions at once to a pool of workers.
+
+    A run takes a worker right away if one is free.  Otherwise it waits in its rule's
+    lane: the rule's priority if set, else its group's lane, else the normal lane.
+    When a worker is freed, the lanes with waiting runs are served in a weighted round
+    robin (4 critical, 2 normal, 1 bulk), so a busy lane cannot starve the others.
+
+    A run gives its worker back while it sleeps in a delay action, and waits for one
+    again in its lane to continue.
+    '''
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, workers: int = 0,
+                 group_lanes: dict = None, async_sleep_func=asyncio.sleep):
+        '''
+        workers of 0 means no limit, runs are only counted.
+        async_sleep_func(delay_secs) is the coroutine function the delays sleep with.
+        '''
+        self._loop = loop
+        self._workers = workers
+        self._async_sleep_func = async_sleep_func
+        self._group_lanes = {}
+        for group, lane in (group_lanes or {}).items():
+            if lane in LANE_WEIGHTS:
+                self._group_lanes[group] = lane
+            else:
+                _LOG.warning("Unknown lane {} for group {}, using {}".format(
+                    lane, group, LANE_NORMAL))
+        self._busy = 0
+        self._holders = {}  # task -> lane of the worker it holds
+        self._waiters = {lane: collections.deque() for lane in LANES}  # (future, queued_time)
+        self._rotation = [lane for lane, weight in LANE_WEIGHTS.items() for i in range(weight)]
+        self._next = 0      # Index in _rotation of the next lane to serve
+
+        self.stats = {
+            "workers": workers,
+            "busy": 0,
+            "lanes": {
+                lane: {
+                    "waiting": 0,
+                    "dispatched": 0,    # Runs and continuations that got a worker
+                    "queued": 0,        # Those that had to wait for it
+                    "wait_ms_total": 0.0,
+                    "wait_ms_max": 0.0,
+                    "wait_ms_mean": 0.0,
+                }
+                for lane in LANES
+            }
+        }
+
+    # ~~~~~~~~~~~~~~~~~~~
+    #   Public methods
+    # ~~~~~~~~~~~~~~~~~~~
+
+    def get_lane(self, rule: rule_objects.AutomationRule) -> str:
+        if rule.priority in LANE_WEIGHTS:
+            return rule.priority
+        return self._group_lanes.get(rule.group, LANE_NORMAL)
+
+    async def async_acquire(self, lane: str):
+        '''Waits for a worker for the current task, in the lane'''
+        lane_stats = self.stats["lanes"][lane]
+        if self._workers and (self._busy >= self._workers or self._has_waiters()):
+            waiter = self._loop.create_future()
+            queued_time = time.monotonic()
+            self._waiters[lane].append((waiter, queued_time))
+            lane_stats["waiting"] += 1
+            lane_stats["queued"] += 1
+            try:
+                await waiter    # The releasing task hands its worker over
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release()     # The worker was handed over already
+                raise
+            wait_ms = (time.monotonic() - queued_time) * 1000
+            lane_stats["wait_ms_total"] += wait_ms
+            if wait_ms > lane_stats["wait_ms_max"]:
+                lane_stats["wait_ms_max"] = wait_ms
+        else:
+            self._busy += 1
+            self.stats["busy"] = self._busy
+
+        lane_stats["dispatched"] += 1
+        lane_stats["wait_ms_mean"] = lane_stats["wait_ms_total"] / lane_stats["dispatched"]
+        self._holders[asyncio.current_task(loop=self._loop)] = lane
+
+    def release(self):
+        '''Gives back the current task's worker, if it holds one'''
+        if self._holders.pop(asyncio.current_task(loop=self._loop), None) is not None:
+            self._release()
+
+    async def async_sleep(self, delay_secs: float):
+        '''Sleeps without holding a worker, then waits for one in the same lane'''
+        lane = self._holders.get(asyncio.current_task(loop=self._loop))
+        if lane is None:
+            await self._async_sleep_func(delay_secs)
+            return
+        self.release()
+        await self._async_sleep_func(delay_secs)    # If cancelled here, no worker is held
+        await self.async_acquire(lane)
+
+    # ~~~~~~~~~~~~~~~~~~~~
+    #   Private methods
+    # ~~~~~~~~~~~~~~~~~~~~
+
+    def _has_waiters(self) -> bool:
+        return any(self._waiters[lane] for lane in LANES)
+
+    def _release(self):
+        '''Hands the worker over to the next waiting run, or frees it'''
+        waiter = self._next_waiter()
+        if waiter is not None:
+            waiter.set_result(None)
+            return
+        self._busy -= 1
+        self.stats["busy"] = self._busy
+
+    def _next_waiter(self) -> asyncio.Future:
+        for i in range(len(self._rotation)):
+            lane = self._rotation[(self._next + i) % len(self._rotation)]
+            waiters = self._waiters[lane]
+            while waiters:
+                waiter, queued_time = waiters.popleft()
+                self.stats["lanes"][lane]["waiting"] -= 1
+                if not waiter.done():
+                    self._next = (self._next + i + 1) % len(self._rotation)
+                    return waiter
+        return None
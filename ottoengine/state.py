@@ -9,6 +9,8 @@ class OttoEngineState(object):
     def __init__(self):
         self._engine_states = {}
         self._entity_states = {}
+        self._entity_versions = {}  # entity_id -> int, incremented on each state set
+        self._entity_listeners = []     # Called with the entity_id after each state set
         self._services_states = {}
         self._rules = {}
 
@@ -45,13 +47,31 @@ class OttoEngineState(object):
     # Entity states
     def set_entity_state(self, entity_id, state_obj):
         '''Sets an entity state'''
-        _LOG.debug("{} -> {}".format(entity_id, state_obj.state))
+        if _LOG.isEnabledFor(logging.DEBUG):
+            _LOG.debug("{} -> {}".format(entity_id, state_obj.state))
         self._entity_states[entity_id] = state_obj
+        self._entity_versions[entity_id] = self._entity_versions.get(entity_id, 0) + 1
+        for listener in self._entity_listeners:
+            listener(entity_id)
 
     def get_entity_state(self, entity_id):
         '''Sets an entity state'''
         return self._entity_states.get(entity_id)
 
+    @property
+    def entity_states(self) -> dict:
+        '''The entity_id -> EntityState dict, read by compiled conditions'''
+        return self._entity_states
+
+    def add_entity_listener(self, listener):
+        '''Calls listener(entity_id) after each entity state set'''
+        self._entity_listeners.append(listener)
+
+    @property
+    def entity_versions(self) -> dict:
+        '''The entity_id -> version dict, read by the condition cache'''
+        return self._entity_versions
+
     def get_all_entity_state_copy(self):
         return copy.deepcopy(self._entity_states)
 
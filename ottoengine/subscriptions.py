@@ -0,0 +1,97 @@
+import asyncio
+import logging
+
+from ottoengine import hass_websocket_client
+
+_LOG = logging.getLogger(__name__)
+# _LOG.setLevel(logging.DEBUG)
+
+
+class SubscriptionManager(object):
+    '''
+    Keeps the websocket's subscriptions in step with what the loaded rules reference.
+
+    Instead of subscribing to every state_changed event, each entity gets its own
+    subscribe_trigger subscription (a state trigger), and each event type its own
+    subscribe_events subscription.  Syncing only sends the commands for the entities and
+    event types that were added or removed since the last sync.  Syncs run one at a time,
+    so a sync started while another waits for its results doesn't subscribe twice.
+
+    Subscription IDs belong to one websocket connection, so a new manager is needed
+    when the websocket reconnects.
+    '''
+
+    def __init__(self, websocket: hass_websocket_client.AsyncHassWebsocket):
+        self._websocket = websocket
+        self._entity_subscriptions = {}     # entity_id -> subscription ID
+        self._event_subscriptions = {}      # event_type -> subscription ID
+        self._lock = asyncio.Lock()
+
+        self.stats = {
+            "entities": 0,
+            "event_types": 0,
+            "subscribed": 0,
+            "unsubscribed": 0,
+            "failed": 0,
+        }
+
+    # ~~~~~~~~~~~~~~~~~~~
+    #   Public methods
+    # ~~~~~~~~~~~~~~~~~~~
+
+    async def async_sync(self, entity_ids: set, event_types: set):
+        '''Subscribes to the entities and event types, and unsubscribes from the others'''
+        async with self._lock:
+            await self._async_sync(entity_ids, event_types)
+
+    # ~~~~~~~~~~~~~~~~~~~~
+    #   Private methods
+    # ~~~~~~~~~~~~~~~~~~~~
+
+    async def _async_sync(self, entity_ids: set, event_types: set):
+        requests = []   # (table, key, future) for each subscribe command
+
+        for entity_id in sorted(set(entity_ids) - set(self._entity_subscriptions)):
+            future = await self._websocket.async_subscribe_trigger(
+                {"platform": "state", "entity_id": entity_id})
+            requests.append((self._entity_subscriptions, entity_id, future))
+
+        for event_type in sorted(set(event_types) - set(self._event_subscriptions)):
+            future = await self._websocket.async_subscribe_events(event_type)
+            requests.append((self._event_subscriptions, event_type, future))
+
+        unsubscribes = []
+        for table, keys in [(self._entity_subscriptions, entity_ids),
+                            (self._event_subscriptions, event_types)]:
+            for key in set(table) - set(keys):
+                subscription_id = table.pop(key)
+                unsubscribes.append(
+                    await self._websocket.async_unsubscribe_events(subscription_id))
+                self.stats["unsubscribed"] += 1
+
+        # All the commands are sent, now wait for their results
+        for table, key, future in requests:
+            response = await _async_get_response(future)
+            if response is None:
+                self.stats["failed"] += 1
+                _LOG.error("Could not subscribe to {}".format(key))
+                continue
+            table[key] = response["id"]
+            self.stats["subscribed"] += 1
+
+        for future in unsubscribes:
+            await _async_get_response(future)
+
+        self.stats["entities"] = len(self._entity_subscriptions)
+        self.stats["event_types"] = len(self._event_subscriptions)
+        _LOG.info("Subscribed to {} entities and {} event types".format(
+            self.stats["entities"], self.stats["event_types"]))
+
+
+async def _async_get_response(future) -> dict:
+    try:
+        response = await future
+    except Exception as e:
+        _LOG.error("No response to subscription command: {}".format(type(e).__name__))
+        return None
+    return response if response.get("success") else None
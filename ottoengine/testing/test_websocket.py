@@ -1,7 +1,8 @@
 import asyncio
-import asyncws
+import json
 import logging
 
+from ottoengine import websocket_protocol
 from ottoengine.fibers import Fiber
 
 _LOG = logging.getLogger(__name__)
@@ -9,24 +10,42 @@ _LOG = logging.getLogger(__name__)
 
 HOST = "127.0.0.1"
 
+# The result the server responds with for each command type.
+# Commands are still broadcast to the other clients like any other frame.
+COMMAND_RESULTS = {
+    "subscribe_events": None,
+    "subscribe_trigger": None,
+    "unsubscribe_events": None,
+    "get_states": [],
+    "get_services": {},
+    "call_service": None,
+}
+
 
 class TestWebSocketServer(Fiber):
-    def __init__(self, port):
+    def __init__(self, port, compress=True):
         super().__init__()
         self._port = port
+        self._compress = compress   # Accept permessage-deflate from clients that offer it
         self._clients = []  # List of websockets connected to this server
         self._clients_lock = asyncio.Lock()
 
+        # Clients that used subscribe_trigger only receive the state_changed events of
+        # their subscribed entities, as state trigger events.  Every other frame is sent
+        # to every client, so tests can send events and watch for the engine's commands.
+        self._triggers = {}     # websocket -> {subscription ID: entity_id}
+
     async def _async_run(self):
         try:
             _LOG.info("TestWebSocketServer starting on {}:{}".format(HOST, self._port))
-            await asyncws.start_server(self._echo, HOST, self._port)
+            await websocket_protocol.async_start_server(
+                self._echo, HOST, self._port, compress=self._compress)
         except OSError as e:
             if e.errno == 48:
                 _LOG.error(
                     "TestWebsocketServer not started. Port {} already in use".format(self._port))
 
-    async def _echo(self, websocket: asyncws.Websocket):
+    async def _echo(self, websocket: websocket_protocol.WebsocketConnection):
         _LOG.info("Test websocket connected")
         # Register this new websocket with the list of client websockets
         with (await self._clients_lock):
@@ -39,6 +58,8 @@ class TestWebSocketServer(Fiber):
                 if frame is None:
                     break
 
+                await self._respond(websocket, frame)
+
                 # Refresh current list of clients
                 with (await self._clients_lock):
                     clients_copy = list(self._clients)
@@ -46,7 +67,10 @@ class TestWebSocketServer(Fiber):
                 for client in clients_copy:
                         if client is websocket:
                             continue
-                        await client.send(frame)
+                        if client in self._triggers:
+                            await self._send_triggers(client, frame)
+                        else:
+                            await client.send(frame)
 
         except RuntimeError as e:
             _LOG.warn(str(e))
@@ -54,4 +78,65 @@ class TestWebSocketServer(Fiber):
         finally:
             with (await self._clients_lock):
                 self._clients.remove(websocket)
+            self._triggers.pop(websocket, None)
             _LOG.info("Test websocket closed")
+
+    async def _respond(self, websocket: websocket_protocol.WebsocketConnection, frame):
+        '''Sends the response to a command, as Home Assistant would'''
+        try:
+            msg = json.loads(frame)
+        except ValueError:
+            return
+        if not isinstance(msg, dict) or "id" not in msg:
+            return
+
+        msg_type = msg.get("type")
+        if msg_type == "subscribe_trigger":
+            entity_id = msg.get("trigger", {}).get("entity_id")
+            self._triggers.setdefault(websocket, {})[msg["id"]] = entity_id
+        elif msg_type == "unsubscribe_events":
+            self._triggers.get(websocket, {}).pop(msg.get("subscription"), None)
+
+        if msg_type == "ping":
+            await websocket.send(json.dumps({"id": msg["id"], "type": "pong"}))
+        elif msg_type in COMMAND_RESULTS:
+            await websocket.send(json.dumps({
+                "id": msg["id"],
+                "type": "result",
+                "success": True,
+                "result": COMMAND_RESULTS[msg_type]
+            }))
+
+    async def _send_triggers(self, client: websocket_protocol.WebsocketConnection, frame):
+        '''
+        Sends a state_changed frame as a trigger event, for each subscription it matches.
+        Any other frame is sent as is.
+        '''
+        try:
+            event = json.loads(frame)["event"]
+            is_state_changed = event["event_type"] == "state_changed"
+        except (ValueError, KeyError, TypeError):
+            is_state_changed = False
+        if not is_state_changed:
+            await client.send(frame)
+            return
+
+        data = event["data"]
+        for subscription_id, entity_id in self._triggers[client].items():
+            if entity_id != data.get("entity_id"):
+                continue
+            await client.send(json.dumps({
+                "id": subscription_id,
+                "type": "event",
+                "event": {
+                    "variables": {
+                        "trigger": {
+                            "platform": "state",
+                            "entity_id": entity_id,
+                            "from_state": data.get("old_state"),
+                            "to_state": data.get("new_state"),
+                        }
+                    },
+                    "context": {}
+                }
+            }))
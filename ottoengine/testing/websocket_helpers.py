@@ -46,3 +46,24 @@ def event_hass_event(id, event_type: str, event_data: str):
         }
     }
     return event
+
+
+def event_state_trigger(id, entity_id: str, old_state: str, new_state: str):
+    '''The event sent to a subscribe_trigger subscription when a state trigger fires'''
+    data = event_state_changed(id, entity_id, old_state, new_state)["event"]["data"]
+    event = {
+        "id": id,
+        "type": "event",
+        "event": {
+            "variables": {
+                "trigger": {
+                    "platform": "state",
+                    "entity_id": entity_id,
+                    "from_state": data["old_state"],
+                    "to_state": data["new_state"]
+                }
+            },
+            "context": {}
+        }
+    }
+    return event
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import math
+
+_LOG = logging.getLogger(__name__)
+# _LOG.setLevel(logging.DEBUG)
+
+TICK_SECS = 0.1     # Resolution of the timers
+SLOTS = 64          # Slots per level: level n slots span TICK_SECS * SLOTS ** n
+LEVELS = 4          # 0.1s, 6.4s, ~7 minutes and ~7 hours slots: ~19 days of range
+
+
+class TimerWheel(object):
+    '''
+    Hierarchical timer wheel, for the delays of the rule runs.
+
+    The pending timers share a single event loop timer, armed for the next tick that
+    has a timer to fire or timers to move down a level, instead of one loop timer each.
+    A timer sits in a slot dict, so it is added and cancelled in O(1).  Timers beyond
+    the range of the wheel wait in its last level and move down when they get closer.
+    '''
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, tick_secs: float = TICK_SECS):
+        self._loop = loop
+        self._tick_secs = tick_secs
+        self._start = loop.time()
+        self._tick = 0      # Last tick processed
+        self._levels = [[{} for i in range(SLOTS)] for level in range(LEVELS)]
+        self._handle = None     # Loop timer of the next wakeup
+        self._wake_tick = None  # Tick of the next wakeup
+
+        self.stats = {
+            "pending": 0,
+            "scheduled": 0,
+            "fired": 0,
+            "cancelled": 0,
+            "wakeups": 0,
+        }
+
+    # ~~~~~~~~~~~~~~~~~~~
+    #   Public methods
+    # ~~~~~~~~~~~~~~~~~~~
+
+    def call_later(self, delay_secs: float, callback, *args) -> 'WheelTimer':
+        '''Calls callback(*args) after delay_secs, rounded up to the next tick'''
+        if self.stats["pending"] == 0:
+            self._tick = self._now_tick()   # Nothing to process up to now
+
+        deadline = math.ceil((self._loop.time() + delay_secs - self._start) / self._tick_secs)
+        timer = WheelTimer(self, max(deadline, self._tick + 1), callback, args)
+        self._place(timer)
+        self.stats["pending"] += 1
+        self.stats["scheduled"] += 1
+
+        if self._wake_tick is None or timer.deadline < self._wake_tick:
+            self._arm()
+        return timer
+
+    async def async_sleep(self, delay_secs: float):
+        '''Like asyncio.sleep(), with a timer of the wheel'''
+        waiter = self._loop.create_future()
+        timer = self.call_later(delay_secs, _set_result, waiter)
+        try:
+            await waiter
+        finally:
+            timer.cancel()  # No-op once fired
+
+    # ~~~~~~~~~~~~~~~~~~~~
+    #   Private methods
+    # ~~~~~~~~~~~~~~~~~~~~
+
+    def _now_tick(self) -> int:
+        return int((self._loop.time() - self._start) / self._tick_secs)
+
+    def _place(self, timer):
+        remaining = max(timer.deadline - self._tick, 0)
+        for level in range(LEVELS):
+            span = SLOTS ** level
+            if remaining < span * SLOTS:
+                break
+        else:
+            # Beyond the range, in the last slot to be reached.  Placed again from there.
+            level = LEVELS - 1
+            span = SLOTS ** level
+            remaining = span * SLOTS - 1
+        slot = self._levels[level][((self._tick + remaining) // span) % SLOTS]
+        slot[timer] = None
+        timer.slot = slot
+
+    def _remove(self, timer):
+        del timer.slot[timer]
+        timer.slot = None
+        self.stats["pending"] -= 1
+        self.stats["cancelled"] += 1
+
+    def _advance(self, now_tick: int):
+        '''Processes the ticks up to now_tick: moves timers down the levels, and fires them'''
+        while self._tick < now_tick and self.stats["pending"]:
+            self._tick += 1
+            tick = self._tick
+            for level in range(LEVELS - 1, 0, -1):
+                span = SLOTS ** level
+                if tick % span == 0:
+                    slots = self._levels[level]
+                    index = (tick // span) % SLOTS
+                    timers = slots[index]
+                    slots[index] = {}
+                    for timer in timers:
+                        self._place(timer)
+
+            slots = self._levels[0]
+            index = tick % SLOTS
+            timers = slots[index]
+            slots[index] = {}
+            for timer in timers:
+                timer.slot = None
+                self.stats["pending"] -= 1
+                self.stats["fired"] += 1
+                try:
+                    timer.callback(*timer.args)
+                except Exception:
+                    _LOG.exception("Timer callback failed")
+        self._tick = max(self._tick, now_tick)
+
+    def _arm(self):
+        '''Arms the loop timer for the next tick with timers to fire or move down'''
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+            self._wake_tick = None
+        if self.stats["pending"] == 0:
+            return
+
+        # The next level 0 slot with timers, or the next tick moving timers down
+        ticks = SLOTS - self._tick % SLOTS
+        slots = self._levels[0]
+        for i in range(1, ticks):
+            if slots[(self._tick + i) % SLOTS]:
+                ticks = i
+                break
+
+        self._wake_tick = self._tick + ticks
+        self._handle = self._loop.call_at(
+            self._start + self._wake_tick * self._tick_secs, self._wake)
+
+    def _wake(self):
+        # The loop can run the timer slightly before its time
+        now_tick = max(self._now_tick(), self._wake_tick)
+        self._handle = None
+        self._wake_tick = None
+        self.stats["wakeups"] += 1
+        self._advance(now_tick)
+        self._arm()
+
+
+class WheelTimer(object):
+    __slots__ = ["_wheel", "deadline", "callback", "args", "slot"]
+
+    def __init__(self, wheel: TimerWheel, deadline: int, callback, args):
+        self._wheel = wheel
+        self.deadline = deadline    # Tick
+        self.callback = callback
+        self.args = args
+        self.slot = None            # Slot dict holding the timer, None once fired or cancelled
+
+    def cancel(self):
+        if self.slot is not None:
+            self._wheel._remove(self)
+
+
+def _set_result(future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,96 @@
+import logging
+
+from ottoengine.model import dataobjects, rule_objects, trigger_objects
+
+_LOG = logging.getLogger(__name__)
+# _LOG.setLevel(logging.DEBUG)
+
+ANY = object()  # Key for a trigger without a to or from state
+
+
+class TriggerIndex(object):
+    '''
+    Finds the listeners whose trigger passes for an event, without evaluating the others.
+
+    StateTriggers are indexed by entity_id, then to state, then from state, so the
+    matching ones are found with a few dict lookups.  The result is the same as calling
+    eval_trigger on every listener of the entity.  NumericStateTriggers and EventTriggers
+    are indexed by entity_id and event_type, and evaluated.
+    '''
+
+    def __init__(self):
+        self._state_triggers = {}   # entity_id -> {to state -> {from state -> [listeners]}}
+        self._entity_listeners = {}     # entity_id -> [listeners evaluated on each event]
+        self._event_listeners = {}      # event_type -> [listeners]
+
+        self.stats = {
+            "listeners": 0,
+            "events": 0,
+            "matched": 0,
+        }
+
+    # ~~~~~~~~~~~~~~~~~~~
+    #   Public methods
+    # ~~~~~~~~~~~~~~~~~~~
+
+    def add(self, listener: rule_objects.HassListener):
+        trigger = listener.trigger
+        if isinstance(trigger, trigger_objects.StateTrigger):
+            by_to = self._state_triggers.setdefault(trigger.entity_id, {})
+            by_from = by_to.setdefault(_key(trigger.to_state), {})
+            by_from.setdefault(_key(trigger.from_state), []).append(listener)
+        elif isinstance(trigger, trigger_objects.NumericStateTrigger):
+            self._entity_listeners.setdefault(trigger.entity_id, []).append(listener)
+        elif isinstance(trigger, trigger_objects.EventTrigger):
+            self._event_listeners.setdefault(trigger.event_type, []).append(listener)
+        else:
+            return
+        self.stats["listeners"] += 1
+
+    def clear(self):
+        self._state_triggers = {}
+        self._entity_listeners = {}
+        self._event_listeners = {}
+        self.stats["listeners"] = 0
+
+    def match(self, event: dataobjects.HassEvent) -> list:
+        '''Returns the listeners whose trigger passes for the event'''
+        self.stats["events"] += 1
+        if isinstance(event, dataobjects.StateChangedEvent):
+            matched = self._match_state_changed(event)
+        else:
+            matched = [listener for listener in self._event_listeners.get(event.event_type, ())
+                       if listener.trigger.eval_trigger(event)]
+        self.stats["matched"] += len(matched)
+        return matched
+
+    # ~~~~~~~~~~~~~~~~~~~~
+    #   Private methods
+    # ~~~~~~~~~~~~~~~~~~~~
+
+    def _match_state_changed(self, event: dataobjects.StateChangedEvent) -> list:
+        matched = [listener for listener in self._entity_listeners.get(event.entity_id, ())
+                   if listener.trigger.eval_trigger(event)]
+
+        by_to = self._state_triggers.get(event.entity_id)
+        if by_to is None:
+            return matched
+
+        # StateTriggers don't fire when only the attributes changed
+        new_state = event.new_state_obj.state
+        old_state = event.old_state_obj.state
+        if new_state == old_state:
+            return matched
+
+        for to_key in (new_state, ANY):
+            by_from = by_to.get(to_key)
+            if by_from is not None:
+                for from_key in (old_state, ANY):
+                    listeners = by_from.get(from_key)
+                    if listeners is not None:
+                        matched.extend(listeners)
+        return matched
+
+
+def _key(state):
+    return ANY if state is None else state
@@ -0,0 +1,460 @@
+'''
+Websocket framing (RFC 6455) with the permessage-deflate extension (RFC 7692).
+
+This module provides the client connection and test server used by Otto Engine, with
+the send / recv / close interface of a websocket client library.
+'''
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import struct
+import time
+import urllib.parse
+import zlib
+
+_LOG = logging.getLogger(__name__)
+# _LOG.setLevel(logging.DEBUG)
+
+_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+_CONTINUATION = 0x0
+_TEXT = 0x1
+_BINARY = 0x2
+_CLOSE = 0x8
+_PING = 0x9
+_PONG = 0xA
+
+_FIN = 0x80
+_RSV1 = 0x40
+_MASK = 0x80
+
+MAX_HEADER_BYTES = 65536
+MAX_PAYLOAD_BYTES = 33554432    # Also applies to the decompressed size of a message
+HANDSHAKE_TIMEOUT_SECS = 10
+
+PERMESSAGE_DEFLATE = "permessage-deflate"
+COMPRESS_MIN_BYTES = 128        # Smaller messages are sent uncompressed
+_DEFLATE_TAIL = b"\x00\x00\xff\xff"
+
+
+class ProtocolError(Exception):
+    '''Exception class for websocket handshake and framing errors'''
+
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class PerMessageDeflate(object):
+    '''
+    Compresses and decompresses messages with the negotiated permessage-deflate parameters.
+
+    The parameters are named from the client's point of view, as in the handshake headers.
+    Raises ProtocolError if the parameters can't be honored, so the offer can be declined.
+    '''
+
+    def __init__(self, params: dict, is_server: bool):
+        ours, theirs = ("server", "client") if is_server else ("client", "server")
+
+        self._reset_compressor = "{}_no_context_takeover".format(ours) in params
+        self._reset_decompressor = "{}_no_context_takeover".format(theirs) in params
+
+        # zlib can't compress with an 8 bit window, and a wider one would break the peer
+        window_bits = params.get("{}_max_window_bits".format(ours)) or "15"
+        if not window_bits.isdigit() or not 9 <= int(window_bits) <= 15:
+            raise ProtocolError("Unsupported {}_max_window_bits: {}".format(ours, window_bits))
+        self._window_bits = int(window_bits)
+
+        self._compressor = self._new_compressor()
+        # Decompressing with the largest window works for any window the peer used
+        self._decompressor = zlib.decompressobj(-15)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._reset_compressor:
+            self._compressor = self._new_compressor()
+        compressed = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return compressed[:-4] if compressed.endswith(_DEFLATE_TAIL) else compressed
+
+    def decompress(self, data: bytes) -> bytes:
+        if self._reset_decompressor:
+            self._decompressor = zlib.decompressobj(-15)
+        decompressed = self._decompressor.decompress(data + _DEFLATE_TAIL, MAX_PAYLOAD_BYTES)
+        if self._decompressor.unconsumed_tail:
+            raise ProtocolError("Decompressed message is too large")
+        return decompressed
+
+    def _new_compressor(self):
+        return zlib.compressobj(6, zlib.DEFLATED, -self._window_bits)
+
+
+class WebsocketConnection(object):
+    '''
+    One end of a websocket connection.
+
+    If stats is given, the byte counters of this connection are added to it:
+    bytes on the wire and uncompressed, in each direction, and the time spent compressing.
+    '''
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 is_client: bool, deflate: PerMessageDeflate = None, stats: dict = None):
+        self.writer = writer
+        self._reader = reader
+        self._mask = is_client      # Clients must mask their frames, servers must not
+        self._deflate = deflate
+        self._closed = False
+
+        self.stats = stats if stats is not None else {}
+        for key in ["bytes_in", "bytes_in_raw", "bytes_out", "bytes_out_raw"]:
+            self.stats.setdefault(key, 0)
+        self.stats.setdefault("compression_ratio_in", 1.0)
+        self.stats.setdefault("compression_ratio_out", 1.0)
+        self.stats.setdefault("compression_ms", 0.0)
+        self.stats["compression"] = deflate is not None
+
+    @property
+    def compressed(self) -> bool:
+        '''True if permessage-deflate was negotiated'''
+        return self._deflate is not None
+
+    # ~~~~~~~~~~~~~~~~~~~
+    #   Public methods
+    # ~~~~~~~~~~~~~~~~~~~
+
+    async def send(self, data):
+        '''
+        Sends str as a text message, and bytes as a binary message.
+        Waits while the transport's buffer is full, and raises ConnectionError if the
+        connection is lost.
+        '''
+        if isinstance(data, str):
+            await self.send_text(data.encode("utf-8"))
+        else:
+            self._send_message(_BINARY, data)
+            await self._async_drain()
+
+    async def send_text(self, payload: bytes):
+        '''Sends UTF-8 encoded bytes as a text message, like send()'''
+        self._send_message(_TEXT, payload)
+        await self._async_drain()
+
+    async def recv(self):
+        '''
+        Returns the next message, as str for a text message and bytes for a binary message.
+        Returns None once the connection is closed, or on a protocol error.
+        '''
+        try:
+            return await self._async_recv_message()
+        except (ProtocolError, zlib.error, asyncio.IncompleteReadError, ConnectionError) as e:
+            if not isinstance(e, asyncio.IncompleteReadError):
+                _LOG.warning("Websocket closed: {}".format(str(e)))
+            self.writer.close()
+            return None
+
+    async def close(self, status: int = 1000):
+        '''Sends a close frame, then closes the connection'''
+        if not self._closed:
+            self._closed = True
+            self._write_frame(_CLOSE, struct.pack("!H", status))
+            try:
+                await self.writer.drain()
+            except ConnectionError:
+                pass
+        self.writer.close()
+
+    # ~~~~~~~~~~~~~~~~~~~~
+    #   Private methods
+    # ~~~~~~~~~~~~~~~~~~~~
+
+    async def _async_drain(self):
+        try:
+            await self.writer.drain()
+        except ConnectionError as e:
+            _LOG.warning("Websocket closed: {}".format(str(e)))
+            self.writer.close()
+            raise
+
+    def _send_message(self, opcode: int, payload: bytes):
+        self.stats["bytes_out_raw"] += len(payload)
+        rsv = 0
+        if self._deflate is not None and len(payload) >= COMPRESS_MIN_BYTES:
+            start = time.perf_counter()
+            payload = self._deflate.compress(payload)
+            self.stats["compression_ms"] += (time.perf_counter() - start) * 1000
+            rsv = _RSV1
+        self.stats["bytes_out"] += len(payload)
+        self.stats["compression_ratio_out"] = _ratio(
+            self.stats["bytes_out_raw"], self.stats["bytes_out"])
+        self._write_frame(opcode, payload, rsv)
+
+    def _write_frame(self, opcode: int, payload: bytes, rsv: int = 0):
+        header = bytearray([_FIN | rsv | opcode])
+        mask_bit = _MASK if self._mask else 0
+        length = len(payload)
+        if length <= 125:
+            header.append(mask_bit | length)
+        elif length <= 65535:
+            header.append(mask_bit | 126)
+            header.extend(struct.pack("!H", length))
+        else:
+            header.append(mask_bit | 127)
+            header.extend(struct.pack("!Q", length))
+
+        if self._mask:
+            mask = os.urandom(4)
+            header.extend(mask)
+            payload = _apply_mask(payload, mask)
+        self.writer.write(bytes(header) + payload)
+
+    async def _async_recv_message(self):
+        opcode = None
+        compressed = False
+        fragments = []
+
+        while True:
+            first, rsv, frame_opcode, payload = await self._async_read_frame()
+
+            if frame_opcode == _CLOSE:
+                if not self._closed:
+                    self._closed = True
+                    self._write_frame(_CLOSE, payload[:2])
+                self.writer.close()
+                return None
+            elif frame_opcode == _PING:
+                self._write_frame(_PONG, payload)
+                continue
+            elif frame_opcode == _PONG:
+                continue
+            elif frame_opcode == _CONTINUATION:
+                if opcode is None:
+                    raise ProtocolError("Continuation frame without a message")
+            else:
+                if opcode is not None:
+                    raise ProtocolError("New message before the last one finished")
+                opcode = frame_opcode
+                compressed = bool(rsv & _RSV1)
+                if compressed and self._deflate is None:
+                    raise ProtocolError("Compressed frame, but compression was not negotiated")
+
+            fragments.append(payload)
+            if sum(len(f) for f in fragments) > MAX_PAYLOAD_BYTES:
+                raise ProtocolError("Message is too large")
+            if first & _FIN:
+                break
+
+        data = b"".join(fragments)
+        self.stats["bytes_in"] += len(data)
+        if compressed:
+            start = time.perf_counter()
+            data = self._deflate.decompress(data)
+            self.stats["compression_ms"] += (time.perf_counter() - start) * 1000
+        self.stats["bytes_in_raw"] += len(data)
+        self.stats["compression_ratio_in"] = _ratio(
+            self.stats["bytes_in_raw"], self.stats["bytes_in"])
+
+        if opcode == _TEXT:
+            try:
+                return data.decode("utf-8")
+            except UnicodeDecodeError:
+                raise ProtocolError("Text message is not valid UTF-8")
+        return data
+
+    async def _async_read_frame(self) -> tuple:
+        '''Returns (first header byte, RSV bits, opcode, unmasked payload)'''
+        first, second = await self._reader.readexactly(2)
+        rsv = first & 0x70
+        opcode = first & 0x0F
+
+        # RSV1 marks a compressed message, and is only allowed on its first frame
+        if rsv & ~_RSV1 or (rsv and opcode not in (_TEXT, _BINARY)):
+            raise ProtocolError("Unexpected RSV bits: {}".format(rsv))
+        if opcode not in (_CONTINUATION, _TEXT, _BINARY, _CLOSE, _PING, _PONG):
+            raise ProtocolError("Unknown opcode: {}".format(opcode))
+
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", await self._reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await self._reader.readexactly(8))[0]
+        if opcode >= _CLOSE and length > 125:
+            raise ProtocolError("Control frame is too large")
+        if length > MAX_PAYLOAD_BYTES:
+            raise ProtocolError("Frame is too large")
+
+        mask = await self._reader.readexactly(4) if second & _MASK else None
+        payload = await self._reader.readexactly(length) if length else b""
+        if mask is not None:
+            payload = _apply_mask(payload, mask)
+        return first, rsv, opcode, payload
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#   Handshakes
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+async def async_connect(url: str, ssl=None, compress: bool = True,
+                        stats: dict = None) -> WebsocketConnection:
+    '''
+    Connects to a websocket server, offering permessage-deflate if compress is True.
+    Raises ProtocolError if the handshake fails.
+    '''
+    parsed = urllib.parse.urlparse(url)
+    port = parsed.port or (443 if parsed.scheme == "wss" else 80)
+    path = (parsed.path or "/") + ("?" + parsed.query if parsed.query else "")
+
+    reader, writer = await asyncio.open_connection(parsed.hostname, port, ssl=ssl)
+    try:
+        key = base64.b64encode(os.urandom(16)).decode()
+        request = [
+            "GET {} HTTP/1.1".format(path),
+            "Host: {}".format(parsed.netloc),
+            "Upgrade: websocket",
+            "Connection: Upgrade",
+            "Sec-WebSocket-Key: {}".format(key),
+            "Sec-WebSocket-Version: 13",
+        ]
+        if compress:
+            # client_max_window_bits isn't offered, so the server can't pick a window
+            # zlib can't compress with
+            request.append("Sec-WebSocket-Extensions: {}".format(PERMESSAGE_DEFLATE))
+        writer.write(("\r\n".join(request) + "\r\n\r\n").encode())
+
+        status_line, headers = await asyncio.wait_for(
+            _async_read_headers(reader), HANDSHAKE_TIMEOUT_SECS)
+        if " 101 " not in status_line + " ":
+            raise ProtocolError("Websocket upgrade refused: {}".format(status_line))
+        if headers.get("sec-websocket-accept") != _accept_key(key):
+            raise ProtocolError("Sec-WebSocket-Accept does not match")
+
+        deflate = None
+        for name, params in _parse_extensions(headers.get("sec-websocket-extensions", "")):
+            if name == PERMESSAGE_DEFLATE and compress:
+                deflate = PerMessageDeflate(params, is_server=False)
+            else:
+                raise ProtocolError("Server accepted an extension that was not offered")
+
+    except BaseException:
+        writer.close()
+        raise
+
+    _LOG.info("Websocket connected, compression: {}".format(deflate is not None))
+    return WebsocketConnection(reader, writer, is_client=True, deflate=deflate, stats=stats)
+
+
+async def async_start_server(handler, host: str, port: int, compress: bool = True):
+    '''
+    Starts a websocket server.  handler is a coroutine function called with the
+    WebsocketConnection of each client.  Clients that offer permessage-deflate get it
+    if compress is True.
+    '''
+    async def _async_handle(reader, writer):
+        try:
+            deflate = await asyncio.wait_for(
+                _async_accept(reader, writer, compress), HANDSHAKE_TIMEOUT_SECS)
+            await handler(WebsocketConnection(reader, writer, is_client=False, deflate=deflate))
+        except (ProtocolError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                ConnectionError) as e:
+            _LOG.warning("Websocket handshake failed: {}".format(str(e)))
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(_async_handle, host, port)
+
+
+async def _async_accept(reader, writer, compress: bool) -> PerMessageDeflate:
+    request_line, headers = await _async_read_headers(reader)
+    key = headers.get("sec-websocket-key")
+    if key is None or "websocket" not in headers.get("upgrade", "").lower():
+        writer.write(b"HTTP/1.1 400 Bad Request\r\n\r\n")
+        raise ProtocolError("Not a websocket upgrade request: {}".format(request_line))
+
+    response = [
+        "HTTP/1.1 101 Switching Protocols",
+        "Upgrade: websocket",
+        "Connection: Upgrade",
+        "Sec-WebSocket-Accept: {}".format(_accept_key(key)),
+    ]
+
+    deflate = None
+    for name, params in _parse_extensions(headers.get("sec-websocket-extensions", "")):
+        if name == PERMESSAGE_DEFLATE and compress:
+            # Accept the first offer the server can honor, keeping only its parameters
+            accepted = {k: v for k, v in params.items()
+                        if k in ("server_no_context_takeover", "server_max_window_bits")}
+            try:
+                deflate = PerMessageDeflate(accepted, is_server=True)
+            except ProtocolError as e:
+                _LOG.debug("Declined {} offer: {}".format(PERMESSAGE_DEFLATE, str(e)))
+                continue
+            response.append("Sec-WebSocket-Extensions: {}".format(
+                _format_extension(PERMESSAGE_DEFLATE, accepted)))
+            break
+
+    writer.write(("\r\n".join(response) + "\r\n\r\n").encode())
+    return deflate
+
+
+async def _async_read_headers(reader) -> tuple:
+    '''Returns the first line, and a dict of the headers with lower case names'''
+    lines = []
+    size = 0
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ProtocolError("Connection closed during the handshake")
+        size += len(line)
+        if size > MAX_HEADER_BYTES:
+            raise ProtocolError("Handshake headers are too large")
+        line = line.decode("latin-1").rstrip("\r\n")
+        if not line:
+            break
+        lines.append(line)
+
+    if not lines:
+        raise ProtocolError("Empty handshake")
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        name = name.strip().lower()
+        if name in headers:
+            headers[name] += ", " + value.strip()
+        else:
+            headers[name] = value.strip()
+    return lines[0], headers
+
+
+def _parse_extensions(header: str) -> list:
+    '''Returns a list of (extension name, {param: value or None})'''
+    extensions = []
+    for extension in header.split(","):
+        parts = [p.strip() for p in extension.split(";") if p.strip()]
+        if parts:
+            params = {}
+            for param in parts[1:]:
+                name, _, value = param.partition("=")
+                params[name.strip()] = value.strip().strip('"') or None
+            extensions.append((parts[0], params))
+    return extensions
+
+
+def _format_extension(name: str, params: dict) -> str:
+    return "; ".join(
+        [name] + [k if v is None else "{}={}".format(k, v) for k, v in params.items()])
+
+
+def _accept_key(key: str) -> str:
+    return base64.b64encode(hashlib.sha1((key + _GUID).encode()).digest()).decode()
+
+
+def _apply_mask(payload: bytes, mask: bytes) -> bytes:
+    '''XORs the payload with the repeated 4 byte mask, as one big integer operation'''
+    length = len(payload)
+    if not length:
+        return payload
+    repeated = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")).to_bytes(
+        length, "big")
+
+
+def _ratio(raw: int, wire: int) -> float:
+    return raw / wire if wire else 1.0
@@ -31,7 +31,8 @@ if len(sys.argv) > 1:
 
 # Initialize the engine
 loop = asyncio.get_event_loop()
-clock = clock.EngineClock(config.tz, loop=loop)
+clock = clock.EngineClock(
+    config.tz, loop=loop, mode=config.clock_mode, spread_secs=config.clock_spread_secs)
 persistence_mgr = persistence.PersistenceManager(config.json_rules_dir)
 engine_log = enginelog.EngineLog()
 
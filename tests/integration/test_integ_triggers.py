@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import asyncio
-import asyncws
 import json
 import unittest
 
@@ -10,6 +9,7 @@ from ottoengine.model.trigger_objects import StateTrigger, NumericStateTrigger,
 from ottoengine.model.action_objects import ServiceAction
 from ottoengine.model.rule_objects import RuleAction
 from ottoengine.model.condition_objects import StateCondition
+from ottoengine import websocket_protocol
 from ottoengine.testing import websocket_helpers, restapi_helpers
 
 
@@ -79,7 +79,7 @@ class TestTriggers(unittest.TestCase):
             restapi_helpers.reload_rules(self, RESTURL)
 
             # Send the event
-            websocket = await asyncws.connect(WSURL)
+            websocket = await websocket_protocol.async_connect(WSURL)
             event = websocket_helpers.event_state_changed(
                 1, trig_entity_id, trig_old_state, trig_new_state)
             await websocket.send(json.dumps(event))
@@ -116,7 +116,7 @@ class TestTriggers(unittest.TestCase):
             restapi_helpers.reload_rules(self, RESTURL)
 
             # Send the event
-            websocket = await asyncws.connect(WSURL)
+            websocket = await websocket_protocol.async_connect(WSURL)
             event = websocket_helpers.event_state_changed(
                 1, trig_entity_id, event_old_val, event_new_val)
             await websocket.send(json.dumps(event))
@@ -148,7 +148,7 @@ class TestTriggers(unittest.TestCase):
             restapi_helpers.reload_rules(self, RESTURL)
 
             # Send the event
-            websocket = await asyncws.connect(WSURL)
+            websocket = await websocket_protocol.async_connect(WSURL)
             event = websocket_helpers.event_hass_event(rule_id, trig_event_type, trig_event_data)
             await websocket.send(json.dumps(event))
             print("event sent")
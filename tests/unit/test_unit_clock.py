@@ -85,6 +85,204 @@ class TestClock(unittest.TestCase):
             len(self.clock.timeline), 0,
             msg="Expecing an empty timeline, but it found non-empty")
 
+    def test_timeline_order_and_removal(self):
+        """Tests the timeline stays in time order as actions are added and removed by ID
+        """
+        fired = []
+
+        def _make_action(minute):
+            async def _action():
+                fired.append(minute)
+            return _action
+
+        nowtime = parser.parse("2018-01-01 00:00:30-00:00")
+        for spec_id, minute in [("a", 7), ("b", 3), ("c", 9), ("d", 3), ("e", 1), ("f", 5)]:
+            spec = clock.TimeSpec.from_dict({"tz": "UTC", "minute": minute})
+            self.clock.add_timespec_action(spec_id, _make_action(minute), spec, nowtime)
+
+        times = [alarm.alarm_time.minute for alarm in self.clock.timeline]
+        self.assertEqual(times, [1, 3, 5, 7, 9])
+        self.assertEqual(len(self.clock.timeline[1].actions), 2)
+
+        # Removing the only action of an alarm removes the alarm, but not its neighbours
+        self.clock.remove_timespec_action("f")
+        self.clock.remove_timespec_action("b")
+        self.assertEqual([a.alarm_time.minute for a in self.clock.timeline], [1, 3, 7, 9])
+        self.clock.remove_timespec_action("unknown")
+
+        self.loop.run_until_complete(
+            self.clock._async_tick(parser.parse("2018-01-01 00:08:00-00:00")))
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(fired, [1, 3, 7])
+
+        # The fired actions are rescheduled an hour later, the 9th minute is still pending
+        self.assertEqual(
+            [a.alarm_time.hour for a in self.clock.timeline], [0, 1, 1, 1])
+
+    def test_wakes_at_earliest_alarm(self):
+        """Tests the running clock sleeps until an alarm added while it sleeps
+        """
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        engine_clock = clock.EngineClock(TZ, loop=loop)
+        fired = []
+
+        class _Once(object):
+            spread = None
+
+            def next_time_from(self, dt):
+                return dt + datetime.timedelta(days=1)
+
+        async def _action():
+            fired.append(nowutc())
+
+        async def _scenario():
+            task = loop.create_task(engine_clock.async_run())
+            await asyncio.sleep(0.01)
+            self.assertEqual(engine_clock.stats["wakeups"], 0)
+
+            # Later alarm first, then an earlier one that must re-arm the wakeup
+            for spec_id, delay_secs in [("later", 0.5), ("sooner", 0.05)]:
+                engine_clock._add_action_to_timeline(
+                    nowutc() + datetime.timedelta(seconds=delay_secs),
+                    clock.AlarmTimeSpecAction(spec_id, _action, _Once()))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            await asyncio.sleep(0)
+
+        loop.run_until_complete(_scenario())
+        self.assertEqual(len(fired), 1)
+        self.assertEqual(engine_clock.stats["fired"], 1)
+        self.assertLessEqual(engine_clock.stats["wakeups"], 2)
+        self.assertLess(engine_clock.stats["max_lateness_ms"], 100)
+        self.assertEqual(sum(engine_clock.stats["lateness_ms"].values()), 1)
+
+    def test_cron_table_mode(self):
+        """Tests compiled TimeSpecs fire from the cron table, and others from the timeline
+        """
+        table_clock = clock.EngineClock(TZ, loop=self.loop, mode=clock.MODE_CRON_TABLE)
+        fired = []
+
+        def _make_action(name):
+            async def _action():
+                fired.append(name)
+            return _action
+
+        nowtime = parser.parse("2018-01-01 00:00:30-00:00")
+        specs = [
+            ("every_minute", {"tz": "UTC"}),
+            ("every_5", {"tz": "UTC", "minute": "*/5"}),
+            ("local_4pm", {"tz": TZ, "minute": 0, "hour": 16}),     # 00:00 UTC
+        ]
+        for name, spec in specs:
+            table_clock.add_timespec_action(
+                name, _make_action(name), clock.TimeSpec.from_dict(spec), nowtime)
+        self.assertEqual(table_clock.stats["table_rows"], 3)
+        self.assertEqual(len(table_clock.timeline), 0)
+
+        self.loop.run_until_complete(
+            table_clock._async_tick(nowtime + datetime.timedelta(seconds=30)))
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(fired, ["every_minute"])
+
+        # Weekday names use croniter, on the timeline
+        spec = clock.TimeSpec.from_dict({"tz": "UTC", "minute": 2, "weekdays": "mon"})
+        table_clock.add_timespec_action("named", _make_action("named"), spec, nowtime)
+        self.assertEqual(len(table_clock.timeline), 1)
+
+        for minute in range(2, 6):
+            self.loop.run_until_complete(table_clock._async_tick(
+                nowtime + datetime.timedelta(minutes=minute, seconds=-30)))
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(fired.count("every_minute"), 5)
+        self.assertEqual(fired.count("every_5"), 1)
+        self.assertEqual(fired.count("named"), 1)
+        self.assertEqual(fired.count("local_4pm"), 0)
+
+        # Removing the last row stops matching the tables
+        for name in ["every_minute", "every_5", "local_4pm"]:
+            table_clock.remove_timespec_action(name)
+        self.assertIsNone(table_clock._table_next)
+        self.assertEqual(table_clock.stats["table_rows"], 0)
+
+    def test_cron_table_catch_up(self):
+        """Tests rows due in minutes missed by a late tick fire once, like overdue alarms
+        """
+        table_clock = clock.EngineClock(TZ, loop=self.loop, mode=clock.MODE_CRON_TABLE)
+        fired = []
+
+        def _make_action(name):
+            async def _action():
+                fired.append(name)
+            return _action
+
+        nowtime = parser.parse("2018-01-01 00:00:30-00:00")
+        specs = [
+            ("every_minute", {"tz": "UTC"}),
+            ("minute_3", {"tz": "UTC", "minute": 3}),
+            ("minute_20", {"tz": "UTC", "minute": 20}),
+        ]
+        for name, spec in specs:
+            table_clock.add_timespec_action(
+                name, _make_action(name), clock.TimeSpec.from_dict(spec), nowtime)
+
+        # The loop was stuck until 00:10:30, well past the grace period of 00:01
+        self.loop.run_until_complete(
+            table_clock._async_tick(nowtime + datetime.timedelta(minutes=10)))
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(sorted(fired), ["every_minute", "minute_3"])
+        self.assertEqual(table_clock._table_next, parser.parse("2018-01-01 00:11:00-00:00"))
+
+        print("Matching resumes on the next minute")
+        self.loop.run_until_complete(
+            table_clock._async_tick(nowtime + datetime.timedelta(minutes=11)))
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(fired.count("every_minute"), 2)
+        self.assertEqual(fired.count("minute_3"), 1)
+        self.assertEqual(fired.count("minute_20"), 0)
+
+    def test_spread_actions(self):
+        """Tests actions firing together start at their deterministic offset in the window
+        """
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        spread_clock = clock.EngineClock(TZ, loop=loop, spread_secs=0.2)
+        started = []
+
+        def _make_action(name):
+            async def _action():
+                started.append(name)
+            return _action
+
+        nowtime = parser.parse("2018-01-01 00:00:30-00:00")
+        for name, spread in [("a", None), ("b", None), ("c", None), ("now", 0)]:
+            spec = clock.TimeSpec.from_dict({"tz": "UTC", "spread": spread})
+            spread_clock.add_timespec_action(
+                name, _make_action(name), spec, nowtime, spread_key="rule_" + name)
+
+        actions = spread_clock.timeline[0].actions
+        offsets = [spread_clock._get_spread_offset(action) for action in actions]
+        self.assertEqual(
+            offsets, [spread_clock._get_spread_offset(action) for action in actions])
+        self.assertTrue(all(0 <= offset < 0.2 for offset in offsets))
+        self.assertEqual(offsets[3], 0)     # The TimeSpec's spread overrides the clock's
+
+        async def _scenario():
+            await spread_clock._async_tick(nowtime + datetime.timedelta(seconds=30))
+            await asyncio.sleep(0)
+            self.assertEqual(started, ["now"])
+            self.assertEqual(spread_clock.stats["peak_burst"], 4)
+
+            spread_clock.remove_timespec_action("c")    # Cancels its pending start
+            await asyncio.sleep(0.25)
+
+        loop.run_until_complete(_scenario())
+        expected = sorted(["a", "b"], key=lambda name: offsets["abc".index(name)])
+        self.assertEqual(started, ["now"] + expected)
+        self.assertEqual(spread_clock.stats["spread_actions"], 3)
+        self.assertEqual(spread_clock.stats["spread_pending"], 0)
+        self.assertEqual(spread_clock.stats["starts"]["total"], 3)
+
     def test_except_invalid_action_function(self):
         spec = clock.TimeSpec.from_dict({"tz": "UTC"})
         spec_id = uuid.uuid4()
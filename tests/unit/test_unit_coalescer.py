@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+import asyncio
+import unittest
+
+from ottoengine import coalescer
+from ottoengine.model import dataobjects
+
+
+class TestServiceCallCoalescer(unittest.TestCase):
+
+    def setUp(self):
+        print()
+        self.loop = asyncio.get_event_loop()
+        self.sent = []
+
+        async def _async_send(service_call):
+            self.sent.append(service_call.serialize())
+            return True
+
+        self.coalescer = coalescer.ServiceCallCoalescer(self.loop, _async_send, 5)
+
+    def _call_all(self, *service_calls):
+        async def _async_call_all():
+            return await asyncio.gather(
+                *[self.coalescer.async_call_service(c) for c in service_calls])
+        return self.loop.run_until_complete(_async_call_all())
+
+    def test_identical_calls_are_deduplicated(self):
+        calls = [dataobjects.ServiceCall(
+            "light", "turn_on", {"entity_id": "light.group", "brightness": 255})
+            for i in range(15)]
+        results = self._call_all(*calls)
+
+        self.assertEqual(results, [True] * 15)
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(self.sent[0]["service_data"]["entity_id"], "light.group")
+        self.assertEqual(self.coalescer.stats["deduplicated"], 14)
+        self.assertEqual(self.coalescer.stats["saved"], 14)
+
+    def test_entity_ids_are_merged(self):
+        results = self._call_all(
+            dataobjects.ServiceCall("light", "turn_on", {"entity_id": "light.a"}),
+            dataobjects.ServiceCall("light", "turn_on", {"entity_id": ["light.b", "light.a"]}),
+            dataobjects.ServiceCall("light", "turn_on", {"entity_id": "light.c"}),
+            dataobjects.ServiceCall("light", "turn_off", {"entity_id": "light.d"}),
+            dataobjects.ServiceCall("light", "turn_on", {"entity_id": "light.e",
+                                                         "brightness": 10}),
+        )
+
+        self.assertEqual(results, [True] * 5)
+        self.assertEqual(len(self.sent), 3)
+        self.assertIn({"domain": "light", "service": "turn_on",
+                       "service_data": {"entity_id": ["light.a", "light.b", "light.c"]}},
+                      self.sent)
+        self.assertEqual(self.coalescer.stats["merged"], 2)
+        self.assertEqual(self.coalescer.stats["saved"], 2)
+
+    def test_calls_without_entity_id_are_not_merged(self):
+        self._call_all(
+            dataobjects.ServiceCall("light", "turn_on", {"entity_id": "light.a"}),
+            dataobjects.ServiceCall("light", "turn_on", None),
+        )
+        self.assertEqual(len(self.sent), 2)
+
+    def test_non_idempotent_calls_are_always_sent(self):
+        results = self._call_all(
+            dataobjects.ServiceCall("switch", "toggle", {"entity_id": "switch.fan"}),
+            dataobjects.ServiceCall("switch", "toggle", {"entity_id": "switch.fan"}),
+            dataobjects.ServiceCall("switch", "toggle", {"entity_id": "switch.lamp"}),
+            dataobjects.ServiceCall("notify", "mobile_app", {"message": "Hi"}),
+            dataobjects.ServiceCall("notify", "mobile_app", {"message": "Hi"}),
+            dataobjects.ServiceCall("script", "turn_on", {"entity_id": "script.chime"}),
+            dataobjects.ServiceCall("script", "turn_on", {"entity_id": "script.chime"}),
+            dataobjects.ServiceCall("climate", "set_temperature",
+                                    {"entity_id": "climate.a", "temperature": 20}),
+            dataobjects.ServiceCall("climate", "set_temperature",
+                                    {"entity_id": "climate.a", "temperature": 20}),
+        )
+
+        self.assertEqual(results, [True] * 9)
+        self.assertEqual(len(self.sent), 8)
+        print("Held calls are sent in order")
+        self.assertEqual([c["service_data"].get("entity_id") for c in self.sent[:3]],
+                         ["switch.fan", "switch.fan", "switch.lamp"])
+        self.assertEqual(self.coalescer.stats["saved"], 1)
+
+    def test_conflicting_calls_keep_their_order(self):
+        results = self._call_all(
+            dataobjects.ServiceCall("light", "turn_on", {"entity_id": "light.a"}),
+            dataobjects.ServiceCall("light", "turn_off", {"entity_id": "light.a"}),
+            dataobjects.ServiceCall("light", "turn_on", {"entity_id": "light.a"}),
+        )
+
+        self.assertEqual(results, [True] * 3)
+        self.assertEqual([c["service"] for c in self.sent], ["turn_on", "turn_off", "turn_on"])
+        self.assertEqual(self.coalescer.stats["conflicts"], 2)
+        self.assertEqual(self.coalescer.stats["saved"], 0)
+
+        print("Calls on other entities are still merged")
+        self.sent = []
+        self._call_all(
+            dataobjects.ServiceCall("light", "turn_on", {"entity_id": "light.a"}),
+            dataobjects.ServiceCall("light", "turn_off", {"entity_id": "light.b"}),
+            dataobjects.ServiceCall("light", "turn_on", {"entity_id": "light.c"}),
+        )
+        self.assertEqual(len(self.sent), 2)
+
+    def test_calls_in_later_windows_are_sent(self):
+        call = dataobjects.ServiceCall("switch", "toggle", {"entity_id": "switch.fan"})
+        self._call_all(call)
+        self._call_all(call)
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(self.coalescer.stats["saved"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
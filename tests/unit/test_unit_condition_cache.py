@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+import unittest
+
+from ottoengine import condition_cache, persistence, state
+from ottoengine.model import dataobjects
+
+
+class TestConditionCache(unittest.TestCase):
+
+    def setUp(self):
+        print()
+        self.states = state.OttoEngineState()
+        self.cache = condition_cache.ConditionCache(self.states.entity_versions)
+        self.persist_mgr = persistence.PersistenceManager("/tmp/ottoengine_test_rules")
+
+    def _set_state(self, entity_id, value):
+        self.states.set_entity_state(
+            entity_id, dataobjects.EntityState(entity_id, value, {}, None))
+
+    def test_entity_versions(self):
+        self.assertNotIn("switch.a", self.states.entity_versions)
+        self._set_state("switch.a", "on")
+        self._set_state("switch.a", "on")
+        self.assertEqual(self.states.entity_versions["switch.a"], 2)
+
+    def test_result_reused_until_entity_changes(self):
+        cond = self.persist_mgr._condition_from_dict({"condition": "or", "conditions": [
+            {"condition": "state", "entity_id": "person.a", "state": "home"},
+            {"condition": "state", "entity_id": "person.b", "state": "home"},
+        ]})
+        compiled = cond.compile(self.cache)
+        self._set_state("person.a", "away")
+        self._set_state("person.b", "home")
+
+        self.assertTrue(compiled(self.states.entity_states))
+        self.assertTrue(compiled(self.states.entity_states))
+        self.assertTrue(compiled(self.states.entity_states))
+        self.assertEqual(self.cache.stats["misses"], 1)
+        self.assertEqual(self.cache.stats["hits"], 2)
+
+        self._set_state("switch.other", "on")   # Not read by the condition
+        self.assertTrue(compiled(self.states.entity_states))
+        self.assertEqual(self.cache.stats["hits"], 3)
+
+        self._set_state("person.b", "away")
+        self.assertFalse(compiled(self.states.entity_states))
+        self.assertEqual(self.cache.stats["misses"], 2)
+
+    def test_clear_drops_results(self):
+        cond = self.persist_mgr._condition_from_dict({"condition": "or", "conditions": [
+            {"condition": "state", "entity_id": "person.a", "state": "home"},
+            {"condition": "state", "entity_id": "person.b", "state": "home"},
+        ]})
+        compiled = cond.compile(self.cache)
+        self._set_state("person.a", "home")
+        self.assertTrue(compiled(self.states.entity_states))
+        self.assertEqual(self.cache.stats["entries"], 1)
+
+        print("A closure kept past a reload runs the condition again")
+        self.cache.clear()
+        self.assertEqual(self.cache.stats["entries"], 0)
+        self.assertTrue(compiled(self.states.entity_states))
+        self.assertEqual(self.cache.stats["misses"], 2)
+        self.assertEqual(self.cache.stats["hits"], 0)
+
+    def test_state_only_parts_of_timed_conditions(self):
+        # The time condition is evaluated each time, the and condition beside it is cached
+        cond = self.persist_mgr._condition_from_dict({"condition": "and", "conditions": [
+            {"condition": "time", "after": "00:00:00"},
+            {"condition": "and", "conditions": [
+                {"condition": "state", "entity_id": "person.a", "state": "home"},
+                {"condition": "numeric_state", "entity_id": "sensor.lux", "below_value": 10},
+            ]},
+        ]})
+        compiled = cond.compile(self.cache)
+        self._set_state("person.a", "home")
+        self._set_state("sensor.lux", "5")
+
+        self.assertEqual(self.cache.stats["entries"], 1)
+        self.assertTrue(compiled(self.states.entity_states))
+        self.assertTrue(compiled(self.states.entity_states))
+        self.assertEqual(self.cache.stats["hits"], 1)
+
+        self._set_state("sensor.lux", "50")
+        self.assertFalse(compiled(self.states.entity_states))
+        self.assertEqual(self.cache.stats["misses"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+import datetime
+import itertools
+import unittest
+from unittest import mock
+
+from dateutil.parser import parse
+
+from ottoengine import helpers, persistence, state
+from ottoengine.model import condition_objects, dataobjects
+
+PT_TZ = 'America/Los_Angeles'
+
+STATE_VALUES = [None, "on", "off", "5", "17", "20.5", "25", "unknown"]
+
+
+class _FakeEngine(object):
+    '''Just enough of an engine for RuleCondition.evaluate()'''
+
+    def __init__(self):
+        self.states = state.OttoEngineState()
+
+
+class TestConditionCompile(unittest.TestCase):
+    '''The compiled closures must return what the evaluate() interpreter returns'''
+
+    def setUp(self):
+        print()
+        self.persist_mgr = persistence.PersistenceManager("/tmp/ottoengine_test_rules")
+
+    def _assert_equivalent(self, cond_dict, engine_obj):
+        cond = self.persist_mgr._condition_from_dict(cond_dict)
+        compiled = cond.compile()
+        expected = _call(cond.evaluate, engine_obj)
+        actual = _call(compiled, engine_obj.states.entity_states)
+        self.assertEqual(actual, expected, msg="{} with states {}".format(
+            cond_dict, {k: v.state for k, v in engine_obj.states.entity_states.items()}))
+
+    def test_state_conditions(self):
+        cond_dicts = [
+            {"condition": "state", "entity_id": "switch.a", "state": "on"},
+            {"condition": "numeric_state", "entity_id": "sensor.b", "above_value": 17},
+            {"condition": "numeric_state", "entity_id": "sensor.b", "below_value": 20.5},
+            {"condition": "numeric_state", "entity_id": "sensor.b",
+                "above_value": 5, "below_value": 25},
+            {"condition": "zone", "entity_id": "switch.a", "zone": "zone.home"},
+            {"condition": "and", "conditions": [
+                {"condition": "state", "entity_id": "switch.a", "state": "on"},
+                {"condition": "state", "entity_id": "switch.c", "state": "off"}]},
+            {"condition": "or", "conditions": [
+                {"condition": "state", "entity_id": "switch.a", "state": "off"},
+                {"condition": "and", "conditions": [
+                    {"condition": "state", "entity_id": "switch.c", "state": "on"},
+                    {"condition": "or", "conditions": [
+                        {"condition": "state", "entity_id": "switch.a", "state": "on"},
+                        {"condition": "numeric_state", "entity_id": "sensor.b",
+                            "below_value": 20}]}]}]},
+            {"condition": "and", "conditions": [
+                {"condition": "and", "conditions": [
+                    {"condition": "state", "entity_id": "switch.a", "state": "on"}]},
+                {"condition": "numeric_state", "entity_id": "sensor.b", "above_value": 17}]},
+        ]
+        entity_ids = ["switch.a", "sensor.b", "switch.c"]
+
+        for cond_dict in cond_dicts:
+            for values in itertools.product(STATE_VALUES, repeat=len(entity_ids)):
+                engine_obj = _FakeEngine()
+                for entity_id, value in zip(entity_ids, values):
+                    if value is not None:
+                        engine_obj.states.set_entity_state(
+                            entity_id, dataobjects.EntityState(entity_id, value, {}, None))
+                self._assert_equivalent(cond_dict, engine_obj)
+
+    def test_time_condition(self):
+        cond_dicts = [
+            {"condition": "time", "after": "09:00:00", "before": "10:00:00", "tz": PT_TZ},
+            {"condition": "time", "after": "22:00:00", "before": "02:00:00", "tz": PT_TZ},
+            {"condition": "time", "after": "19:00:00", "tz": PT_TZ, "weekday": ["sat"]},
+            {"condition": "time", "before": "12:00:00", "weekday": ["mon", "wed", "fri"]},
+        ]
+        start = parse("2018-03-10 00:00:00-00:00")  # Spans the PT daylight saving change
+        eval_dts = [start + datetime.timedelta(minutes=37 * i) for i in range(200)]
+
+        for cond_dict in cond_dicts:
+            cond = self.persist_mgr._condition_from_dict(cond_dict)
+            compiled_at = cond.compile_at()
+            for eval_dt in eval_dts:
+                self.assertEqual(compiled_at(eval_dt), cond.evaluate_at(eval_dt),
+                                 msg="{} at {}".format(cond_dict, eval_dt))
+
+    def test_sun_condition(self):
+        sun_state = dataobjects.EntityState("sun.sun", "above_horizon", {
+            "next_rising": "2018-07-02T12:50:00+00:00",
+            "next_setting": "2018-07-02T03:30:00+00:00"
+        }, None)
+        cond_dicts = [
+            {"condition": "sun", "after": "sunset"},
+            {"condition": "sun", "after": "sunrise",
+                "after_offset": datetime.timedelta(hours=-1)},
+            {"condition": "sun", "before": "sunset"},
+            {"condition": "sun", "before": "sunrise",
+                "before_offset": datetime.timedelta(minutes=30)},
+        ]
+        start = parse("2018-07-02 00:00:00-00:00")
+        engine_obj = _FakeEngine()
+        engine_obj.states.set_entity_state("sun.sun", sun_state)
+
+        for cond_dict in cond_dicts:
+            for i in range(24):
+                now = start + datetime.timedelta(hours=i)
+                with mock.patch.object(helpers, "nowutc", return_value=now):
+                    self._assert_equivalent(cond_dict, engine_obj)
+
+    def test_adaptive_order(self):
+        # The or condition never fails and is more expensive, the state condition often fails
+        cond = self.persist_mgr._condition_from_dict({"condition": "and", "conditions": [
+            {"condition": "or", "conditions": [
+                {"condition": "state", "entity_id": "sun.sun", "state": "below_horizon"},
+                {"condition": "state", "entity_id": "sun.sun", "state": "above_horizon"},
+            ]},
+            {"condition": "state", "entity_id": "switch.a", "state": "on"},
+        ]})
+        compiled = cond.compile(adaptive=True)
+        engine_obj = _FakeEngine()
+        engine_obj.states.set_entity_state("sun.sun", dataobjects.EntityState(
+            "sun.sun", "above_horizon", {}, None))
+
+        evaluations = condition_objects.SAMPLE_EVERY * condition_objects.REORDER_EVERY
+        for i in range(evaluations):
+            value = "on" if i % 3 == 0 else "off"
+            engine_obj.states.set_entity_state(
+                "switch.a", dataobjects.EntityState("switch.a", value, {}, None))
+            self.assertEqual(compiled(engine_obj.states.entity_states),
+                             cond.evaluate(engine_obj))
+
+        stats = cond.get_order_stats()
+        print(stats)
+        self.assertEqual(stats["order"], [1, 0])
+        self.assertEqual(stats["reorders"], 1)
+        self.assertEqual(stats["samples"], condition_objects.REORDER_EVERY)
+        self.assertEqual(stats["children"][0]["pass_rate"], 1.0)
+        self.assertLess(stats["children"][1]["pass_rate"], 0.5)
+
+    def test_adaptive_order_keeps_guards(self):
+        """A subcondition that can raise stays behind the subconditions guarding it"""
+        cond = self.persist_mgr._condition_from_dict({"condition": "and", "conditions": [
+            {"condition": "state", "entity_id": "switch.a", "state": "on"},
+            {"condition": "numeric_state", "entity_id": "sensor.t", "above_value": 20},
+        ]})
+        compiled = cond.compile(adaptive=True)
+        engine_obj = _FakeEngine()
+        engine_obj.states.set_entity_state(
+            "switch.a", dataobjects.EntityState("switch.a", "on", {}, None))
+
+        # The numeric condition fails more often, so it would be checked first if it could move
+        evaluations = condition_objects.SAMPLE_EVERY * condition_objects.REORDER_EVERY
+        for i in range(evaluations):
+            engine_obj.states.set_entity_state("sensor.t", dataobjects.EntityState(
+                "sensor.t", "25" if i % 3 == 0 else "15", {}, None))
+            compiled(engine_obj.states.entity_states)
+        self.assertEqual(cond.get_order_stats()["order"], [0, 1])
+
+        engine_obj.states.set_entity_state(
+            "switch.a", dataobjects.EntityState("switch.a", "off", {}, None))
+        engine_obj.states.set_entity_state(
+            "sensor.t", dataobjects.EntityState("sensor.t", "unavailable", {}, None))
+        self.assertFalse(cond.evaluate(engine_obj))
+        for _ in range(condition_objects.SAMPLE_EVERY):
+            self.assertFalse(compiled(engine_obj.states.entity_states))
+
+    def test_adaptive_order_moves_past_sun(self):
+        """A cheap, often deciding state condition is checked before a costly sun condition"""
+        cond = self.persist_mgr._condition_from_dict({"condition": "and", "conditions": [
+            {"condition": "sun", "after": "sunrise"},
+            {"condition": "state", "entity_id": "switch.a", "state": "on"},
+        ]})
+        compiled = cond.compile(adaptive=True)
+        engine_obj = _FakeEngine()
+        engine_obj.states.set_entity_state("sun.sun", dataobjects.EntityState(
+            "sun.sun", "above_horizon", {
+                "next_rising": "2018-07-02T12:50:00+00:00",
+                "next_setting": "2018-07-02T03:30:00+00:00"
+            }, None))
+
+        now = parse("2018-07-02 20:00:00-00:00")
+        evaluations = condition_objects.SAMPLE_EVERY * condition_objects.REORDER_EVERY
+        with mock.patch.object(helpers, "nowutc", return_value=now):
+            for i in range(evaluations):
+                value = "on" if i % 3 == 0 else "off"
+                engine_obj.states.set_entity_state(
+                    "switch.a", dataobjects.EntityState("switch.a", value, {}, None))
+                self.assertEqual(compiled(engine_obj.states.entity_states),
+                                 cond.evaluate(engine_obj))
+        self.assertEqual(cond.get_order_stats()["order"], [1, 0])
+
+    def test_rule_from_dict_compiles(self):
+        result = self.persist_mgr.rule_from_dict({
+            "id": "compiled",
+            "triggers": [{"platform": "state", "entity_id": "switch.a"}],
+            "rule_condition": {"condition": "state", "entity_id": "switch.a", "state": "on"},
+            "actions": [{
+                "action_condition": {"condition": "numeric_state", "entity_id": "sensor.b",
+                                     "above_value": 17},
+                "action_sequence": [
+                    {"condition": "state", "entity_id": "switch.c", "state": "off"}
+                ]
+            }]
+        })
+        self.assertTrue(result["success"])
+        rule = result["rule"]
+        self.assertIsNotNone(rule.rule_condition.compiled)
+        self.assertIsNotNone(rule.actions[0].action_condition.compiled)
+        self.assertIsNotNone(rule.actions[0].action_sequence[0]._condition_obj.compiled)
+
+
+def _call(func, arg):
+    '''Returns func's result, or the type of the exception it raised'''
+    try:
+        return func(arg)
+    except Exception as e:
+        return type(e)
+
+
+if __name__ == "__main__":
+    unittest.main()
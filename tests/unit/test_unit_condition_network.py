@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+import itertools
+import unittest
+
+from ottoengine import condition_network, persistence, state
+from ottoengine.model import dataobjects
+
+OCCUPIED = {"condition": "state", "entity_id": "input_boolean.occupied", "state": "on"}
+DARK = {"condition": "numeric_state", "entity_id": "sensor.lux", "below_value": 10}
+NIGHT = {"condition": "time", "after": "00:00:00", "before": "23:59:00"}
+
+
+class _FakeEngine(object):
+    '''Just enough of an engine for RuleCondition.evaluate()'''
+
+    def __init__(self, states):
+        self.states = states
+
+
+class TestConditionNetwork(unittest.TestCase):
+
+    def setUp(self):
+        print()
+        self.states = state.OttoEngineState()
+        self.network = condition_network.ConditionNetwork(self.states.entity_states)
+        self.states.add_entity_listener(self.network.state_changed)
+        self.persist_mgr = persistence.PersistenceManager("/tmp/ottoengine_test_rules")
+
+    def _set_state(self, entity_id, value):
+        self.states.set_entity_state(
+            entity_id, dataobjects.EntityState(entity_id, value, {}, None))
+
+    def test_shared_nodes(self):
+        for cond_dict in [
+            {"condition": "and", "conditions": [OCCUPIED, DARK]},
+            {"condition": "or", "conditions": [OCCUPIED, DARK]},
+            {"condition": "and", "conditions": [OCCUPIED, DARK]},
+            OCCUPIED,
+        ]:
+            self.network.add_condition(self.persist_mgr._condition_from_dict(cond_dict))
+
+        # occupied, dark, the and node and the or node
+        self.assertEqual(self.network.stats["nodes"], 4)
+        self.assertEqual(self.network.stats["shared"], 4)
+
+        self._set_state("input_boolean.occupied", "on")
+        # The occupied leaf, then the and and or nodes above it
+        self.assertEqual(self.network.stats["updates"], 3)
+
+    def test_equivalent_to_evaluate(self):
+        cond_dicts = [
+            {"condition": "and", "conditions": [OCCUPIED, DARK]},
+            {"condition": "or", "conditions": [OCCUPIED, DARK]},
+            {"condition": "and", "conditions": [NIGHT, OCCUPIED]},
+            {"condition": "or", "conditions": [
+                {"condition": "and", "conditions": [OCCUPIED, NIGHT]},
+                {"condition": "state", "entity_id": "switch.override", "state": "on"}]},
+        ]
+        conds = [self.persist_mgr._condition_from_dict(d) for d in cond_dicts]
+        network_conds = [self.network.add_condition(c) for c in conds]
+        engine_obj = _FakeEngine(self.states)
+
+        entity_values = [
+            ("input_boolean.occupied", ["on", "off"]),
+            ("sensor.lux", ["5", "50"]),
+            ("switch.override", ["on", "off"]),
+        ]
+        changes = itertools.product(*[
+            [(entity_id, value) for value in values] for entity_id, values in entity_values])
+        for change in changes:
+            for entity_id, value in change:
+                self._set_state(entity_id, value)
+            for cond, network_cond in zip(conds, network_conds):
+                self.assertEqual(
+                    network_cond(self.states.entity_states), cond.evaluate(engine_obj),
+                    msg="{} with {}".format(cond.serialize(), change))
+
+    def test_clear(self):
+        self.network.add_condition(self.persist_mgr._condition_from_dict(OCCUPIED))
+        self.network.clear()
+        self._set_state("input_boolean.occupied", "on")
+        self.assertEqual(self.network.stats["nodes"], 0)
+        self.assertEqual(self.network.stats["updates"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
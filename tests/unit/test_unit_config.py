@@ -32,6 +32,18 @@ class TestConfig(unittest.TestCase):
             print("Expecting {} to be {}".format(obj_name, obj_val))
             self.assertEqual(getattr(cfg, obj_name), obj_val)
 
+    def test_clock_spread_secs(self):
+        section = "ENGINE"
+        for ini_val, obj_val in [("0.5", 0.5), ("2", 2), ("soon", 0), ("-1", 0), ("nan", 0)]:
+            cfg = config.EngineConfig()
+            cfg._config.read_dict({section: {
+                "OTTO_REST_PORT": "5000", "HASS_HOST": "localhost", "HASS_PORT": "8123",
+                "HASS_TOKEN": "a_token", "HASS_SSL": "no", "TZ": "UTC",
+                "JSON_RULES_DIR": "json_rules", "CLOCK_SPREAD_SECS": ini_val}})
+            cfg._read_parameters()
+            print("{} is read as {}".format(ini_val, cfg.clock_spread_secs))
+            self.assertEqual(cfg.clock_spread_secs, obj_val)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+import datetime
+import random
+import unittest
+
+import croniter
+from dateutil import parser
+import pytz
+
+from ottoengine import cron
+from ottoengine.fibers import clock
+
+
+class TestCron(unittest.TestCase):
+
+    def setUp(self):
+        print()
+
+    def test_compile_fields(self):
+        schedule = cron.compile_schedule(
+            minute="*/15", hour="9-17/4", day_of_month=None, month="1,7", weekdays=7)
+        self.assertEqual(schedule.minutes, 1 << 0 | 1 << 15 | 1 << 30 | 1 << 45)
+        self.assertEqual(schedule.hours, 1 << 9 | 1 << 13 | 1 << 17)
+        self.assertEqual(schedule.months, 1 << 1 | 1 << 7)
+        self.assertEqual(schedule.weekdays, 1)     # 7 is Sunday, like 0
+        self.assertFalse(schedule.day_or)
+
+        # a/n runs to the end of the field
+        self.assertEqual(cron.compile_schedule(minute="50/5").minutes, 1 << 50 | 1 << 55)
+
+        for bad in [{"minute": 60}, {"hour": "1-"}, {"month": "jan"}, {"minute": "*/0"}]:
+            self.assertRaises(ValueError, cron.compile_schedule, **bad)
+
+    def test_schedule_is_immutable(self):
+        schedule = cron.compile_schedule(minute=0)
+        with self.assertRaises(AttributeError):
+            schedule.minutes = 1
+        self.assertEqual(schedule, cron.compile_schedule(minute="0"))
+
+    def test_day_or(self):
+        """Both day of month and weekdays restricted: either one matches, like cron"""
+        schedule = cron.compile_schedule(minute=0, hour=0, day_of_month=13, weekdays=5)
+        self.assertTrue(schedule.day_or)
+        nexttime = schedule.next_after(datetime.datetime(2018, 7, 1))
+        self.assertEqual(nexttime, datetime.datetime(2018, 7, 6))   # A Friday
+        nexttime = schedule.next_after(datetime.datetime(2018, 7, 10))
+        self.assertEqual(nexttime, datetime.datetime(2018, 7, 13))
+
+    def test_matches_croniter(self):
+        """Compiled TimeSpecs give the same next times as croniter, away from DST changes"""
+        rand = random.Random(7)
+        minutes = [None, 0, 30, "*/2", "*/15", "1-5", "10/20", "0-30/7"]
+        hours = [None, 0, 8, 22, "*/3", "9-17", "1,2,3"]
+        days = [None, 1, 15, 29, "1-7"]
+        months = [None, 2, 7, "1-6"]
+        weekdays = [None, 0, "5,6,7", "1-5", 7]
+        start = parser.parse("2018-01-01 00:00:00-00:00")
+
+        for _ in range(500):
+            spec = clock.TimeSpec.from_dict({
+                "tz": "UTC", "minute": rand.choice(minutes), "hour": rand.choice(hours),
+                "day_of_month": rand.choice(days), "month": rand.choice(months),
+                "weekdays": rand.choice(weekdays)})
+            self.assertIsNotNone(spec.schedule)
+            nowtime = start + datetime.timedelta(seconds=rand.randrange(86400 * 365 * 3))
+            expected = croniter.croniter(
+                spec._create_cron_spec(), nowtime).get_next(datetime.datetime)
+            self.assertEqual(
+                spec.next_time_from(nowtime), expected,
+                msg="Spec: {}, Now: {}".format(spec.serialize(), nowtime))
+
+    def test_dst_changes(self):
+        """Skipped wall times move forward, repeated wall times fire once"""
+        spec = clock.TimeSpec.from_dict({"tz": "America/Los_Angeles", "minute": "*/30"})
+        tz = pytz.timezone("America/Los_Angeles")
+
+        nowtime = parser.parse("2018-03-11 01:00:00-08:00")
+        times = []
+        for _ in range(3):
+            nowtime = spec.next_time_from(nowtime)
+            times.append(nowtime)
+        self.assertEqual(times, [
+            tz.localize(datetime.datetime(2018, 3, 11, 1, 30)),
+            tz.localize(datetime.datetime(2018, 3, 11, 3, 0)),
+            tz.localize(datetime.datetime(2018, 3, 11, 3, 30))])
+
+        nowtime = parser.parse("2018-11-04 01:30:00-07:00")
+        self.assertEqual(
+            spec.next_time_from(nowtime), tz.localize(datetime.datetime(2018, 11, 4, 2, 0)))
+
+    def test_croniter_fallback(self):
+        spec = clock.TimeSpec.from_dict({"tz": "UTC", "minute": 0, "weekdays": "mon"})
+        self.assertIsNone(spec.schedule)
+        self.assertEqual(
+            spec.next_time_from(parser.parse("2018-01-02 00:00:00-00:00")),
+            parser.parse("2018-01-08 00:00:00-00:00"))
+
+
+class TestCronTable(unittest.TestCase):
+
+    def setUp(self):
+        print()
+
+    def test_match_agrees_with_schedules(self):
+        """Every minute, the table matches exactly the rows whose schedule matches"""
+        rand = random.Random(11)
+        choices = {
+            "minute": [None, 0, 15, "*/5", "*/20", "10-12"],
+            "hour": [None, 0, 7, 22, "*/6", "8-17"],
+            "day_of_month": [None, 1, 2, "1-7"],
+            "month": [None, 1, "1-2"],
+            "weekdays": [None, 1, "5,6,7", 0],
+        }
+        table = cron.CronTable()
+        schedules = {}
+        for i in range(200):
+            fields = {name: rand.choice(values) for name, values in choices.items()}
+            schedules[i] = cron.compile_schedule(**fields)
+            table.add(i, schedules[i], i)
+
+        # Removed rows are no longer matched, and their slots are reused
+        for i in range(0, 200, 3):
+            self.assertEqual(table.remove(i), i)
+            del schedules[i]
+        self.assertIsNone(table.remove(0))
+        table.add("new", cron.compile_schedule(), "new")
+        schedules["new"] = cron.compile_schedule()
+        self.assertEqual(len(table), len(schedules))
+
+        localtime = datetime.datetime(2018, 1, 1)
+        for _ in range(60 * 24 * 3):
+            expected = sorted(
+                str(key) for key, schedule in schedules.items()
+                if schedule.matches_day(localtime.date())
+                and schedule.minutes >> localtime.minute & 1
+                and schedule.hours >> localtime.hour & 1)
+            self.assertEqual(sorted(str(v) for v in table.match(localtime)), expected)
+            localtime += datetime.timedelta(minutes=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+import unittest
+from dateutil import parser
+
+from ottoengine import helpers
+from ottoengine.model import dataobjects
+from ottoengine.testing import websocket_helpers
+
+
+class TestDataObjects(unittest.TestCase):
+
+    def setUp(self):
+        print()
+
+    def test_parse_iso_datetime(self):
+        tests = [
+            "2017-05-06T01:08:39.451411+00:00",
+            "2017-05-06T01:08:39+00:00",
+            "2018-07-14T19:21:00.000001-07:00",
+            "2017-05-06T01:08:39.451Z",     # Not the fixed format, uses the fallback
+        ]
+        for value in tests:
+            expected = parser.parse(value)
+            actual = helpers.parse_iso_datetime(value)
+            print("{} --> {}".format(value, actual))
+            self.assertEqual(actual, expected)
+            self.assertEqual(actual.utcoffset(), expected.utcoffset())
+
+    def test_state_changed_event_is_lazy(self):
+        msg = websocket_helpers.event_state_changed(1, "sensor.grid_power", "100", "200")
+        event_dict = msg["event"]
+        event = dataobjects.StateChangedEvent.from_websocket_dict(event_dict)
+
+        print("Nothing should be decoded when the event is created")
+        self.assertIsInstance(event._time_fired, str)
+        self.assertIsNone(event.new_state_obj._last_changed)
+        self.assertIsNone(event.old_state_obj._last_changed)
+
+        self.assertEqual(event.entity_id, "sensor.grid_power")
+        self.assertEqual(event.old_state_obj.state, "100")
+        self.assertEqual(event.new_state_obj.state, "200")
+
+        print("Timestamps are decoded on first read")
+        self.assertEqual(event.time_fired, parser.parse(event_dict["time_fired"]))
+        self.assertEqual(
+            event.new_state_obj.last_changed,
+            parser.parse(event_dict["data"]["new_state"]["last_changed"]))
+        self.assertEqual(event.new_state_obj.attributes, {})
+        self.assertIsNone(event.new_state_obj.friendly_name)
+        self.assertFalse(event.new_state_obj.hidden)
+
+    def test_lazy_entity_state_is_equal(self):
+        state_dict = {
+            "entity_id": "group.all_automations",
+            "state": "off",
+            "attributes": {"friendly_name": "all automations", "hidden": True},
+            "last_changed": "2017-05-06T01:04:26.579682+00:00",
+            "last_updated": "2017-05-06T01:04:26.579682+00:00"
+        }
+        state1 = dataobjects.LazyEntityState(state_dict)
+        state2 = dataobjects.LazyEntityState(dict(state_dict))
+        self.assertTrue(state1.is_equal(state2))
+        self.assertEqual(state1.friendly_name, "all automations")
+        self.assertTrue(state1.hidden)
+
+        state2 = dataobjects.LazyEntityState(
+            dict(state_dict, last_changed="2017-05-06T01:04:27.000000+00:00"))
+        self.assertFalse(state1.is_equal(state2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,7 +8,9 @@ import datetime as dt
 
 from ottoengine import engine, config, enginelog, persistence, helpers
 from ottoengine.utils import setup_debug_logging
-from ottoengine.fibers import clock
+from ottoengine.fibers import clock, hass_websocket_reader
+from ottoengine.model import dataobjects
+from ottoengine.testing import websocket_helpers
 
 setup_debug_logging()
 
@@ -105,6 +107,82 @@ class TestEngine(unittest.TestCase):
         print(num_rules_loaded, "rules loaded into engine state")
         self.assertEqual(num_rules_loaded, num_rule_files)
 
+    def test_reconcile_states(self):
+        rule = self.persist_mgr.load_rule_from_file(
+            os.path.join(self.test_rules_dir, "rule_condition.json"))
+        self.loop.run_until_complete(self.engine_obj._async_load_rule(rule))
+
+        processed = []
+        self.engine_obj.process_event = lambda event: processed.append(event)
+
+        def _state(entity_id, state, last_changed, attributes=None):
+            return {"entity_id": entity_id, "state": state, "attributes": attributes or {},
+                    "last_changed": last_changed, "last_updated": last_changed}
+
+        before = "2019-01-01T00:00:00+00:00"
+        after = "2019-01-01T00:05:00+00:00"
+        self.engine_obj._process_states_result([
+            _state("input_boolean.test", "off", before),
+            _state("input_boolean.action_light", "off", before),
+            _state("sensor.temp", "20", before),
+        ])
+
+        print("Only the changed trigger entity gets a state changed event")
+        self.loop.run_until_complete(self.engine_obj._async_reconcile_states([
+            _state("input_boolean.test", "on", after),
+            _state("input_boolean.action_light", "on", after),
+            _state("sensor.temp", "20", before, {"unit": "C"}),
+            _state("sensor.new", "1", after),
+        ]))
+        self.assertEqual(len(processed), 1)
+        self.assertEqual(processed[0].entity_id, "input_boolean.test")
+        self.assertEqual(processed[0].old_state_obj.state, "off")
+        self.assertEqual(processed[0].new_state_obj.state, "on")
+
+        states = self.engine_obj.states
+        self.assertEqual(states.get_entity_state("input_boolean.action_light").state, "on")
+        self.assertEqual(states.get_entity_state("sensor.temp").attributes, {"unit": "C"})
+        self.assertEqual(states.get_entity_state("sensor.new").state, "1")
+
+    def test_failing_rule_does_not_stop_others(self):
+        """A rule whose condition raises doesn't keep a sibling rule from starting"""
+        self._setup_engine()
+        started = []
+        self.engine_obj.start_rule_run = lambda rule: started.append(rule.id)
+
+        def _rule_dict(rule_id, rule_condition):
+            return {
+                "id": rule_id, "description": "", "enabled": True, "group": "test",
+                "notes": "",
+                "triggers": [{"platform": "state", "entity_id": "input_boolean.test",
+                              "to": "on"}],
+                "rule_condition": rule_condition,
+                "actions": [{"action_sequence": [{
+                    "domain": "light", "service": "turn_on",
+                    "data": {"entity_id": "light.a"}}]}],
+            }
+
+        for rule_dict in [
+                _rule_dict("raises", {"condition": "numeric_state", "entity_id": "sensor.t",
+                                      "below_value": 10}),
+                _rule_dict("plain", None)]:
+            rule = self.persist_mgr.rule_from_dict(rule_dict)["rule"]
+            self.loop.run_until_complete(self.engine_obj._async_load_rule(rule))
+
+        self.engine_obj.states.set_entity_state("sensor.t", dataobjects.LazyEntityState(
+            {"entity_id": "sensor.t", "state": "unavailable"}))
+        msg = websocket_helpers.event_state_changed(1, "input_boolean.test", "off", "on")
+        self.loop.run_until_complete(
+            hass_websocket_reader._process_event_response(self.engine_obj, msg))
+        self.assertEqual(started, ["plain"])
+
+    def test_backoff_delay(self):
+        # Days of failed attempts must not overflow the exponential
+        for attempt in list(range(20)) + [1023, 1024, 5000, 10 ** 6]:
+            delay = hass_websocket_reader.get_backoff_delay(attempt)
+            self.assertGreaterEqual(delay, hass_websocket_reader.RECONNECT_MIN_SECS)
+            self.assertLessEqual(delay, hass_websocket_reader.RECONNECT_MAX_SECS)
+
 
 def _get_event_loop() -> asyncio.AbstractEventLoop:
     """ This simply wraps the asyncio function so we have typing for autocomplet/linting"""
@@ -85,6 +85,29 @@ class TestEnginelog(unittest.TestCase):
         self.assertEqual(log_type, "error")
         self.assertEqual(log_entry.get("message"), error_message)
 
+    def test_add_serialized(self):
+        class _Serializable(object):
+            serialize_count = 0
+
+            def serialize(self):
+                self.serialize_count += 1
+                return {"condition": "state"}
+
+        obj = _Serializable()
+        enlog = enginelog.EngineLog()
+        for i in range(3):
+            enlog.add_serialized(enginelog.CONDITION_PASSED, {"rule": "1"}, "condition", obj)
+        enlog.add_serialized(enginelog.SERVICE_CALLED, None, None, obj, cache=False)
+        self.assertEqual(obj.serialize_count, 0)
+
+        logs = enlog.get_logs()
+        self.assertEqual(logs[0]["entry"], {"rule": "1", "condition": {"condition": "state"}})
+        self.assertEqual(logs[3]["type"], enginelog.SERVICE_CALLED)
+        self.assertEqual(logs[3]["entry"], {"condition": "state"})
+        self.assertTrue(logs[0]["ts"] <= logs[3]["ts"])
+        # Serialized once for the 3 cached entries, and once for the uncached one
+        self.assertEqual(obj.serialize_count, 2)
+
 
 def _fill_logs(enlog: enginelog.EngineLog, num_add_logs: int) -> int:
     for i in range(num_add_logs):
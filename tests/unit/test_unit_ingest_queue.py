@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+import asyncio
+import unittest
+
+from ottoengine import ingest_queue
+from ottoengine.model import dataobjects
+
+
+def _state_changed(entity_id, old_state, new_state):
+    return dataobjects.StateChangedEvent(
+        entity_id,
+        dataobjects.EntityState(entity_id, old_state, {}, None),
+        dataobjects.EntityState(entity_id, new_state, {}, None),
+        "2019-01-01T00:00:00+00:00")
+
+
+class TestIngestQueue(unittest.TestCase):
+
+    def setUp(self):
+        print()
+        self.loop = asyncio.get_event_loop()
+
+    def _put_all(self, queue, *events):
+        for event in events:
+            self.loop.run_until_complete(queue.async_put(event))
+
+    def _get_all(self, queue) -> list:
+        events = []
+        while len(queue):
+            events.append(self.loop.run_until_complete(queue.async_get()))
+        return events
+
+    def test_drop_oldest(self):
+        queue = ingest_queue.IngestQueue(self.loop, 2, ingest_queue.POLICY_DROP_OLDEST)
+        self._put_all(queue,
+                      _state_changed("light.a", "off", "on"),
+                      _state_changed("light.b", "off", "on"),
+                      _state_changed("light.c", "off", "on"))
+
+        self.assertEqual([e.entity_id for e in self._get_all(queue)], ["light.b", "light.c"])
+        self.assertEqual(queue.stats["dropped"], 1)
+        self.assertEqual(queue.stats["max_depth"], 2)
+        self.assertEqual(queue.stats["depth"], 0)
+
+    def test_coalesce_keeps_first_old_state(self):
+        queue = ingest_queue.IngestQueue(self.loop, 2, ingest_queue.POLICY_COALESCE)
+        self._put_all(queue,
+                      _state_changed("sensor.power", "100", "200"),
+                      _state_changed("light.b", "off", "on"),
+                      _state_changed("sensor.power", "200", "300"),
+                      _state_changed("sensor.power", "300", "400"))
+
+        events = self._get_all(queue)
+        self.assertEqual([e.entity_id for e in events], ["sensor.power", "light.b"])
+        self.assertEqual(events[0].old_state_obj.state, "100")
+        self.assertEqual(events[0].new_state_obj.state, "400")
+        self.assertEqual(queue.stats["coalesced"], 2)
+
+    def test_block_waits_for_room(self):
+        queue = ingest_queue.IngestQueue(self.loop, 1, ingest_queue.POLICY_BLOCK)
+
+        async def _async_test():
+            await queue.async_put(_state_changed("light.a", "off", "on"))
+            putter = asyncio.ensure_future(
+                queue.async_put(_state_changed("light.b", "off", "on")))
+            await asyncio.sleep(0.01)
+            print("Second put should wait while the queue is full")
+            self.assertFalse(putter.done())
+
+            first = await queue.async_get()
+            await asyncio.sleep(0.01)
+            self.assertTrue(putter.done())
+            second = await queue.async_get()
+            return [first.entity_id, second.entity_id]
+
+        self.assertEqual(self.loop.run_until_complete(_async_test()), ["light.a", "light.b"])
+        self.assertEqual(queue.stats["blocked"], 1)
+
+    def test_collapse_matching_entities(self):
+        queue = ingest_queue.IngestQueue(
+            self.loop, 100, coalesce_patterns=["sensor", "light.*_level"])
+        self._put_all(queue,
+                      _state_changed("sensor.grid_power", "100", "200"),
+                      _state_changed("light.kitchen", "off", "on"),
+                      _state_changed("light.kitchen", "on", "off"),
+                      _state_changed("sensor.grid_power", "200", "300"),
+                      _state_changed("light.hall_level", "1", "2"),
+                      _state_changed("sensor.grid_power", "300", "400"))
+
+        events = self._get_all(queue)
+        self.assertEqual([e.entity_id for e in events], [
+            "sensor.grid_power", "light.kitchen", "light.kitchen", "light.hall_level"])
+        self.assertEqual(events[0].old_state_obj.state, "100")
+        self.assertEqual(events[0].new_state_obj.state, "400")
+        self.assertEqual(queue.stats["collapsible"], 4)
+        self.assertEqual(queue.stats["collapsed"], 2)
+        self.assertEqual(queue.stats["collapse_ratio"], 0.5)
+
+        print("Once dequeued, an entity's next state change is queued again")
+        self._put_all(queue, _state_changed("sensor.grid_power", "400", "500"))
+        self.assertEqual(len(queue), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+import unittest
+
+from ottoengine import json_codec
+from ottoengine.testing import websocket_helpers
+
+
+class TestJsonCodec(unittest.TestCase):
+
+    def setUp(self):
+        print()
+
+    def test_round_trip(self):
+        msg = websocket_helpers.event_state_changed(1, "sensor.temperature", "20.5", "21.0")
+        msg["event"]["data"]["new_state"]["attributes"] = {
+            "unit_of_measurement": "°C", "friendly_name": "Température", "hidden": False}
+
+        for codec in json_codec.available_codecs():
+            print("Codec: {}".format(codec.name))
+            encoded = codec.encode(msg)
+            self.assertIsInstance(encoded, bytes)
+            self.assertEqual(codec.decode(encoded), msg)
+            self.assertEqual(codec.decode(encoded.decode("utf-8")), msg)
+
+            # Every codec must be able to read what the others write
+            for other in json_codec.available_codecs():
+                self.assertEqual(other.decode(encoded), msg)
+
+    def test_decode_error_is_value_error(self):
+        for codec in json_codec.available_codecs():
+            print("Codec: {}".format(codec.name))
+            self.assertRaises(ValueError, codec.decode, b'{"type": "result"')
+
+    def test_get_codec(self):
+        fastest = json_codec.available_codecs()[0]
+        self.assertEqual(json_codec.get_codec().name, fastest.name)
+        self.assertEqual(json_codec.get_codec("auto").name, fastest.name)
+        self.assertEqual(json_codec.get_codec("json").name, "json")
+
+        print("Unknown codecs fall back to the standard library")
+        self.assertEqual(json_codec.get_codec("not_a_codec").name, "json")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import asyncio
+import os
+import unittest
+
+from ottoengine import config, engine, enginelog, persistence
+from ottoengine.fibers import clock, event_dispatcher, hass_websocket_reader
+from ottoengine.model import dataobjects
+from ottoengine.testing import websocket_helpers
+
+
+class TestRelevance(unittest.TestCase):
+
+    def setUp(self):
+        print()
+        mydir = os.path.dirname(__file__)
+        self.test_rules_dir = os.path.join(mydir, "../json_test_rules")
+        self.loop = asyncio.get_event_loop()
+
+        self.config = config.EngineConfig()
+        self.config.ignore_state_domains = ["sensor"]
+        self.persist_mgr = persistence.PersistenceManager(self.config.json_rules_dir)
+        self.engine_obj = engine.OttoEngine(
+            self.config, self.loop, clock.EngineClock(self.config.tz, self.loop),
+            self.persist_mgr, enginelog.EngineLog())
+
+        # Count the events that take the full processing path
+        self.processed = []
+        self.engine_obj.process_event = lambda event: self.processed.append(event)
+
+        rule = self.persist_mgr.load_rule_from_file(
+            os.path.join(self.test_rules_dir, "rule_condition.json"))
+        self.loop.run_until_complete(self.engine_obj._async_load_rule(rule))
+
+    def _send_state_changed(self, entity_id, old_state, new_state):
+        msg = websocket_helpers.event_state_changed(1, entity_id, old_state, new_state)
+        self.loop.run_until_complete(
+            hass_websocket_reader._process_event_response(self.engine_obj, msg))
+
+    def test_index_from_rule(self):
+        index = self.engine_obj.relevance
+        self.assertTrue(index.is_trigger_entity("input_boolean.test"))
+        self.assertFalse(index.is_trigger_entity("input_boolean.action_light"))
+        self.assertEqual(index.entity_ids, {"input_boolean.test", "input_boolean.action_light"})
+
+        self.assertTrue(index.wants_state("input_boolean.action_light"))
+        self.assertTrue(index.wants_state("light.kitchen"))
+        self.assertFalse(index.wants_state("sensor.grid_power"))
+
+    def test_trigger_entity_is_processed(self):
+        self._send_state_changed("input_boolean.test", "off", "on")
+        self.assertEqual(len(self.processed), 1)
+        self.assertEqual(self.processed[0].entity_id, "input_boolean.test")
+
+    def test_irrelevant_entity_only_updates_state(self):
+        states = self.engine_obj.states
+
+        print("Condition entity: state is kept, but no event is processed")
+        self._send_state_changed("input_boolean.action_light", "on", "off")
+        self.assertEqual(states.get_entity_state("input_boolean.action_light").state, "off")
+
+        print("Unreferenced entity: state is kept, but no event is processed")
+        self._send_state_changed("light.kitchen", "off", "on")
+        self.assertEqual(states.get_entity_state("light.kitchen").state, "on")
+
+        print("Unreferenced entity in an ignored domain: state is not kept")
+        self._send_state_changed("sensor.grid_power", "100", "200")
+        self.assertIsNone(states.get_entity_state("sensor.grid_power"))
+
+        self.assertEqual(len(self.processed), 0)
+
+    def test_states_result_skips_ignored_domains(self):
+        states = self.engine_obj.states
+        self.engine_obj._process_states_result([
+            {"entity_id": "light.kitchen", "state": "on"},
+            {"entity_id": "sensor.grid_power", "state": "100"},
+        ])
+        self.assertEqual(states.get_entity_state("light.kitchen").state, "on")
+        self.assertIsNone(states.get_entity_state("sensor.grid_power"))
+
+        print("An entity the engine already keeps is still updated")
+        states.set_entity_state("sensor.grid_power", dataobjects.LazyEntityState(
+            {"entity_id": "sensor.grid_power", "state": "100"}))
+        self._send_state_changed("sensor.grid_power", "100", "200")
+        self.assertEqual(states.get_entity_state("sensor.grid_power").state, "200")
+
+    def test_state_only_waits_for_queued_events(self):
+        """With the dispatcher running, a state-only update lands after the events before it"""
+        states = self.engine_obj.states
+        self._send_state_changed("input_boolean.action_light", "off", "on")
+
+        # The condition entity's state, as the trigger event is processed
+        seen = []
+        self.engine_obj.process_event = lambda event: seen.append(
+            states.get_entity_state("input_boolean.action_light").state)
+
+        dispatcher = event_dispatcher.EventDispatcher(
+            self.engine_obj, self.engine_obj._ingest_queue)
+        self.engine_obj._fiber_event_dispatcher = dispatcher
+
+        self._send_state_changed("input_boolean.test", "off", "on")
+        self._send_state_changed("input_boolean.action_light", "on", "off")
+        self.assertEqual(states.get_entity_state("input_boolean.action_light").state, "on")
+
+        dispatcher.asyncio_task = self.loop.create_task(dispatcher.async_run())
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(seen, ["on"])
+        self.assertEqual(states.get_entity_state("input_boolean.action_light").state, "off")
+
+        dispatcher.cancel()
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+    def test_irrelevant_event_type_is_skipped(self):
+        msg = websocket_helpers.event_hass_event(1, "timer_ended", {"entity_id": "timer.test"})
+        self.loop.run_until_complete(
+            hass_websocket_reader._process_event_response(self.engine_obj, msg))
+        self.assertEqual(len(self.processed), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
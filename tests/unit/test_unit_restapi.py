@@ -37,6 +37,9 @@ class MockOttoEngine:
     def get_rules_threadsafe(self) -> list:
         return self._hidden_states.get_rules()
 
+    def get_condition_stats_threadsafe(self) -> list:
+        return [{"rule": rule.id, "conditions": []} for rule in self._hidden_states.get_rules()]
+
 
     # def get_state_threadsafe(self, group, key):
     # def get_entity_state_threadsafe(self, entity_id):
@@ -84,6 +87,16 @@ class TestRestAPI(unittest.TestCase):
             self.assertEqual(rule["group"], "unittest")
 
 
+    # Tests: @app.route('/rest/conditions', methods=['GET'])
+    def test_route_conditions(self):
+        resp = self.app.get("/rest/conditions").get_json()
+        print(resp)
+        resp_data = resp.get("data")
+        self.assertEqual(len(resp_data), len(self.eng._hidden_states._rules))
+        for rule in resp_data:
+            self.assertIsNotNone(rule["rule"])
+            self.assertEqual(rule["conditions"], [])
+
     # Tests: @app.route('/rest/entities', methods=['GET'])
     # Tests: @app.route('/rest/services', methods=['GET'])
     # Tests: @app.route('/rest/rule', methods=['PUT'])
@@ -25,6 +25,11 @@ class MockWebSocketClient():
             service_call_info.serialize()))
         self.service_calls.append(service_call_info)
 
+        # Home Assistant's response is already available
+        response = asyncio.get_event_loop().create_future()
+        response.set_result({"type": "result", "success": True, "result": None})
+        return response
+
     def clear(self):
         self.service_calls = []
 
@@ -223,6 +228,33 @@ class TestRuleProcessing(unittest.TestCase):
             self._set_and_verify_entity_state("input_boolean.test", "on", "off",))
         self.assertEqual(len(self.engine_obj._websocket.service_calls), 0)
 
+    def test_rule_condition_dispatch_modes(self):
+        rule_id = "rule_condition"
+
+        async def _trigger_then_turn_on_light():
+            # The light turns on before the loop gets to run any rule's task
+            for entity_id, new_state, old_state in [("input_boolean.test", "on", "off"),
+                                                    ("input_boolean.action_light", "on", "off")]:
+                event = websocket_helpers.event_state_changed(
+                    1, entity_id, old_state, new_state)
+                await hass_websocket_reader._process_event_response(self.engine_obj, event)
+            await asyncio.sleep(0.01)
+
+        for dispatch_mode, expected_calls in [(config.DISPATCH_INLINE, 1),
+                                              (config.DISPATCH_TASK, 0)]:
+            cfg = config.EngineConfig()
+            cfg.json_rules_dir = self.test_rules_dir
+            cfg.dispatch_mode = dispatch_mode
+            self._setup_engine(config_obj=cfg)
+            self.loop.run_until_complete(self._load_one_rule(rule_id, self.test_rules_dir))
+            self.loop.run_until_complete(
+                self._set_and_verify_entity_state("input_boolean.action_light", "off", "on"))
+
+            print("Dispatch mode {}: the rule condition sees the light {}".format(
+                dispatch_mode, "off" if expected_calls else "on"))
+            self.loop.run_until_complete(_trigger_then_turn_on_light())
+            self.assertEqual(len(self.engine_obj._websocket.service_calls), expected_calls)
+
     def test_disabled_rule(self):
         rule_id = "1116"
         cfg = config.EngineConfig()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+import asyncio
+import unittest
+
+from ottoengine import rule_runs
+from ottoengine.model import rule_objects
+
+
+class TestRuleRunRegistry(unittest.TestCase):
+
+    def setUp(self):
+        print()
+        self.loop = asyncio.get_event_loop()
+        self.registry = rule_runs.RuleRunRegistry(self.loop)
+        self.finished = []
+        self.release = None
+
+    def _start_runs(self, rule, count) -> list:
+        '''Starts count runs that wait for self.release, then lets them all finish'''
+        async def _async_run(i):
+            await self.release.wait()
+            self.finished.append(i)
+
+        async def _async_start_all():
+            self.release = asyncio.Event()
+            tasks = [self.registry.start(rule, lambda i=i: _async_run(i)) for i in range(count)]
+            await asyncio.sleep(0)
+            self.release.set()
+            while self.registry.stats["running"]:
+                await asyncio.sleep(0)
+            return tasks
+        return self.loop.run_until_complete(_async_start_all())
+
+    def test_single(self):
+        rule = rule_objects.AutomationRule("single", mode=rule_objects.MODE_SINGLE)
+        tasks = self._start_runs(rule, 5)
+        self.assertIsNotNone(tasks[0])
+        self.assertEqual(tasks[1:], [None] * 4)
+        self.assertEqual(self.finished, [0])
+        self.assertEqual(self.registry.stats["dropped"], 4)
+
+    def test_restart(self):
+        rule = rule_objects.AutomationRule("restart", mode=rule_objects.MODE_RESTART)
+        tasks = self._start_runs(rule, 5)
+        self.assertEqual(self.finished, [4])
+        self.assertTrue(all(task.cancelled() for task in tasks[:4]))
+        self.assertEqual(self.registry.stats["restarted"], 4)
+        self.assertEqual(self.registry.get_rule_stats("restart"), {"running": 0, "queued": 0})
+
+    def test_queued(self):
+        rule = rule_objects.AutomationRule("queued", mode=rule_objects.MODE_QUEUED, max_runs=2)
+        self._start_runs(rule, 5)
+        self.assertEqual(self.finished, [0, 1, 2])
+        self.assertEqual(self.registry.stats["queued"], 2)
+        self.assertEqual(self.registry.stats["dropped"], 2)
+        self.assertEqual(self.registry.stats["max_running"], 1)
+
+    def test_parallel(self):
+        rule = rule_objects.AutomationRule("parallel", max_runs=3)
+        self._start_runs(rule, 5)
+        self.assertEqual(sorted(self.finished), [0, 1, 2])
+        self.assertEqual(self.registry.stats["max_running"], 3)
+        self.assertEqual(self.registry.stats["dropped"], 2)
+
+    def test_first_drop_is_a_warning(self):
+        rule = rule_objects.AutomationRule("parallel", max_runs=1)
+        with self.assertLogs(rule_runs.__name__, level="DEBUG") as logs:
+            self._start_runs(rule, 3)
+        self.assertEqual([record.levelname for record in logs.records], ["WARNING", "DEBUG"])
+
+    def test_async_run_queued(self):
+        rule = rule_objects.AutomationRule("queued", mode=rule_objects.MODE_QUEUED)
+        order = []
+
+        async def _async_run(i):
+            order.append(("start", i))
+            await asyncio.sleep(0)
+            order.append(("end", i))
+
+        async def _async_run_all():
+            return await asyncio.gather(*[
+                self.registry.async_run(rule, lambda i=i: _async_run(i)) for i in range(3)])
+
+        results = self.loop.run_until_complete(_async_run_all())
+        self.assertEqual(results, [True] * 3)
+        self.assertEqual(order, [("start", 0), ("end", 0), ("start", 1), ("end", 1),
+                                 ("start", 2), ("end", 2)])
+        self.assertEqual(self.registry.stats["running"], 0)
+
+    def test_idle_rules_are_not_kept(self):
+        for mode in rule_objects.MODES:
+            self._start_runs(rule_objects.AutomationRule(mode, mode=mode), 3)
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(self.registry._rule_runs, {})
+
+    def test_invalid_mode(self):
+        with self.assertRaises(Exception):
+            rule_objects.AutomationRule("invalid", mode="sometimes")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import asyncio
+import unittest
+
+from ottoengine import rule_scheduler
+from ottoengine.model import rule_objects
+
+
+class TestRuleScheduler(unittest.TestCase):
+
+    def setUp(self):
+        print()
+        self.loop = asyncio.get_event_loop()
+        self.scheduler = rule_scheduler.RuleScheduler(
+            self.loop, workers=1, group_lanes={"security": "critical", "logging": "bulk"})
+        self.order = []
+
+    async def _async_run(self, name, lane, delay_secs=0):
+        await self.scheduler.async_acquire(lane)
+        try:
+            self.order.append(name)
+            if delay_secs:
+                await self.scheduler.async_sleep(delay_secs)
+                self.order.append(name + " continued")
+            await asyncio.sleep(0)
+        finally:
+            self.scheduler.release()
+
+    def test_get_lane(self):
+        self.assertEqual(self.scheduler.get_lane(
+            rule_objects.AutomationRule("1", group="security")), "critical")
+        self.assertEqual(self.scheduler.get_lane(
+            rule_objects.AutomationRule("2", group="logging", priority="critical")), "critical")
+        self.assertEqual(self.scheduler.get_lane(
+            rule_objects.AutomationRule("3", group="other")), "normal")
+
+    def test_lanes_are_weighted(self):
+        async def _async_run_all():
+            runs = [self._async_run("first", "bulk")]
+            runs += [self._async_run("bulk{}".format(i), "bulk") for i in range(3)]
+            runs += [self._async_run("critical{}".format(i), "critical") for i in range(6)]
+            await asyncio.gather(*runs)
+        self.loop.run_until_complete(_async_run_all())
+
+        print(self.order)
+        # The first run takes the free worker, then 4 critical runs for each bulk run
+        self.assertEqual(self.order, [
+            "first", "critical0", "critical1", "critical2", "critical3",
+            "bulk0", "critical4", "critical5", "bulk1", "bulk2"])
+        lanes = self.scheduler.stats["lanes"]
+        self.assertEqual(lanes["critical"]["dispatched"], 6)
+        self.assertEqual(lanes["critical"]["queued"], 6)
+        self.assertEqual(lanes["bulk"]["waiting"], 0)
+        self.assertEqual(self.scheduler.stats["busy"], 0)
+
+    def test_delay_frees_the_worker(self):
+        async def _async_run_all():
+            await asyncio.gather(
+                self._async_run("delayed", "normal", delay_secs=0.01),
+                self._async_run("other", "normal"))
+        self.loop.run_until_complete(_async_run_all())
+
+        self.assertEqual(self.order, ["delayed", "other", "delayed continued"])
+        self.assertEqual(self.scheduler.stats["busy"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
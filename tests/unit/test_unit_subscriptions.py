@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+import asyncio
+import json
+import os
+import unittest
+
+from ottoengine import config, engine, enginelog, persistence, subscriptions, websocket_protocol
+from ottoengine.fibers import clock, hass_websocket_reader
+from ottoengine.testing import test_websocket, websocket_helpers
+
+TEST_PORT = 18123
+
+
+class MockWebSocketClient():
+    '''Answers every subscription command right away, using the message id as the ID'''
+
+    def __init__(self, answer: bool = True):
+        self.commands = []
+        self.pending = []   # (id, future) of the commands not answered yet
+        self._answer = answer
+        self._id = 0
+
+    def answer_pending(self):
+        for command_id, future in self.pending:
+            future.set_result({"id": command_id, "type": "result", "success": True})
+        self.pending = []
+
+    def _command(self, command):
+        self._id += 1
+        self.commands.append(command)
+        future = asyncio.get_event_loop().create_future()
+        if self._answer:
+            future.set_result({"id": self._id, "type": "result", "success": True, "result": None})
+        else:
+            self.pending.append((self._id, future))
+        return future
+
+    async def async_subscribe_trigger(self, trigger):
+        return self._command(("subscribe_trigger", trigger["entity_id"]))
+
+    async def async_subscribe_events(self, event_type):
+        return self._command(("subscribe_events", event_type))
+
+    async def async_unsubscribe_events(self, subscription_id):
+        return self._command(("unsubscribe_events", subscription_id))
+
+
+class TestSubscriptions(unittest.TestCase):
+
+    def setUp(self):
+        print()
+        self.loop = asyncio.get_event_loop()
+
+    def test_incremental_sync(self):
+        websocket = MockWebSocketClient()
+        manager = subscriptions.SubscriptionManager(websocket)
+
+        self.loop.run_until_complete(
+            manager.async_sync({"light.a", "light.b"}, {"timer_ended"}))
+        self.assertEqual(websocket.commands, [
+            ("subscribe_trigger", "light.a"),
+            ("subscribe_trigger", "light.b"),
+            ("subscribe_events", "timer_ended")])
+
+        print("Only the changes are sent on the next sync")
+        websocket.commands = []
+        self.loop.run_until_complete(manager.async_sync({"light.b", "light.c"}, set()))
+        self.assertEqual(sorted(websocket.commands), [
+            ("subscribe_trigger", "light.c"),
+            ("unsubscribe_events", 1),
+            ("unsubscribe_events", 3)])
+        self.assertEqual(manager.stats["entities"], 2)
+        self.assertEqual(manager.stats["event_types"], 0)
+
+    def test_reload_does_not_wait_for_sync(self):
+        config_obj = config.EngineConfig()
+        config_obj.json_rules_dir = os.path.join(os.path.dirname(__file__), "../json_test_rules")
+        engine_obj = engine.OttoEngine(
+            config_obj, self.loop, clock.EngineClock(config_obj.tz, self.loop),
+            persistence.PersistenceManager(config_obj.json_rules_dir), enginelog.EngineLog())
+        websocket = MockWebSocketClient(answer=False)
+        engine_obj._subscriptions = subscriptions.SubscriptionManager(websocket)
+
+        print("The reload replies while the subscription results are outstanding")
+        self.assertEqual(
+            self.loop.run_until_complete(engine_obj._async_reload_rules()), {"success": True})
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertGreater(len(websocket.pending), 0)
+        self.assertEqual(engine_obj._subscriptions.stats["subscribed"], 0)
+
+        print("A second reload waits for the first sync, so nothing is subscribed twice")
+        self.loop.run_until_complete(engine_obj._async_reload_rules())
+        sent = len(websocket.commands)
+        websocket.answer_pending()
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(len(websocket.commands), sent)
+        self.assertEqual(engine_obj._subscriptions.stats["subscribed"], sent)
+        self.assertEqual(engine_obj._subscriptions.stats["entities"],
+                         len(engine_obj.relevance.entity_ids))
+
+    def test_trigger_event_updates_state(self):
+        config_obj = config.EngineConfig()
+        engine_obj = engine.OttoEngine(
+            config_obj, self.loop, clock.EngineClock(config_obj.tz, self.loop),
+            persistence.PersistenceManager(config_obj.json_rules_dir), enginelog.EngineLog())
+        rule = engine_obj._persistence_mgr.load_rule_from_file(os.path.join(
+            os.path.dirname(__file__), "../json_test_rules", "rule_condition.json"))
+        self.loop.run_until_complete(engine_obj._async_load_rule(rule))
+
+        processed = []
+        engine_obj.process_event = lambda event: processed.append(event)
+
+        msg = websocket_helpers.event_state_trigger(5, "input_boolean.test", "off", "on")
+        self.loop.run_until_complete(
+            hass_websocket_reader._process_event_response(engine_obj, msg))
+
+        self.assertEqual(len(processed), 1)
+        self.assertEqual(processed[0].entity_id, "input_boolean.test")
+        self.assertEqual(processed[0].old_state_obj.state, "off")
+        self.assertEqual(processed[0].new_state_obj.state, "on")
+
+    def test_server_sends_subscribed_triggers(self):
+        server = test_websocket.TestWebSocketServer(TEST_PORT)
+
+        async def _async_test():
+            await server.async_run()
+            url = "ws://{}:{}".format(test_websocket.HOST, TEST_PORT)
+            subscriber = await websocket_protocol.async_connect(url)
+            sender = await websocket_protocol.async_connect(url)
+
+            await subscriber.send(json.dumps({
+                "id": 7, "type": "subscribe_trigger",
+                "trigger": {"platform": "state", "entity_id": "light.a"}}))
+            result = json.loads(await subscriber.recv())
+            self.assertEqual(result["id"], 7)
+            self.assertTrue(result["success"])
+
+            for entity_id in ["light.b", "light.a"]:
+                await sender.send(json.dumps(
+                    websocket_helpers.event_state_changed(1, entity_id, "off", "on")))
+
+            print("Only the subscribed entity is sent, as a trigger event")
+            event = json.loads(await subscriber.recv())
+            self.assertEqual(event["id"], 7)
+            trigger = event["event"]["variables"]["trigger"]
+            self.assertEqual(trigger["entity_id"], "light.a")
+            self.assertEqual(trigger["to_state"]["state"], "on")
+
+            await subscriber.close()
+            await sender.close()
+
+        self.loop.run_until_complete(_async_test())
+
+
+if __name__ == "__main__":
+    unittest.main()
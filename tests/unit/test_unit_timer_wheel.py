@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import asyncio
+import unittest
+
+from ottoengine import timer_wheel
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def setUp(self):
+        print()
+        self.loop = asyncio.get_event_loop()
+        self.wheel = timer_wheel.TimerWheel(self.loop, tick_secs=0.001)
+        self.fired = []
+
+    def _run_for(self, secs):
+        self.loop.run_until_complete(asyncio.sleep(secs))
+
+    def test_timers_fire_in_order(self):
+        start = self.loop.time()
+        # Across level 0 (64ms) and level 1 (4s) slots
+        for delay in [0.15, 0.005, 0.07, 0.02, 0.1]:
+            self.wheel.call_later(
+                delay, lambda d: self.fired.append((d, self.loop.time() - start)), delay)
+        self.assertEqual(self.wheel.stats["pending"], 5)
+        self._run_for(0.25)
+
+        print(self.fired)
+        self.assertEqual([d for d, elapsed in self.fired], [0.005, 0.02, 0.07, 0.1, 0.15])
+        for delay, elapsed in self.fired:
+            self.assertGreaterEqual(elapsed, delay - 0.001)
+        self.assertEqual(self.wheel.stats["pending"], 0)
+        self.assertEqual(self.wheel.stats["fired"], 5)
+        # Woken for the timers to fire, not for every tick
+        self.assertLess(self.wheel.stats["wakeups"], 20)
+
+    def test_cancel(self):
+        timers = [self.wheel.call_later(0.01, self.fired.append, i) for i in range(1000)]
+        for timer in timers[1:]:
+            timer.cancel()
+        self.assertEqual(self.wheel.stats["pending"], 1)
+        self._run_for(0.03)
+        self.assertEqual(self.fired, [0])
+        self.assertEqual(self.wheel.stats["cancelled"], 999)
+
+    def test_async_sleep(self):
+        async def _async_sleep_all():
+            sleeper = asyncio.ensure_future(self.wheel.async_sleep(10))
+            await asyncio.gather(*[self.wheel.async_sleep(0.01) for i in range(10)])
+            self.assertEqual(self.wheel.stats["pending"], 1)
+            sleeper.cancel()
+            await asyncio.sleep(0)
+        self.loop.run_until_complete(_async_sleep_all())
+        self.assertEqual(self.wheel.stats["pending"], 0)
+
+    def test_beyond_range(self):
+        wheel = timer_wheel.TimerWheel(self.loop, tick_secs=0.00001)
+        # The wheel's range is 64 ** 4 ticks, about 168 seconds at this resolution
+        wheel.call_later(200, self.fired.append, "far")
+        wheel.call_later(0.001, self.fired.append, "near")
+        self._run_for(0.01)
+        self.assertEqual(self.fired, ["near"])
+        self.assertEqual(wheel.stats["pending"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
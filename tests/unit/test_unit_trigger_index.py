@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import unittest
+
+from ottoengine import trigger_index
+from ottoengine.model import dataobjects, rule_objects, trigger_objects
+
+
+def _state_changed(entity_id, old_state, new_state):
+    return dataobjects.StateChangedEvent(
+        entity_id,
+        dataobjects.EntityState(entity_id, old_state, {}, None),
+        dataobjects.EntityState(entity_id, new_state, {}, None),
+        "2019-01-01T00:00:00+00:00")
+
+
+class TestTriggerIndex(unittest.TestCase):
+
+    def setUp(self):
+        print()
+        self.index = trigger_index.TriggerIndex()
+        self.listeners = []
+        triggers = [
+            trigger_objects.StateTrigger("light.a"),
+            trigger_objects.StateTrigger("light.a", to_state="on"),
+            trigger_objects.StateTrigger("light.a", to_state="on", from_state="off"),
+            trigger_objects.StateTrigger("light.a", from_state="on"),
+            trigger_objects.StateTrigger("light.a", to_state="off", from_state="on"),
+            trigger_objects.StateTrigger("light.b", to_state="on"),
+            trigger_objects.NumericStateTrigger("sensor.temp", above_value=20),
+            trigger_objects.EventTrigger("timer_ended", {"entity_id": "timer.a"}),
+        ]
+        for trigger in triggers:
+            listener = rule_objects.HassListener(None, trigger)
+            self.listeners.append(listener)
+            self.index.add(listener)
+
+    def _assert_same_as_eval(self, event):
+        expected = [l for l in self.listeners if l.trigger.eval_trigger(event)]
+        matched = self.index.match(event)
+        self.assertEqual(sorted(map(id, matched)), sorted(map(id, expected)))
+        return matched
+
+    def test_matches_eval_trigger(self):
+        events = [
+            _state_changed("light.a", "off", "on"),
+            _state_changed("light.a", "on", "off"),
+            _state_changed("light.a", "unavailable", "on"),
+            _state_changed("light.a", "on", "on"),
+            _state_changed("light.b", "off", "on"),
+            _state_changed("light.c", "off", "on"),
+            _state_changed("sensor.temp", 10, 25),
+            dataobjects.HassEvent("timer_ended", {"entity_id": "timer.a"}, None),
+            dataobjects.HassEvent("timer_ended", {"entity_id": "timer.b"}, None),
+        ]
+        for event in events:
+            self._assert_same_as_eval(event)
+
+        print("off -> on matches the any, to on, and off -> on triggers")
+        self.assertEqual(len(self.index.match(_state_changed("light.a", "off", "on"))), 3)
+
+    def test_clear(self):
+        self.index.clear()
+        self.assertEqual(self.index.match(_state_changed("light.a", "off", "on")), [])
+        self.assertEqual(self.index.stats["listeners"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
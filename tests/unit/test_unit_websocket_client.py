@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+import asyncio
+import unittest
+
+from ottoengine import hass_websocket_client
+from ottoengine.model import dataobjects
+
+
+class RecordingWebsocket(hass_websocket_client.AsyncHassWebsocket):
+    '''An AsyncHassWebsocket that records the messages it sends, instead of sending them'''
+
+    def __init__(self, **kwargs):
+        super().__init__("localhost", 8123, **kwargs)
+        self.sent = []
+
+    async def _async_send(self, message: dict):
+        self.sent.append(message)
+
+
+class TestWebsocketClient(unittest.TestCase):
+
+    def setUp(self):
+        print()
+        self.loop = asyncio.get_event_loop()
+
+    def test_response_resolves_future(self):
+        ws = RecordingWebsocket()
+        call = dataobjects.ServiceCall("light", "turn_on", {"entity_id": "light.kitchen"})
+        future = self.loop.run_until_complete(ws.async_call_service(call))
+
+        self.assertEqual(ws.sent[0]["type"], "call_service")
+        self.assertFalse(future.done())
+        self.assertEqual(ws.stats["inflight"], 1)
+
+        response = {"id": ws.sent[0]["id"], "type": "result", "success": True, "result": None}
+        ws.resolve_response(response)
+        self.assertIs(future.result(), response)
+        self.assertEqual(ws.stats["inflight"], 0)
+        self.assertEqual(ws.stats["responses"], 1)
+        self.assertIsNotNone(ws.stats["rtt_last_ms"])
+
+        print("Responses to unknown requests are ignored")
+        ws.resolve_response(response)
+        self.assertEqual(ws.stats["responses"], 1)
+
+    def test_request_timeout(self):
+        ws = RecordingWebsocket(request_timeout=0.01)
+        future = self.loop.run_until_complete(ws.async_get_all_state())
+        self.assertRaises(
+            asyncio.TimeoutError, self.loop.run_until_complete, future)
+        self.assertEqual(ws.stats["timeouts"], 1)
+        self.assertEqual(ws.stats["inflight"], 0)
+
+    def test_inflight_window(self):
+        ws = RecordingWebsocket(max_inflight=2)
+
+        async def _send_three():
+            futures = [await ws.async_send_command({"type": "ping"}) for i in range(2)]
+            third = asyncio.ensure_future(ws.async_send_command({"type": "ping"}))
+            await asyncio.sleep(0.01)
+            print("Third command should wait for a free slot in the window")
+            self.assertEqual(len(ws.sent), 2)
+            self.assertFalse(third.done())
+
+            ws.resolve_response({"id": ws.sent[0]["id"], "type": "pong"})
+            await asyncio.sleep(0.01)
+            self.assertEqual(len(ws.sent), 3)
+            self.assertTrue(third.done())
+            return futures
+
+        self.loop.run_until_complete(_send_three())
+
+    def test_close_fails_pending(self):
+
+        class _Writer:
+            def close(self):
+                pass
+
+        class _Socket:
+            writer = _Writer()
+
+        ws = RecordingWebsocket()
+        ws._socket = _Socket()
+        future = self.loop.run_until_complete(ws.async_subscribe_events("state_changed"))
+        self.loop.run_until_complete(ws.async_close(force=True))
+        self.assertRaises(
+            hass_websocket_client.WebSocketError, self.loop.run_until_complete, future)
+        self.assertEqual(ws.stats["inflight"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+import asyncio
+import json
+import os
+import unittest
+
+from ottoengine import hass_websocket_client, websocket_protocol
+from ottoengine.testing import test_websocket
+
+TEST_PORT = 18124
+PAYLOAD_FILE = os.path.join(
+    os.path.dirname(__file__), "../../benchmarks/payloads/get_states.json")
+
+
+class TestWebsocketProtocol(unittest.TestCase):
+
+    def setUp(self):
+        print()
+        self.loop = asyncio.get_event_loop()
+        with open(PAYLOAD_FILE) as f:
+            self.payload = f.read()
+
+    def test_deflate_round_trip(self):
+        for params in [{}, {"client_no_context_takeover": None, "server_max_window_bits": "10"}]:
+            client = websocket_protocol.PerMessageDeflate(params, is_server=False)
+            server = websocket_protocol.PerMessageDeflate(params, is_server=True)
+            data = self.payload.encode()
+            for i in range(3):
+                compressed = client.compress(data)
+                self.assertLess(len(compressed), len(data))
+                self.assertEqual(server.decompress(compressed), data)
+                compressed = server.compress(data)
+                self.assertEqual(client.decompress(compressed), data)
+
+    def test_window_bits_are_honored(self):
+        """zlib can't compress with an 8 bit window, so the offer is declined, never widened"""
+        self.assertRaises(
+            websocket_protocol.ProtocolError, websocket_protocol.PerMessageDeflate,
+            {"server_max_window_bits": "8"}, is_server=True)
+        # Only our own compressor's window matters
+        websocket_protocol.PerMessageDeflate({"server_max_window_bits": "8"}, is_server=False)
+
+        async def _async_accept(offer):
+            reader = asyncio.StreamReader()
+            reader.feed_data((
+                "GET / HTTP/1.1\r\nUpgrade: websocket\r\nSec-WebSocket-Key: a2V5\r\n"
+                "Sec-WebSocket-Extensions: {}\r\n\r\n").format(offer).encode())
+            writer = _FakeWriter()
+            deflate = await websocket_protocol._async_accept(reader, writer, True)
+            return deflate, b"".join(writer.written).decode()
+
+        deflate, response = self.loop.run_until_complete(_async_accept(
+            "permessage-deflate; server_max_window_bits=8"))
+        self.assertIsNone(deflate)
+        self.assertNotIn("Sec-WebSocket-Extensions", response)
+
+        print("The next offer is accepted")
+        deflate, response = self.loop.run_until_complete(_async_accept(
+            "permessage-deflate; server_max_window_bits=8, "
+            "permessage-deflate; server_max_window_bits=10"))
+        self.assertIsNotNone(deflate)
+        self.assertIn("Sec-WebSocket-Extensions: permessage-deflate; server_max_window_bits=10",
+                      response)
+
+    def test_send_drains(self):
+        writer = _FakeWriter()
+        websocket = websocket_protocol.WebsocketConnection(None, writer, is_client=True)
+        self.loop.run_until_complete(websocket.send("text"))
+        self.loop.run_until_complete(websocket.send(b"binary"))
+        self.assertEqual(writer.drained, 2)
+
+        print("A lost connection fails the send")
+        writer = _FakeWriter(lost=True)
+        websocket = websocket_protocol.WebsocketConnection(None, writer, is_client=True)
+        with self.assertRaises(ConnectionError):
+            self.loop.run_until_complete(websocket.send("text"))
+        self.assertTrue(writer.closed)
+
+    def test_apply_mask(self):
+        payload = os.urandom(1001)
+        mask = os.urandom(4)
+        expected = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        self.assertEqual(websocket_protocol._apply_mask(payload, mask), expected)
+        self.assertEqual(websocket_protocol._apply_mask(b"", mask), b"")
+
+    def test_echo_server(self):
+        async def _echo(websocket):
+            while True:
+                message = await websocket.recv()
+                if message is None:
+                    break
+                await websocket.send(message)
+
+        async def _async_test(port, compress):
+            server = await websocket_protocol.async_start_server(_echo, "127.0.0.1", port)
+            url = "ws://127.0.0.1:{}/api/websocket".format(port)
+            websocket = await websocket_protocol.async_connect(url, compress=compress)
+            self.assertEqual(websocket.compressed, compress)
+
+            for message in [self.payload, "short", b"\x00\x01binary" * 100]:
+                await websocket.send(message)
+                self.assertEqual(await websocket.recv(), message)
+
+            await websocket.close()
+            server.close()
+            return websocket.stats
+
+        print("Compressed connection")
+        stats = self.loop.run_until_complete(_async_test(TEST_PORT, True))
+        self.assertTrue(stats["compression"])
+        self.assertGreater(stats["compression_ratio_in"], 2)
+        self.assertGreater(stats["compression_ratio_out"], 2)
+        self.assertGreater(stats["bytes_in_raw"], stats["bytes_in"])
+
+        print("Uncompressed connection")
+        stats = self.loop.run_until_complete(_async_test(TEST_PORT + 1, False))
+        self.assertFalse(stats["compression"])
+        self.assertEqual(stats["bytes_in_raw"], stats["bytes_in"])
+
+    def test_hass_websocket_with_test_server(self):
+        server = test_websocket.TestWebSocketServer(TEST_PORT + 2)
+
+        async def _async_test():
+            await server.async_run()
+            websocket = hass_websocket_client.AsyncHassWebsocket("127.0.0.1", TEST_PORT + 2)
+            self.assertTrue(await websocket.async_connect())
+
+            future = await websocket.async_get_all_state()
+            response = json.loads(await websocket.async_receive())
+            websocket.resolve_response(response)
+            self.assertTrue((await future)["success"])
+            await websocket.async_close()
+            return websocket.stats
+
+        stats = self.loop.run_until_complete(_async_test())
+        self.assertTrue(stats["compression"])
+        self.assertGreater(stats["bytes_out"], 0)
+        self.assertGreater(stats["bytes_in"], 0)
+
+
+class _FakeWriter(object):
+    def __init__(self, lost: bool = False):
+        self.written = []
+        self.drained = 0
+        self.closed = False
+        self._lost = lost
+
+    def write(self, data):
+        self.written.append(data)
+
+    async def drain(self):
+        if self._lost:
+            raise ConnectionResetError("Connection lost")
+        self.drained += 1
+
+    def close(self):
+        self.closed = True
+
+
+if __name__ == "__main__":
+    unittest.main()